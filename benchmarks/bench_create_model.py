@@ -0,0 +1,49 @@
+"""
+Time building a large draft GENRE with one batched reaction addition
+(`create_model`) against adding each reaction to the model separately, as it
+did before.
+
+    python benchmarks/bench_create_model.py [number of reactions]
+
+The draft is made of the first non-exchange reactions of the universal model
+(3500 by default). Nothing is asserted; the timings are only printed.
+"""
+
+import sys
+import time
+
+import cobra
+
+from reconstructor._funcs import create_model
+from reconstructor import resources
+
+
+def create_model_per_reaction(rxn_db, universal, input_id):
+    new_model = cobra.Model(input_id)
+    for x in rxn_db:
+        new_model.add_reactions([universal.reactions.get_by_id(x).copy()])
+        new_model.reactions.get_by_id(x).gene_reaction_rule = ' or '.join(rxn_db[x])
+    return new_model
+
+
+def main(size=3500):
+    print('Loading the universal model...')
+    universal = resources.get_universal_model()
+    rxn_ids = [r.id for r in universal.reactions if not r.id.startswith('EX_')][:size]
+    rxn_db = {rxn_id: [f'org:gene{i}', f'org:gene{i + 1}'] for i, rxn_id in enumerate(rxn_ids)}
+    print(f'Draft of {len(rxn_ids)} reactions')
+
+    start = time.perf_counter()
+    create_model_per_reaction(rxn_db, universal, 'single')
+    before = time.perf_counter() - start
+
+    start = time.perf_counter()
+    create_model(rxn_db, universal, 'bulk')
+    after = time.perf_counter() - start
+
+    print(f'Per reaction: {before:.2f} s')
+    print(f'Batched:      {after:.2f} s ({before / after:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
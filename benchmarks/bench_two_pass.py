@@ -0,0 +1,46 @@
+"""
+Compare the wall time and hit recovery of a two-pass alignment (DIAMOND's
+default mode, then --more-sensitive for the queries without a hit) with a
+single --more-sensitive alignment.
+
+    python benchmarks/bench_two_pass.py [number of processors]
+
+The 488.146.clean.fa genome from the bundled test files is aligned against
+the KEGG DIAMOND database, so DIAMOND and the database have to be installed.
+Neither alignment uses the alignment cache. Nothing is asserted; the
+timings and recovery are only printed.
+"""
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import sys
+import time
+import zipfile
+
+from reconstructor._funcs import align_queries, two_pass_align
+from reconstructor import resources
+
+
+def main(processors='1'):
+    database = resources.get_diamond_db_path()
+    with TemporaryDirectory() as tmpdir:
+        with zipfile.ZipFile(resources.RESOURCE_DIR.joinpath('testfiles.zip')) as archive:
+            fasta = Path(archive.extract('488.146.clean.fa', tmpdir))
+
+        start = time.perf_counter()
+        single = align_queries(fasta, database, processors, ['--more-sensitive'])
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        two_pass = two_pass_align(fasta, database, processors, 'more-sensitive')
+        two_pass_time = time.perf_counter() - start
+
+    recovered = len(set(two_pass).intersection(single))
+    print(f'Single pass (more-sensitive): {single_time:.1f} s, {len(single)} queries hit')
+    print(f'Two-pass:                     {two_pass_time:.1f} s, {len(two_pass)} queries hit')
+    print(f'Two-pass recovers {recovered} of {len(single)} single-pass hits ({recovered / len(single):.1%})')
+    print(f'Speedup: {single_time / two_pass_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,6 +1,7 @@
 from reconstructor.build import (
-    reconstruct
+    reconstruct,
+    reconstruct_media_set,
+    AlignmentOptions,
+    GapfillOptions,
+    SolverOptions
 )
-
-
-reconstruct
\ No newline at end of file
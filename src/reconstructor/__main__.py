@@ -24,8 +24,10 @@ Options for Running Reconstructor
 ---------------------------------
 --input <input file, Required>
 --type <input file type, .fasta = 1, diamond blastp output = 2, .sbml = 3, Required, Default = 1> 
---gram <Type of Gram classificiation (positive or negative), default = positive>
+--gram <Type of Gram classificiation (positive, negative or auto to infer it while gap-filling), default = positive>
 --media <List of metabolites composing the media condition. Not required.>
+--media-set <comma separated media names or a file of named media to reconstruct a GENRE on each, default = none>
+--media-file <comma separated media files whose media can then be used by name in --media and --media-set, default = none>
 --tasks <List of metabolic tasks. Not required>
 --org <KEGG organism code. Not required>
 --min_frac <Minimum objective fraction required during gapfilling, default = 0.01>
@@ -34,32 +36,47 @@ Options for Running Reconstructor
 --name <ID of output GENRE, default = default>
 --cpu <Number of processors to use, default = 1>
 --test <run installation tests, default = no>
+--warmup <build the universal model snapshot, default = no>
+--batch <tab-separated manifest of genomes to reconstruct in one process, default = none>
+--workers <number of worker processes for --batch, default = 1>
+--pipeline <run --batch as a pipeline that aligns genomes while others are gap-filled, default = no>
+--align-jobs <number of DIAMOND alignments running at once with --pipeline, default = 1>
+--dedup <align the proteins of all --batch genomes together, aligning identical sequences once, default = no>
+--gapfill-engine <how gap-filling problems are solved (bag, persistent or matrix), default = bag>
+--prune-hops <only gap-fill with universal reactions within this many steps of the draft, default = 0 (no pruning)>
+--alignment-cache <reuse cached DIAMOND results for inputs that were already aligned, default = yes>
+--alignment-mode <single: align every protein with --sensitivity; two-pass: align with DIAMOND's fast default mode first and only realign proteins without a hit with --sensitivity, default = single>
+--sensitivity <DIAMOND sensitivity mode for single alignments and the second pass of two-pass alignments, default = more-sensitive>
+--subdb <name or comma separated KEGG organism prefixes of a DIAMOND sub-database to align against first, default = none>
+--build-subdb <build a named DIAMOND sub-database of the --subdb-orgs organisms and exit, default = none>
+--subdb-orgs <comma separated KEGG organism prefixes for --build-subdb>
+--diamond-memory <memory budget in GB that DIAMOND's --block-size and --index-chunks are sized from, default = none (DIAMOND defaults)>
+--stage-db <local directory (e.g. on tmpfs) to copy the DIAMOND database to once per node and align against, default = none>
+--build-index <build DIAMOND's precomputed seed index of the database for --sensitivity and exit, default = no>
+--draft-cache <cache the drafts built only from --org genes (--input_file none) per organism, default = yes>
+--save-blast <save the DIAMOND output of type 1 inputs to <input>KEGGprot.out, default = yes>
+--gapfill-memo <reuse the results of gap-filling problems that were already solved, default = yes>
+--solver <LP solver used for gap-filling (e.g. glpk, cplex or gurobi; the matrix engine always uses HiGHS), default = none (cobra's default)>
+--solver-threads <number of threads of the LP solver, default = none (solver default)>
+--lp-method <LP algorithm of the solver (e.g. simplex, interior, primal, dual or barrier), default = none (solver default)>
+--time-limit <time limit in seconds for gap-filling each genome, default = none>
+--manage-cache <show (info), prune or clear the alignment cache and gap-filling memo and exit, default = none>
 '''
 
 # Dependencies
-import os
-from pathlib import Path
 import argparse
-from multiprocessing import cpu_count
-from tempfile import TemporaryDirectory
-import zipfile
 
-import cobra
-
-from reconstructor._funcs import (
-    run_blast,
-    read_blast,
-    genes_to_rxns,
-    create_model,
-    add_names,
-    find_reactions,
-    gapfill_model,
-    set_base_inputs,
-    add_annotation,
-    check_model
-)
-from reconstructor.diamond import Diamond, download_diamond, DEFAULT_DIAMOND_VERSION
-from reconstructor import resources, errors
+from reconstructor.build import group_options, reconstruct, reconstruct_media_set, run_test_suite
+from reconstructor.batch import run_batch
+from reconstructor.pipeline import run_pipeline
+from reconstructor.diamond import DEFAULT_DIAMOND_VERSION, Diamond, get_index_path, stage_database
+from reconstructor.gapfill import GAPFILL_ENGINES
+from reconstructor.alignment_cache import AlignmentCache
+from reconstructor.media import load_media_file
+from reconstructor.memo import GapfillMemo
+from reconstructor.subdb import build_subdb
+from reconstructor._funcs import ALIGNMENT_MODES, SENSITIVITY_MODES, sensitivity_options
+from reconstructor import resources
 
 
 # User defined arguments
@@ -67,17 +84,48 @@ parser = argparse.ArgumentParser(description='Generate genome-scale metabolic ne
 parser.add_argument('--input_file', default='none')
 parser.add_argument('--file_type', default=1, help='Input file type: fasta=1, diamond blastp output=2, genre sbml=3')
 parser.add_argument('--media', default='rich', help='List of metabolites composing the media condition. Not required.')
+parser.add_argument('--media-set', default='none', help='comma separated media names or a tab-separated file of named media to reconstruct a GENRE on each')
+parser.add_argument('--media-file', default='none', help='comma separated media files whose media can then be used by name in --media and --media-set')
 parser.add_argument('--tasks', default=[], help='List of metabolic tasks. Not required.')
 parser.add_argument('--org', default='default', help='KEGG organism code. Not required.')
 parser.add_argument('--min_frac', default=0.01, help='Minimum objective fraction required during gapfilling')
 parser.add_argument('--max_frac', default=0.5, help='Maximum objective fraction allowed during gapfilling')
-parser.add_argument('--gram', default='none', help='Type of Gram classificiation (positive or negative)')
+parser.add_argument('--gram', default='none', help='Type of Gram classificiation (positive, negative or auto)')
 parser.add_argument('--out', default='default', help='Name of output GENRE file')
 parser.add_argument('--name', default='default', help='ID of output GENRE')
 parser.add_argument('--cpu', default=1, help='Number of processors to use')
 parser.add_argument('--gapfill', default='yes', help='gapfill your model?')
 parser.add_argument('--exchange', default = 1, help='open exchange: 1, shut down exchange: 0')
 parser.add_argument('--test', default = 'no', help='do you want to perform the test suite?')
+parser.add_argument('--warmup', default = 'no', help='build the universal model snapshot so later runs load it quickly?')
+parser.add_argument('--snapshot-solver', default = 'yes', help='include the prebuilt solver problem in the universal model snapshot?')
+parser.add_argument('--batch', default = 'none', help='tab-separated manifest of genomes to reconstruct in one process')
+parser.add_argument('--workers', default = 1, help='number of worker processes for --batch')
+parser.add_argument('--pipeline', default = 'no', help='run --batch as a pipeline that overlaps alignment with gap-filling?')
+parser.add_argument('--align-jobs', default = 1, help='number of DIAMOND alignments running at once with --pipeline')
+parser.add_argument('--dedup', default = 'no', help='align the proteins of all --batch genomes together, aligning identical sequences once?')
+parser.add_argument('--gapfill-engine', default = 'bag', choices = GAPFILL_ENGINES, help='how gap-filling problems are solved')
+parser.add_argument('--prune-hops', default = 0, help='only gap-fill with universal reactions within this many steps of the draft (0 = no pruning)')
+parser.add_argument('--prune-blocked', default = 'no', help='also prune universal reactions that are blocked under the media?')
+parser.add_argument('--prune-verify', default = 'no', help='check pruned gap-filling results against the full solve?')
+parser.add_argument('--alignment-cache', default = 'yes', help='reuse cached DIAMOND results for inputs that were already aligned?')
+parser.add_argument('--alignment-mode', default = 'single', choices = ALIGNMENT_MODES, help='align every protein with --sensitivity (single) or only realign proteins without a hit in a fast first pass (two-pass)')
+parser.add_argument('--sensitivity', default = 'more-sensitive', choices = SENSITIVITY_MODES, help='DIAMOND sensitivity mode')
+parser.add_argument('--subdb', default = 'none', help='name or comma separated KEGG organism prefixes of a DIAMOND sub-database to align against before the full database')
+parser.add_argument('--build-subdb', default = 'none', help='build a DIAMOND sub-database with this name from --subdb-orgs and exit')
+parser.add_argument('--subdb-orgs', default = 'none', help='comma separated KEGG organism prefixes for --build-subdb')
+parser.add_argument('--diamond-memory', default = 'none', help='memory budget in GB used to size the DIAMOND block size and index chunks')
+parser.add_argument('--stage-db', default = 'none', help='local directory (e.g. on tmpfs) to copy the DIAMOND database to once per node')
+parser.add_argument('--build-index', default = 'no', help="build DIAMOND's precomputed seed index of the database and exit?")
+parser.add_argument('--draft-cache', default = 'yes', help='cache the drafts built only from the genes of --org (with --input_file none)?')
+parser.add_argument('--save-blast', default = 'yes', help='save the DIAMOND output of type 1 inputs to a file? (otherwise it is only parsed as it streams in)')
+parser.add_argument('--gapfill-memo', default = 'yes', help='reuse the results of gap-filling problems that were already solved?')
+parser.add_argument('--solver', default = 'none', help='LP solver used for gap-filling (e.g. glpk, cplex or gurobi; the matrix engine always uses HiGHS)')
+parser.add_argument('--solver-threads', default = 'none', help='number of threads of the LP solver')
+parser.add_argument('--lp-method', default = 'none', help='LP algorithm of the solver (e.g. simplex, interior, primal, dual or barrier)')
+parser.add_argument('--time-limit', default = 'none', help='time limit in seconds for gap-filling each genome')
+parser.add_argument('--manage-cache', default = 'none', choices = ['none', 'info', 'prune', 'clear'], help='show, prune or clear the alignment cache and gap-filling memo and exit')
+parser.add_argument('--cache-max-size', default = None, help='maximum size of the alignment cache in GB (used with --manage-cache prune)')
 
 # Diamond download options (only used when running the test suite)
 group = parser.add_mutually_exclusive_group(required=False)
@@ -95,245 +143,122 @@ group.add_argument(
     help="Skip downloading a DIAMOND binary if running the test suite"
 )
 
-args = parser.parse_args()
-
 
-
-#----------------------------------------------------------------------------------------------------------------------#
-if __name__ == "__main__":
-    # Process input settings
-    input_file = str(args.input_file)
-    out_file = str(args.out)
-    file_type = int(args.file_type)
-    name = str(args.name)
-    org = str(args.org)
-    if args.media in ["default", "default_media", "rich", "minimal"]:
-        media = str(args.media)
-    else:
-        media = str(args.media).split(",")
-    min_frac = float(args.min_frac)
-    max_frac = float(args.max_frac)
-    metabolic_tasks = list(args.tasks)
-    new_id = str(args.name)
-    gram_type = str(args.gram)
-    processors = int(args.cpu)
-    gapfill = str(args.gapfill)
-    exchange_arg = int(args.exchange)
-    test = str(args.test)
+def main(argv=None):
+    args = parser.parse_args(argv)
 
     #----------------------------------------------------------------------------------------------------------------------#
-    if test == 'yes':
-
-        # Download a diamond binary if needed
-        if args.diamond is not None:
-            print(f"Getting DIAMOND v{args.diamond} from https://github.com/bbuchfink/diamond/releases")
-            download_diamond(diamond_version=args.diamond)
-        if not args.skip_diamond:
-            try:
-                diamond = Diamond()
-            except errors.DiamondNotFoundError:
-                print("DIAMOND not found...getting DIAMOND from https://github.com/bbuchfink/diamond/releases")
-                download_diamond()
-                diamond = Diamond()
-            finally:
-                print(f"Using DIAMOND v{diamond.get_version()} at {diamond.path}")
-
-        # Download the diamond database file if it hasn't been downloaded yet
-        diamond_db_path = resources.get_diamond_db_path()
-        if not diamond_db_path.exists():
-            print("Downloading the DIAMOND database for blasting...")
-            resources.download_diamond_db()
-            print("Done")
-
-        # Run the three tests (each with a different input file)
-        # - 488.146.clean.fa: an amino acid .fasta file used to test a type 1 input to reconstructor
-        # - JCP8151B.KEGGprot.out: a blast output file used to test a type 2 input to reconstructor
-        # - fmt.metaG.01044A.bin.149.KEGGprot.sbml: a .sbml genre used to test a type three input to reconstructor
-        test_file_names = ["488.146.clean.fa", "JCP8151B.KEGGprot.out", "fmt.metaG.01044A.bin.149.KEGGprot.sbml"]
-        input_types = [1, 2, 3]
-        test_num = 0
-        for test_file_name, input_type in zip(test_file_names, input_types):
-            test_num += 1
-            print(f"Performing test {test_num}")
-            
-            # Temporary directory to hold test files (and clean them up after test finishes)
-            with TemporaryDirectory(dir=resources.RESOURCE_DIR) as tempdir:
-
-                # Extract the test file
-                with zipfile.ZipFile(resources.RESOURCE_DIR.joinpath("testfiles.zip")) as archive:
-                    test_file = archive.extract(test_file_name, tempdir)
-
-                # Run reconstructor
-                output_file = Path(test_file).with_suffix(".out.sbml")
-                cmd = f"python -m reconstructor --input_file {test_file} --file_type {input_type} --out {output_file} --gram negative --cpu {processors}"
-                print(cmd)
-                exitcode = os.system(cmd)
-                if exitcode != 0:
-                    raise errors.ReconstructorError(f"Test {test_num} failed with an error")
-
-        quit()
+    if str(args.test) == 'yes':
+        run_test_suite(cpu=int(args.cpu), diamond_version=args.diamond, skip_diamond=args.skip_diamond)
+        return
+    #----------------------------------------------------------------------------------------------------------------------#
+    if str(args.warmup) == 'yes':
+        print('Building universal model snapshot from', resources.RESOURCE_DIR.joinpath('universal.sbml.gz'))
+        snapshot_path = resources.build_universal_snapshot(include_solver=(str(args.snapshot_solver) == 'yes'))
+        print('Universal model snapshot saved to', snapshot_path)
+        return
+    #----------------------------------------------------------------------------------------------------------------------#
+    if str(args.manage_cache) != 'none':
+        manage_alignment_cache(str(args.manage_cache), args.cache_max_size)
+        manage_gapfill_memo(str(args.manage_cache))
+        return
+    #----------------------------------------------------------------------------------------------------------------------#
+    if str(args.build_index) == 'yes':
+        database = resources.get_diamond_db_path()
+        print('Building the DIAMOND seed index of', database)
+        Diamond().makeidx(database, *sensitivity_options(str(args.sensitivity)))
+        print('Seed index saved to', get_index_path(database))
+        if str(args.stage_db) != 'none':
+            stage_database(database, str(args.stage_db))
+        return
+    #----------------------------------------------------------------------------------------------------------------------#
+    if str(args.build_subdb) != 'none':
+        if str(args.subdb_orgs) == 'none':
+            parser.error('--build-subdb needs --subdb-orgs')
+        build_subdb(str(args.subdb_orgs), name=str(args.build_subdb))
+        return
     #----------------------------------------------------------------------------------------------------------------------#
 
-    if gram_type == 'positive':
-        print('\nUsing Gram positive objective function')
-        universal_obj = 'biomass_GmPos'
-    elif gram_type == 'negative':
-        print('\nUsing Gram negative objective function')
-        universal_obj = 'biomass_GmNeg'
-    else:
-        universal_obj = 'biomass'
-
-    if min_frac <= 0.0 or min_frac > 1.0:
-        print('WARNING: Improper minimum fraction selected. Defaulting to 0.01')
-        min_frac = 0.01
-    if max_frac <= 0.0 or max_frac > 1.0:
-        print('WARNING: Improper maximum fraction selected. Defaulting to 0.5')
-        max_frac = 0.5
-    if max_frac < min_frac:
-        print('WARNING: Input maximum fraction less than minimum fraction. Minimum set to half maximum')
-        min_frac = max_frac * 0.5
-
-    if org != 'default':
-        print('Including additional genes from KEGG genome of', org)
-
-    # Maximum fraction should not be too high, otherwise the gapfiller adds too many reactions
-    print('Using minimum objective flux fraction of', min_frac,'and maximum fraction of', max_frac)
-
-    if processors > cpu_count():
-        print('WARNING: Requested more processors than are available. Using maximum of', cpu_count())
-        processors = cpu_count()
-    print('Using', processors, 'processor(s)\n')
-
-
-    # Load databases
-    print('Loading GENRE construction databases...')
-    kegg_prot_db = resources.get_diamond_db_path()
-    print('\r[                                         ]', end='', flush=True)
-    gene_modelseed = resources.get_gene_mseed_map()
-    print('\r[---------------                          ]', end='', flush=True)
-    universal = resources.get_universal_model()
-    print('\r[------------------------------           ]', end='', flush=True)
-    gene_names = resources.get_gene_name_map()
-    print('\r[-----------------------------------------]')
-
-    # Check input file type
-    if file_type == 1:
-        print('Aligning peptide sequences to KEGG database, may take some time...')
-        blast_results = input_file.rstrip('fastn') + 'KEGGprot.out'
-        print('Blast results will be saved to', blast_results,'\n')
-        run_blast(input_file, blast_results, kegg_prot_db, str(processors))
-    elif file_type == 2:
-        blast_results = input_file
-    else:
-        try:
-            draft_genre = cobra.io.read_sbml_model(input_file)
-        except:
-            draft_genre = cobra.io.load_json_model(input_file)
-
-
-    # Handle gap-filling if that's all that is needed
-    if file_type != 3:
-        if blast_results != 'none':
-            print('Creating draft GENRE from BLAST results...')
-            gene_hits = read_blast(blast_results)
-        else: 
-            gene_hits = set()
-        rxns = genes_to_rxns(gene_hits, gene_modelseed, org)
-        draft_genre = create_model(rxns, universal, new_id)
-        draft_genre = add_names(draft_genre, gene_names)
+    if str(args.media_file) != 'none':
+        for path in str(args.media_file).split(','):
+            print('Loaded media', ', '.join(load_media_file(path)), 'from', path)
+
+    options = dict(
+        file_type=args.file_type,
+        media=args.media,
+        tasks=args.tasks,
+        org=args.org,
+        min_frac=args.min_frac,
+        max_frac=args.max_frac,
+        gram=args.gram,
+        out=args.out,
+        name=args.name,
+        cpu=args.cpu,
+        gapfill=args.gapfill,
+        exchange=args.exchange,
+        gapfill_engine=args.gapfill_engine,
+        prune_hops=args.prune_hops,
+        prune_blocked=args.prune_blocked,
+        prune_verify=args.prune_verify,
+        alignment_cache=args.alignment_cache,
+        save_blast=args.save_blast,
+        alignment_mode=args.alignment_mode,
+        sensitivity=args.sensitivity,
+        subdb=args.subdb,
+        diamond_memory=args.diamond_memory,
+        stage_db=args.stage_db,
+        draft_cache=args.draft_cache,
+        gapfill_memo=args.gapfill_memo,
+        solver=args.solver,
+        solver_threads=args.solver_threads,
+        lp_method=args.lp_method,
+        time_limit=args.time_limit
+    )
+
+    if str(args.batch) != 'none':
+        if str(args.media_set) != 'none':
+            parser.error('--media-set cannot be used with --batch')
+        # Per-genome output names come from the manifest
+        options.pop('out')
+        options.pop('name')
+        if str(args.pipeline) == 'yes':
+            if str(args.dedup) == 'yes':
+                parser.error('--dedup cannot be used with --pipeline')
+            results = run_pipeline(args.batch, align_jobs=int(args.align_jobs), workers=int(args.workers), **options)
+        else:
+            results = run_batch(args.batch, workers=int(args.workers), dedup=(str(args.dedup) == 'yes'), **options)
+        if not all(result.ok for result in results):
+            raise SystemExit(1)
+    elif str(args.media_set) != 'none':
+        reconstruct_media_set(args.input_file, args.media_set, **group_options(options))
     else:
-        universal_obj = str(draft_genre.objective.expression).split()[0].split('*')[-1]
+        reconstruct(args.input_file, **group_options(options))
 
-    # Handle media conditions
-    if media == 'rich':
-        media = ['cpd00001_e','cpd00035_e','cpd00041_e','cpd00023_e','cpd00119_e','cpd00107_e','cpd00060_e','cpd00161_e','cpd00069_e','cpd00084_e','cpd00033_e',
-    'cpd00322_e','cpd00066_e','cpd00054_e','cpd00065_e','cpd00156_e','cpd00220_e','cpd00644_e','cpd00393_e','cpd00133_e','cpd00263_e','cpd00104_e','cpd00149_e',
-    'cpd00971_e','cpd00099_e','cpd00205_e','cpd00009_e','cpd00063_e','cpd00254_e','cpd10515_e','cpd00030_e','cpd00242_e','cpd00226_e','cpd01242_e','cpd00307_e',
-    'cpd00092_e','cpd00117_e','cpd00067_e','cpd00567_e','cpd00132_e','cpd00210_e','cpd00320_e','cpd03279_e','cpd00246_e','cpd00311_e','cpd00367_e','cpd00277_e',
-    'cpd00182_e','cpd00654_e','cpd00412_e','cpd00438_e','cpd00274_e','cpd00186_e','cpd00637_e','cpd00105_e','cpd00305_e','cpd00309_e','cpd00098_e','cpd00207_e',
-    'cpd00082_e','cpd00129_e']
-    elif media == 'minimal':
-        media = ['cpd00001_e','cpd00065_e','cpd00060_e','cpd00322_e','cpd00129_e','cpd00156_e','cpd00107_e','cpd00084_e', 
-    'cpd00149_e','cpd00099_e','cpd10515_e','cpd00030_e','cpd00254_e','cpd00063_e','cpd00205_e','cpd00009_e','cpd00971_e','cpd00242_e',
-    'cpd00104_e','cpd00644_e','cpd00263_e','cpd00082_e']
-    elif media == 'default' or media == "default_media":
-        media = ['cpd00035_e','cpd00051_e','cpd00132_e','cpd00041_e','cpd00084_e','cpd00053_e','cpd00023_e',
-    'cpd00033_e','cpd00119_e','cpd00322_e','cpd00107_e','cpd00039_e','cpd00060_e','cpd00066_e','cpd00129_e',
-    'cpd00054_e','cpd00161_e','cpd00065_e','cpd00069_e','cpd00156_e','cpd00027_e','cpd00149_e','cpd00030_e',
-    'cpd00254_e','cpd00971_e','cpd00063_e','cpd10515_e','cpd00205_e','cpd00099_e']
-    else:
-        media = media
-    
-    # Set media condition
-    if len(media) != 0:
-        media_condition = set(['EX_' + cpd for cpd in media])
-        universal_reactions = set([x.id for x in universal.reactions])
-        for rxn in universal_reactions:
-            if rxn.startswith('EX_') == True:
-                universal.reactions.get_by_id(rxn).bounds = (0, 1000.0)
-            if rxn in media_condition:
-                universal.reactions.get_by_id(rxn).bounds = (-1000.0, 10000)
 
-    # Gapfill new model
-    if gapfill == 'yes':
-        if file_type != 3:
-            print('Identifying new metabolism (Step 1 of 2)...')
-        if file_type == 3:
-            print('Identifying new metabolism...')
-        draft_reactions = set([x.id for x in draft_genre.reactions])
-        draft_metabolites = set([x.id for x in draft_genre.metabolites])
-        new_reactions = find_reactions(draft_genre, universal, metabolic_tasks, universal_obj, min_frac, max_frac, 1, file_type)
-        print(new_reactions)
-        filled_genre = gapfill_model(draft_genre, universal, new_reactions, universal_obj, 1)
-        if file_type != 3:
-            print('Identifying new metabolism (Step 2 of 2)...')
-            filled_genre = set_base_inputs(filled_genre, universal)
-            media_reactions = find_reactions(filled_genre, universal, metabolic_tasks, universal_obj, min_frac, max_frac, 2, file_type)
-            final_genre = gapfill_model(filled_genre, universal, media_reactions, universal_obj, 2)
-            final_genre = add_annotation(final_genre, gram_type)
-        else: 
-            final_genre = add_annotation(filled_genre, universal_obj)
-    else:
-        draft_reactions = set([x.id for x in draft_genre.reactions])
-        draft_metabolites = set([x.id for x in draft_genre.metabolites])
-        final_genre = draft_genre
-        final_genre = add_annotation(final_genre, gram_type)
+def manage_alignment_cache(command, max_size=None):
+    cache = AlignmentCache()
+    if command == 'prune':
+        max_size = None if max_size is None else int(float(max_size) * 1024**3)
+        print('Evicted', cache.prune(max_size), 'cached alignment(s)')
+    elif command == 'clear':
+        print('Removed', cache.clear(), 'cached alignment(s)')
+    info = cache.info()
+    print('Alignment cache:', info['path'])
+    print('\t', info['entries'], 'cached alignment(s) using', round(info['size'] / 1024**2, 1), 'MB of', round(info['max_size'] / 1024**2, 1), 'MB')
 
-    # Correct exchanges and check new model
-    if exchange_arg == 0:
-        for exch in final_genre.exchanges: exch.bounds = (0., 0.)
-    else:
-        for exch in final_genre.exchanges: exch.bounds = (-1000., 1000.)
-    for rxn in final_genre.reactions:
-        if 'Exchange reaction for' in rxn.name:
-            rxn.name = list(rxn.metabolites)[0].name + ' exchange'
-    biomass = check_model(draft_reactions, draft_metabolites, final_genre)
 
-    # Write new model to sbml
-    if out_file == "default":
-        input_file = input_file.split('/')[-1] # write to working directory
-        if file_type == 1:
-            if new_id != 'default':
-                out_file = input_file.rstrip('fastn') + new_id + '.sbml'
-            else:
-                out_file = input_file.rstrip('fastn') + 'sbml'
-        elif file_type == 2:
-            if new_id != 'default':
-                if input_file != 'none':
-                    out_file = input_file.rstrip('out') + new_id + '.sbml'
-                else:
-                    out_file = new_id + '.sbml'
-            else:
-                if org != 'default':
-                    out_file = org + '.sbml'
-                else:
-                    out_file = input_file.rstrip('out') + 'sbml'
-        elif file_type == 3:
-            if new_id != 'default':
-                out_file = input_file.rstrip('sbml') + new_id + '.extended.sbml'
-            else:
-                out_file = input_file.rstrip('sbml') + 'extended.sbml'
+def manage_gapfill_memo(command):
+    with GapfillMemo() as memo:
+        if command == 'prune':
+            print('Evicted', memo.prune(), 'memoized gap-filling result(s)')
+        elif command == 'clear':
+            print('Removed', memo.clear(), 'memoized gap-filling result(s)')
+        stats = memo.stats()
+    print('Gap-filling memo:', stats['path'])
+    print('\t', stats['entries'], 'memoized result(s),', stats['hits'], 'hit(s) and', stats['misses'], 'miss(es)', f"({stats['hit_rate']:.0%} hit rate)")
+    print('\t', stats['maxima'], 'cached universal objective maxima')
 
-    print('\nSaving new GENRE to', out_file, '\n')
-    cobra.io.write_sbml_model(final_genre, out_file)
 
+#----------------------------------------------------------------------------------------------------------------------#
+if __name__ == "__main__":
+    main()
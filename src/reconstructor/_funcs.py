@@ -1,31 +1,235 @@
+from tempfile import TemporaryDirectory
+import os
+import shutil
+import time
+
 import cobra
 from optlang.symbolics import Zero
 
+from reconstructor.dedup import read_fasta
 from reconstructor.diamond import Diamond
+from reconstructor.gapfill import FAST_PATH_MESSAGE, draft_meets_objective
+from reconstructor.genemap import CompiledMap
+from reconstructor.media import MEDIA_PRESETS
+from reconstructor.solver import check_status
+
+
+ALIGNMENT_MODES = ('single', 'two-pass')
+SENSITIVITY_MODES = ('fast', 'default', 'mid-sensitive', 'sensitive', 'more-sensitive', 'very-sensitive', 'ultra-sensitive')
 
 
-def run_blast(inputfile, outputfile, database, processors):
+def run_blast(inputfile, outputfile, database, processors, cache=None):
     """
     Runs protein BLAST and saves results.
+
+    If an AlignmentCache is given, a cached result for the same query,
+    database, DIAMOND version and options is used instead of running DIAMOND,
+    and new results are added to the cache.
     """
 
+    diamond = Diamond()
+    options = ["--more-sensitive", "--max-target-seqs", "1"]
+
+    if cache is not None:
+        key = cache.key(inputfile, database, diamond.get_version(), options)
+        cached = cache.get(key)
+        if cached is not None:
+            print('using cached blast results for %s'%(inputfile))
+            shutil.copyfile(cached, outputfile)
+            return outputfile
+
     print('blasting %s vs %s'%(inputfile,database))
 
-    diamond = Diamond()
     diamond.blastp(
         database,
         inputfile,
         outputfile, 
         "-p", processors,
-        "--more-sensitive",
-        "--max-target-seqs", "1",
+        *options,
         capture_output=True
     )
     print('finished blast')
 
+    if cache is not None:
+        cache.put(key, outputfile)
+
     return outputfile
 
 
+def stream_blast(
+        inputfile, database, processors, outputfile=None, cache=None, mode='single', sensitivity='more-sensitive',
+        subdb=None, diamond_options=()
+    ):
+    """
+    Runs protein BLAST and collects the KEGG hits from its output while it is
+    still running.
+
+    The output is only written to disk if an output file is given (or needed
+    for the AlignmentCache). Without one, DIAMOND only reports the query and
+    subject ids, which is all that is needed for the hits.
+
+    In 'single' mode every query is aligned with the given DIAMOND sensitivity.
+    In 'two-pass' mode, every query is first aligned in DIAMOND's default (fast)
+    mode and only the queries without a hit are aligned again with the given
+    sensitivity (see `two_pass_align`).
+
+    If a sub-database is given (see `reconstructor.subdb`), the queries are
+    aligned against it first and only the queries without a hit are aligned
+    against the full database.
+
+    `diamond_options` are passed to every DIAMOND search (e.g. the block size
+    and index chunks from `reconstructor.diamond.memory_options`).
+    """
+
+    query_hits = align_query_hits(
+        inputfile, database, processors, outputfile, cache, mode, sensitivity, subdb, diamond_options
+    )
+
+    hits = set()
+    for targets in query_hits.values():
+        hits.update(targets)
+    return hits
+
+
+def align_query_hits(
+        inputfile, database, processors, outputfile=None, cache=None, mode='single', sensitivity='more-sensitive',
+        subdb=None, diamond_options=()
+    ):
+    """
+    Runs protein BLAST as `stream_blast` does and returns the hits of each query
+    that has one.
+    """
+
+    if mode not in ALIGNMENT_MODES:
+        raise ValueError(f"Unknown alignment mode {mode}, must be one of: {', '.join(ALIGNMENT_MODES)}")
+
+    def align(query, db, out):
+        if mode == 'two-pass':
+            return two_pass_align(query, db, processors, sensitivity, out, cache, diamond_options)
+        return align_queries(query, db, processors, [*sensitivity_options(sensitivity), *diamond_options], out, cache)
+
+    if subdb is None:
+        return align(inputfile, database, outputfile)
+    query_hits = align(inputfile, subdb, outputfile)
+    return realign_missed(
+        inputfile, query_hits, lambda query, out: align(query, database, out), outputfile, 'full database fallback'
+    )
+
+
+def align_queries(inputfile, database, processors, options, outputfile=None, cache=None):
+    """
+    Runs protein BLAST with the given sensitivity options and returns the hits
+    of each query that has one, parsed from DIAMOND's output as it streams in.
+    """
+
+    diamond = Diamond()
+    options = [*options, "--max-target-seqs", "1"]
+    if outputfile is None:
+        options.extend(["--outfmt", "6", "qseqid", "sseqid"])
+
+    if cache is not None:
+        key = cache.key(inputfile, database, diamond.get_version(), options)
+        cached = cache.get(key)
+        if cached is not None:
+            print('using cached blast results for %s'%(inputfile))
+            if outputfile is not None:
+                shutil.copyfile(cached, outputfile)
+            with open(cached, 'r') as file:
+                return _parse_query_hits(file)
+
+    print('blasting %s vs %s'%(inputfile,database))
+
+    with TemporaryDirectory() as tempdir:
+        if outputfile is None and cache is not None:
+            outputfile = os.path.join(tempdir, 'blast.out')
+        tee = open(outputfile, 'w') if outputfile is not None else None
+        try:
+            query_hits = _parse_query_hits(
+                diamond.blastp_stream(database, inputfile, "-p", processors, *options, tee=tee)
+            )
+        finally:
+            if tee is not None:
+                tee.close()
+        if cache is not None:
+            cache.put(key, outputfile)
+    print('finished blast')
+
+    return query_hits
+
+
+def two_pass_align(
+        inputfile, database, processors, sensitivity='more-sensitive', outputfile=None, cache=None, diamond_options=()
+    ):
+    """
+    Aligns every query in DIAMOND's default (fast) mode, then aligns the
+    queries without a hit again with a higher sensitivity and merges the hits.
+
+    Most proteins are found by the fast pass, so the slow, sensitive pass only
+    runs on the few that are left. The output of both passes is written to the
+    output file if one is given.
+    """
+
+    start = time.time()
+    first_options = [*sensitivity_options('default'), *diamond_options]
+    query_hits = align_queries(inputfile, database, processors, first_options, outputfile, cache)
+    print('first pass hit %i queries in %.1f s'%(len(query_hits), time.time() - start))
+
+    second_options = [*sensitivity_options(sensitivity), *diamond_options]
+    align = lambda query, out: align_queries(query, database, processors, second_options, out, cache)
+    return realign_missed(inputfile, query_hits, align, outputfile, 'second pass (%s)'%(sensitivity))
+
+
+def realign_missed(inputfile, query_hits, align, outputfile=None, label='second pass'):
+    """
+    Aligns the queries of an input file that don't have a hit yet with
+    `align(query_file, output_file)` and merges their hits into `query_hits`.
+    The new output is appended to the output file if one is given.
+    """
+
+    with TemporaryDirectory() as tempdir:
+        # Write the queries that weren't hit to a new query file
+        remaining = os.path.join(tempdir, 'remaining.fa')
+        total = 0
+        with open(remaining, 'w') as file:
+            for header, sequence in read_fasta(inputfile):
+                total += 1
+                if header.split()[0] not in query_hits:
+                    file.write('>%s\n%s\n'%(header, sequence))
+        missed = total - len(query_hits)
+        if missed <= 0:
+            return query_hits
+
+        start = time.time()
+        remaining_out = os.path.join(tempdir, 'remaining.out') if outputfile is not None else None
+        new_hits = align(remaining, remaining_out)
+        if outputfile is not None:
+            with open(outputfile, 'a') as out, open(remaining_out, 'r') as file:
+                shutil.copyfileobj(file, out)
+        print('%s recovered %i of %i remaining queries in %.1f s'%(label, len(new_hits), missed, time.time() - start))
+
+    query_hits.update(new_hits)
+    return query_hits
+
+
+def sensitivity_options(sensitivity):
+    """
+    Gets the DIAMOND options for a sensitivity mode.
+    """
+
+    if sensitivity not in SENSITIVITY_MODES:
+        raise ValueError(f"Unknown DIAMOND sensitivity {sensitivity}, must be one of: {', '.join(SENSITIVITY_MODES)}")
+    # DIAMOND's default mode doesn't have an option of its own
+    return [] if sensitivity == 'default' else ['--' + sensitivity]
+
+
+def _parse_query_hits(lines):
+    query_hits = {}
+    for line in lines:
+        query, target = line.split('\t', 2)[:2]
+        query_hits.setdefault(query, set()).add(target.rstrip())
+    return query_hits
+
+
 def read_blast(blast_hits):
     """
     Retrieves KEGG hits from blast output.
@@ -51,6 +255,10 @@ def genes_to_rxns(kegg_hits, gene_modelseed, organism):
         gene_count = len(kegg_hits) - gene_count
         print('Added', gene_count, 'genes from', organism)
 
+    if isinstance(gene_modelseed, CompiledMap):
+        # Look all of the genes up at once
+        return {rxn + '_c': genes for rxn, genes in gene_modelseed.group_by_value(kegg_hits).items()}
+
     rxn_db = {}
     for gene in kegg_hits:
         for rxn in gene_modelseed.get(gene, []):
@@ -68,6 +276,10 @@ def _get_org_rxns(gene_modelseed, organism):
     Get genes for organism from reference genome.
     """
 
+    if isinstance(gene_modelseed, CompiledMap):
+        # The genes of an organism are next to each other in the compiled map
+        return set(gene_modelseed.prefix_keys(organism + ':'))
+
     org_genes = []
     for gene in gene_modelseed.keys():
         current = gene.split(':')[0]
@@ -84,11 +296,15 @@ def create_model(rxn_db, universal, input_id):
 
     new_model = cobra.Model('new_model')
 
+    # Set the GPRs on the copies and add them all at once, so the solver is
+    # only updated once
+    new_rxns = []
     for x in rxn_db.keys():
         if universal.reactions.has_id(x):
-            rxn = universal.reactions.get_by_id(x)
-            new_model.add_reactions([rxn.copy()])
-            new_model.reactions.get_by_id(x).gene_reaction_rule = ' or '.join(rxn_db[x])
+            rxn = universal.reactions.get_by_id(x).copy()
+            rxn.gene_reaction_rule = ' or '.join(rxn_db[x])
+            new_rxns.append(rxn)
+    new_model.add_reactions(new_rxns)
 
     if input_id != 'default':
         new_model.id = input_id
@@ -109,7 +325,8 @@ def add_names(model, gene_db):
     return model
 
 
-def find_reactions(model, reaction_bag, tasks, obj, fraction, max_fraction, step, file_type):
+def find_reactions(model, reaction_bag, tasks, obj, fraction, max_fraction, step, file_type, fast_path=False,
+        objective_maxima=None):
     """
     pFBA gapfiller.
     
@@ -119,10 +336,39 @@ def find_reactions(model, reaction_bag, tasks, obj, fraction, max_fraction, step
     bound for previous objective, assemble forward and reverse components of all
     reactions, create objective, based on pFBA, run FBA and identify reactions
     from universal that are now active.
+
+    If `objective_maxima` (a `reconstructor.gapfill.ObjectiveMaxima` of the
+    reaction bag) is given, the maximum of the objective is taken from it when
+    the draft allows. If `fast_path` is also True and the draft alone already
+    meets the objective bounds (see `reconstructor.gapfill.draft_meets_objective`),
+    the reaction bag isn't modified or solved at all. Both are only valid if
+    the reaction bag has no objective constraints from earlier calls, like in
+    the first step of gap-filling a draft.
     """
 
     print('\r[                                         ]', end="", flush=True)
 
+    obj_maximum = None
+    if objective_maxima is not None:
+        obj_maximum = objective_maxima.maximum(model, tasks, obj, fraction, file_type)
+
+    # Skip the whole problem if the draft already meets the objective bounds
+    if fast_path and obj_maximum is not None:
+        if step == 1:
+            lb, ub = obj_maximum*fraction, obj_maximum*max_fraction
+        elif step == 2:
+            lb, ub = obj_maximum*max_fraction, obj_maximum
+        draft_rxn_ids = set(rxn.id for rxn in model.reactions if rxn.id != obj or file_type == 3)
+        fast_rxn_ids = draft_meets_objective(model, reaction_bag, tasks, obj, (lb, ub), file_type, draft_rxn_ids)
+        if fast_rxn_ids is not None:
+            # The objective constraint stays active, as it does below
+            reaction_bag.solver.add(reaction_bag.problem.Constraint(
+                reaction_bag.reactions.get_by_id(obj).flux_expression, lb=lb, ub=ub))
+            reaction_bag.solver.update()
+            print('\r[-----------------------------------------]')
+            print(FAST_PATH_MESSAGE)
+            return fast_rxn_ids
+
     # Modify universal reaction bag
     new_rxn_ids = set() #make empty set we will add new reaction ids to
     with reaction_bag as universal: #set the reaction bag as the universal reaction databse
@@ -155,8 +401,12 @@ def find_reactions(model, reaction_bag, tasks, obj, fraction, max_fraction, step
         print('\r[---------------                          ]', end="", flush=True)
 
         # Set minimum lower bound for previous objective
-        universal.objective = universal.reactions.get_by_id(obj) 
-        prev_obj_val = universal.slim_optimize()
+        if obj_maximum is not None:
+            prev_obj_val = obj_maximum
+        else:
+            universal.objective = universal.reactions.get_by_id(obj) 
+            prev_obj_val = universal.slim_optimize()
+            check_status(universal)
         if step == 1:
             prev_obj_constraint = universal.problem.Constraint(universal.reactions.get_by_id(obj).flux_expression, 
         	   lb=prev_obj_val*fraction, ub=prev_obj_val*max_fraction)
@@ -188,7 +438,8 @@ def find_reactions(model, reaction_bag, tasks, obj, fraction, max_fraction, step
 
         # Run FBA and identify reactions from universal that are now active
         solution = universal.optimize()
-        
+        check_status(universal)
+
     new_rxn_ids = set([rxn.id for rxn in reaction_bag.reactions if abs(solution.fluxes[rxn.id]) > 1e-6]).difference(orig_rxn_ids)
     print('\r[-----------------------------------------]')
 
@@ -214,14 +465,18 @@ def gapfill_model(model, universal, new_rxn_ids, obj, step):
     model.objective = model.problem.Objective(model.reactions.get_by_id(obj).flux_expression, direction='max')
 
     # Identify extracellular metabolites still need exchanges
+    exchanges = []
     for cpd in model.metabolites:
         if cpd.compartment != 'extracellular':
             continue
         else:
             exch_id = 'EX_' + cpd.id
             if not model.reactions.has_id(exch_id):
-                model.add_boundary(cpd, type='exchange', reaction_id=exch_id, lb=-1000.0, ub=1000.0)
-                model.reactions.get_by_id(exch_id).name = cpd.name + ' exchange'
+                exch = cobra.Reaction(exch_id, name=cpd.name + ' exchange', lower_bound=-1000.0, upper_bound=1000.0)
+                exch.add_metabolites({cpd: -1})
+                exch.annotation['sbo'] = 'SBO:0000627'
+                exchanges.append(exch)
+    model.add_reactions(exchanges)
 
     return model
 
@@ -231,18 +486,17 @@ def set_base_inputs(model, universal):
     Set uptake of specific metabolites in complete medium gap-filling.
     """
 
-    tasks = ['EX_cpd00035_e','EX_cpd00051_e','EX_cpd00132_e','EX_cpd00041_e','EX_cpd00084_e','EX_cpd00053_e','EX_cpd00023_e',
-    'EX_cpd00033_e','EX_cpd00119_e','EX_cpd00322_e','EX_cpd00107_e','EX_cpd00039_e','EX_cpd00060_e','EX_cpd00066_e','EX_cpd00129_e',
-    'EX_cpd00054_e','EX_cpd00161_e','EX_cpd00065_e','EX_cpd00069_e','EX_cpd00156_e','EX_cpd00027_e','EX_cpd00149_e','EX_cpd00030_e',
-    'EX_cpd00254_e','EX_cpd00971_e','EX_cpd00063_e','EX_cpd10515_e','EX_cpd00205_e','EX_cpd00099_e']
+    tasks = ['EX_' + cpd for cpd in MEDIA_PRESETS['default']]
 
     new_rxns = []
     for exch in tasks: 
         if not model.reactions.has_id(exch):
-            new_rxns.append(universal.reactions.get_by_id(exch).copy())
+            rxn = universal.reactions.get_by_id(exch).copy()
+            rxn.bounds = (-1000., -0.01)
+            new_rxns.append(rxn)
+        else:
+            model.reactions.get_by_id(exch).bounds = (-1000., -0.01)
     model.add_reactions(new_rxns)
-    for exch in tasks:
-        model.reactions.get_by_id(exch).bounds = (-1000., -0.01)
 
     return model
 
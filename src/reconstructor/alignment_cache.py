@@ -0,0 +1,183 @@
+"""
+On-disk cache of DIAMOND alignment results.
+
+Alignment results are stored under a key made from the SHA-256 digests of the
+query file and the database file, the DIAMOND version and the DIAMOND options
+that affect the results, so re-running Reconstructor on the same input (e.g.
+with different gap-filling settings) can skip the alignment entirely. The cache
+is limited in size; the least recently used results are evicted first.
+"""
+
+from typing import Optional, Sequence, Union
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+
+from reconstructor import resources
+from reconstructor.snapshot import file_digest
+
+
+DEFAULT_MAX_SIZE = 2 * 1024**3  # bytes
+
+# Options that don't change the alignment results
+_IGNORED_OPTIONS = {
+    "-p": 1, "--threads": 1, "--tmpdir": 1, "-t": 1, "--quiet": 0, "--verbose": 0, "--log": 0,
+    "-b": 1, "--block-size": 1, "-c": 1, "--index-chunks": 1
+}
+
+
+class AlignmentCache:
+    """
+    Size-limited, least recently used cache of DIAMOND output files.
+    """
+
+    def __init__(self, path: Optional[Union[str, os.PathLike]] = None, max_size: Optional[int] = None):
+        if path is None:
+            path = resources.get_cache_dir().joinpath("alignments")
+        if max_size is None:
+            max_size = int(float(os.environ.get("RECONSTRUCTOR_ALIGNMENT_CACHE_SIZE", DEFAULT_MAX_SIZE / 1024**3)) * 1024**3)
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({repr(str(self.path))}, max_size={self.max_size})"
+
+    def key(
+            self,
+            query: Union[str, os.PathLike],
+            database: Union[str, os.PathLike],
+            diamond_version: str,
+            options: Sequence[str] = ()
+        ) -> str:
+        """
+        Get the cache key for aligning a query file against a database.
+        """
+        key = {
+            "query": file_digest(query),
+            "database": self.database_digest(database),
+            "diamond": diamond_version,
+            "options": result_options(options)
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Get the path to the cached result for a key, or None if there isn't one.
+        """
+        path = self._entry_path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, result: Union[str, os.PathLike]) -> Path:
+        """
+        Add a copy of an alignment result file to the cache and evict old
+        results if the cache is too large.
+        """
+        path = self._entry_path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        shutil.copyfile(result, tmp_path)
+        os.replace(tmp_path, path)
+        self.prune()
+        return path
+
+    def entries(self) -> list[tuple[Path, os.stat_result]]:
+        """
+        Get the cached result files, from least to most recently used.
+        """
+        entries = []
+        for path in self.path.glob("*.out"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                # Evicted by another process
+                continue
+        entries.sort(key=lambda entry: entry[1].st_mtime)
+        return entries
+
+    def info(self) -> dict:
+        """
+        Get a summary of the cache contents.
+        """
+        entries = self.entries()
+        return {
+            "path": str(self.path),
+            "entries": len(entries),
+            "size": sum(stat.st_size for _, stat in entries),
+            "max_size": self.max_size
+        }
+
+    def prune(self, max_size: Optional[int] = None) -> int:
+        """
+        Evict the least recently used results until the cache is no larger than
+        `max_size` (the cache's maximum size by default). Returns the number of
+        evicted results.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        entries = self.entries()
+        size = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        for path, stat in entries:
+            if size <= max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        """
+        Remove every cached result.
+        """
+        return self.prune(0)
+
+    def database_digest(self, database: Union[str, os.PathLike]) -> str:
+        """
+        Get the SHA-256 digest of a database file.
+
+        Databases are large, so digests are remembered for each database path,
+        size and modification time and only recomputed when one of them changes.
+        """
+        stat = os.stat(database)
+        db_key = f"{os.path.abspath(database)}:{stat.st_size}:{stat.st_mtime_ns}"
+        digests_path = self.path.joinpath("database_digests.json")
+        try:
+            with open(digests_path, "r") as f:
+                digests = json.load(f)
+        except (OSError, ValueError):
+            digests = {}
+
+        if db_key not in digests:
+            digests[db_key] = file_digest(database)
+            tmp_path = digests_path.with_name(f"{digests_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(digests, f)
+            os.replace(tmp_path, digests_path)
+
+        return digests[db_key]
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path.joinpath(f"{key}.out")
+
+
+def result_options(options: Sequence[str]) -> list[str]:
+    """
+    Drop the options that don't affect alignment results (like the number of
+    threads) so that they don't change the cache key.
+    """
+    options = [str(x) for x in options]
+    result = []
+    i = 0
+    while i < len(options):
+        if options[i] in _IGNORED_OPTIONS:
+            i += 1 + _IGNORED_OPTIONS[options[i]]
+            continue
+        result.append(options[i])
+        i += 1
+    return result
@@ -0,0 +1,257 @@
+"""
+Batch reconstruction of many genomes in one process.
+
+A batch is described by a tab-separated manifest file with a header row. Each
+column is named after one of the `reconstruct` arguments or a field of one of
+its option groups (see `build.group_options`; `input_file` is required) and
+each row describes one reconstruction. Arguments that are not given in the
+manifest fall back to the batch defaults. For example:
+
+    input_file      file_type   gram        out
+    genome1.fa      1           negative    genome1.sbml
+    genome2.out     2           positive    genome2.sbml
+
+With `dedup`, the proteins of all type 1 inputs are aligned together first and
+each unique sequence is only aligned once (see `reconstructor.dedup`).
+
+Batches can also be run with several worker processes. The databases are then
+loaded once in the parent process before the workers are forked, so the workers
+share them copy-on-write instead of each loading their own copy.
+"""
+
+from typing import Any, NamedTuple, Optional, Union
+import csv
+import gc
+import multiprocessing
+import os
+import platform
+import time
+import traceback
+
+from reconstructor import build, errors, resources
+from reconstructor.dedup import align_batch
+from reconstructor.diamond import memory_options, stage_database
+from reconstructor.gapfill import get_engine, get_objective_maxima
+from reconstructor.pruning import get_network_index
+from reconstructor.solver import configure_solver
+from reconstructor.subdb import get_subdb
+
+
+MANIFEST_COLUMNS = (
+    'input_file', 'file_type', 'media', 'tasks', 'org', 'min_frac', 'max_frac',
+    'gram', 'out', 'name', 'cpu', 'gapfill', 'exchange', 'gapfill_engine', 'prune_hops', 'prune_blocked',
+    'prune_verify', 'alignment_cache', 'save_blast',
+    'alignment_mode', 'sensitivity', 'subdb', 'diamond_memory', 'stage_db',
+    'draft_cache', 'gapfill_memo', 'solver', 'solver_threads', 'lp_method', 'time_limit'
+)
+
+# Options that change how type 1 inputs are aligned, with their defaults
+_ALIGNMENT_OPTIONS = (
+    ('sensitivity', 'more-sensitive'), ('alignment_mode', 'single'), ('subdb', 'none'), ('diamond_memory', 'none'),
+    ('stage_db', 'none')
+)
+
+
+class BatchResult(NamedTuple):
+    input_file: str
+    out_file: Optional[str]
+    elapsed: float
+    error: Optional[str] = None
+    pid: Optional[int] = None
+    peak_rss: Optional[float] = None  # MB
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def read_manifest(path: Union[str, os.PathLike]) -> list[dict[str, str]]:
+    """
+    Read a batch manifest file into a list of `reconstruct` keyword arguments.
+
+    Blank lines and lines starting with '#' are skipped, as are empty cells (so
+    the batch default is used for them).
+    """
+    with open(path, 'r', newline='') as f:
+        rows = [line for line in f if line.strip() and not line.startswith('#')]
+
+    reader = csv.DictReader(rows, delimiter='\t')
+    if reader.fieldnames is None or 'input_file' not in reader.fieldnames:
+        raise errors.ReconstructorError(f"Batch manifest {path} must have an input_file column")
+    unknown = set(reader.fieldnames).difference(MANIFEST_COLUMNS)
+    if len(unknown) != 0:
+        raise errors.ReconstructorError(f"Unknown batch manifest column(s): {', '.join(sorted(unknown))}")
+
+    entries = []
+    for row in reader:
+        entries.append({k: v.strip() for k, v in row.items() if v is not None and v.strip() != ''})
+    return entries
+
+
+def run_batch(
+        manifest: Union[str, os.PathLike, list[dict[str, Any]]],
+        workers: int = 1,
+        dedup: bool = False,
+        **defaults
+    ) -> list[BatchResult]:
+    """
+    Reconstruct every genome in a batch manifest.
+
+    The manifest can be a path to a manifest file or a list of `reconstruct`
+    keyword arguments. The GENRE construction databases are loaded once and
+    shared by every reconstruction. With more than one worker, the genomes are
+    split between forked worker processes that share the databases loaded by
+    this process. If `dedup` is True, the proteins of all type 1 inputs are
+    aligned in one deduplicated DIAMOND run before any reconstruction starts.
+    A failed reconstruction (including one whose gap-filling takes longer than
+    `time_limit`) is reported and recorded in its result without stopping the
+    rest of the batch.
+    """
+    if isinstance(manifest, (str, os.PathLike)):
+        entries = read_manifest(manifest)
+    else:
+        entries = list(manifest)
+
+    workers = max(1, min(int(workers), len(entries)))
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        print(f'WARNING: Parallel batches are not supported on {platform.system()}. Using 1 worker')
+        workers = 1
+
+    print(f'Reconstructing {len(entries)} genome(s) in batch mode with {workers} worker(s)')
+    start = time.time()
+
+    if dedup:
+        entries = _align_entries(entries, defaults)
+    prepare_shared(defaults)
+
+    results = []
+    if workers == 1:
+        for i, entry in enumerate(entries, start=1):
+            print(f'\nGenome {i} of {len(entries)}: {entry["input_file"]}')
+            results.append(_run_entry(entry, defaults))
+    else:
+        # Move everything loaded so far out of the garbage collector's reach so
+        # that collections in the workers don't touch (and copy) those pages
+        gc.freeze()
+        try:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(workers) as pool:
+                tasks = [(entry, defaults) for entry in entries]
+                for result in pool.imap_unordered(_run_entry_star, tasks):
+                    results.append(result)
+                    print(f'\nFinished {len(results)} of {len(entries)} genome(s): {result.input_file}')
+        finally:
+            gc.unfreeze()
+
+    report_batch(results, time.time() - start)
+    return results
+
+
+def prepare_shared(defaults: dict[str, Any]):
+    """
+    Load the databases and build the gap-filling engine in this process, so
+    that they are shared by every reconstruction (and by forked workers).
+    """
+    _, _, universal, _ = build.load_databases()
+    # Switch solvers before forking, so the workers don't each rebuild the problem
+    configure_solver(
+        universal, defaults.get('solver', 'none'), defaults.get('solver_threads', 'none'),
+        defaults.get('lp_method', 'none'), defaults.get('time_limit', 'none')
+    )
+    engine = str(defaults.get('gapfill_engine', 'bag'))
+    if int(defaults.get('prune_hops', 0)) > 0:
+        # Pruned problems are solved by the persistent engine instead of the bag
+        if engine == 'bag':
+            engine = 'persistent'
+        get_network_index(universal)
+    if engine != 'bag':
+        get_engine(engine, universal).prepare()
+    get_objective_maxima(universal)
+
+
+def report_batch(results: list[BatchResult], elapsed: Optional[float] = None):
+    """
+    Print a summary of the results of a batch, including the throughput and the
+    peak memory use of each worker process.
+    """
+    failed = [r for r in results if not r.ok]
+    print(f'\nBatch finished: {len(results) - len(failed)} succeeded, {len(failed)} failed')
+    for result in failed:
+        print(f'\tFAILED {result.input_file}: {result.error}')
+
+    if elapsed is not None and elapsed > 0:
+        print(f'\tThroughput: {len(results) / elapsed * 3600:.1f} genomes per hour ({elapsed:.1f} s total)')
+
+    peak_rss = {}
+    for result in results:
+        if result.peak_rss is not None:
+            peak_rss[result.pid] = max(peak_rss.get(result.pid, 0.0), result.peak_rss)
+    for pid, rss in sorted(peak_rss.items()):
+        print(f'\tWorker {pid} peak RSS: {rss:.0f} MB')
+
+
+def _align_entries(entries: list[dict[str, Any]], defaults: dict[str, Any]) -> list[dict[str, Any]]:
+    """
+    Align the type 1 inputs of a batch together and add their gene hits to
+    their entries. Inputs are aligned together with the other inputs that have
+    the same alignment options.
+    """
+    groups = {}
+    for entry in entries:
+        kwargs = {**defaults, **entry}
+        if int(kwargs.get('file_type', 1)) != 1:
+            continue
+        options = tuple(str(kwargs.get(name, default)) for name, default in _ALIGNMENT_OPTIONS)
+        groups.setdefault(options, []).append(entry['input_file'])
+
+    genome_hits = {}
+    for options, fasta_files in groups.items():
+        sensitivity, mode, subdb, diamond_memory, stage_db = options
+        print('Aligning the proteins of', len(fasta_files), 'genome(s) together...')
+        database = resources.get_diamond_db_path()
+        if stage_db != 'none':
+            database = stage_database(database, stage_db)
+        genome_hits.update(align_batch(
+            fasta_files, database, defaults.get('cpu', 1),
+            sensitivity=sensitivity,
+            mode=mode,
+            subdb=(get_subdb(subdb, database) if subdb != 'none' else None),
+            diamond_options=(memory_options(float(diamond_memory)) if diamond_memory != 'none' else [])
+        ))
+    return [
+        {**entry, 'gene_hits': genome_hits[entry['input_file']]} if entry['input_file'] in genome_hits else entry
+        for entry in entries
+    ]
+
+
+def _run_entry(entry: dict[str, Any], defaults: dict[str, Any]) -> BatchResult:
+    kwargs = {**defaults, **entry}
+    start = time.time()
+    try:
+        kwargs = {k: v for k, v in kwargs.items() if k in MANIFEST_COLUMNS or k == 'gene_hits'}
+        _, out_file = build._reconstruct(**build.group_options(kwargs))
+    except Exception as e:
+        traceback.print_exc()
+        error = f'{type(e).__name__}: {e}'
+        return BatchResult(entry['input_file'], None, time.time() - start, error, os.getpid(), _peak_rss())
+    return BatchResult(entry['input_file'], out_file, time.time() - start, None, os.getpid(), _peak_rss())
+
+
+def _run_entry_star(task: tuple[dict[str, Any], dict[str, Any]]) -> BatchResult:
+    return _run_entry(*task)
+
+
+def _peak_rss() -> Optional[float]:
+    """
+    Get the peak resident set size of this process in MB (None on Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if platform.system() == 'Darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
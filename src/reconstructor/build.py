@@ -1,11 +1,737 @@
+from typing import Any, Mapping, NamedTuple, Optional, Union
+from functools import partial
+from multiprocessing import cpu_count
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import csv
+import hashlib
+import json
+import multiprocessing
 import os
+import zipfile
 
-def reconstruct(input_file, file_type = 1, media=[], org = 'default', min_frac = 0.01, max_frac = 0.5, gram='none', out = 'default', name = 'default', cpu = 1, gapfill = 'yes', test = 'no'):
-    print('Generating reconstruction....')
-    cmd_line = 'python -m reconstructor --input_file %s --file_type %s --media %s --org %s --min_frac %s --max_frac %s --gram %s --out %s --name %s --cpu %s --gapfill %s --test %s'%(input_file,file_type,media,org,min_frac,max_frac,gram,out,name,cpu,gapfill,test)
-    print('Reconstruction generating with the following command line:')
-    print(cmd_line)
-    os.system(cmd_line)
+import cobra
+from cobra.util.solver import interface_to_str
 
-if __name__ == '__main__':
-    reconstruct('218496.4.fa', file_type = 1, gram = 'negative')
\ No newline at end of file
+from reconstructor._funcs import (
+    stream_blast,
+    read_blast,
+    genes_to_rxns,
+    create_model,
+    add_names,
+    find_reactions,
+    gapfill_model,
+    set_base_inputs,
+    add_annotation,
+    check_model
+)
+from reconstructor.alignment_cache import AlignmentCache
+from reconstructor.subdb import get_subdb
+from reconstructor.diamond import Diamond, download_diamond, memory_options, stage_database
+from reconstructor.gapfill import get_engine, get_objective_maxima, media_key
+from reconstructor.memo import GapfillMemo
+from reconstructor.media import get_media, get_media_set, set_media
+from reconstructor.pruning import PrunedGapfillEngine
+from reconstructor.solver import Watchdog, configure_solver, match_solver
+from reconstructor import resources, errors, snapshot
+
+
+# Objectives of each Gram type
+GRAM_OBJECTIVES = {'positive': 'biomass_GmPos', 'negative': 'biomass_GmNeg'}
+
+
+class AlignmentOptions(NamedTuple):
+    """
+    How type 1 inputs are aligned to the KEGG database. Fields have the same
+    meaning as the corresponding command line options.
+    """
+    alignment_cache: str = 'yes'
+    save_blast: str = 'yes'
+    alignment_mode: str = 'single'
+    sensitivity: str = 'more-sensitive'
+    subdb: str = 'none'
+    diamond_memory: Union[str, float] = 'none'
+    stage_db: str = 'none'
+
+
+class GapfillOptions(NamedTuple):
+    """
+    How gap-filling problems are solved (see `reconstructor.gapfill`,
+    `reconstructor.pruning` and `reconstructor.memo`). Fields have the same
+    meaning as the corresponding command line options.
+    """
+    gapfill_engine: str = 'bag'
+    prune_hops: int = 0
+    prune_blocked: str = 'no'
+    prune_verify: str = 'no'
+    gapfill_memo: str = 'yes'
+
+
+class SolverOptions(NamedTuple):
+    """
+    How the gap-filling solver is configured (see `reconstructor.solver`).
+    Fields have the same meaning as the corresponding command line options.
+    """
+    solver: str = 'none'
+    solver_threads: Union[str, int] = 'none'
+    lp_method: str = 'none'
+    time_limit: Union[str, float] = 'none'
+
+
+# Option groups by the `reconstruct` argument they are passed in
+OPTION_GROUPS = {
+    'alignment_options': AlignmentOptions,
+    'gapfill_options': GapfillOptions,
+    'solver_options': SolverOptions
+}
+
+
+def group_options(kwargs: Mapping[str, Any]) -> dict[str, Any]:
+    """
+    Replace the flat alignment, gap-filling and solver options in `kwargs` (as
+    given on the command line or in a batch manifest) with their option groups,
+    so that they can be passed to `reconstruct`.
+    """
+    grouped = dict(kwargs)
+    for name, group in OPTION_GROUPS.items():
+        values = {field: grouped.pop(field) for field in group._fields if field in grouped}
+        grouped[name] = group(**values)
+    return grouped
+
+
+def reconstruct(
+        input_file: str = 'none',
+        file_type: int = 1,
+        media: Union[str, list[str]] = 'rich',
+        org: str = 'default',
+        min_frac: float = 0.01,
+        max_frac: float = 0.5,
+        gram: str = 'none',
+        out: str = 'default',
+        name: str = 'default',
+        cpu: int = 1,
+        gapfill: str = 'yes',
+        test: str = 'no',
+        tasks: Union[str, list[str]] = [],
+        exchange: int = 1,
+        draft_cache: str = 'yes',
+        alignment_options: AlignmentOptions = AlignmentOptions(),
+        gapfill_options: GapfillOptions = GapfillOptions(),
+        solver_options: SolverOptions = SolverOptions(),
+        gene_hits: Optional[set[str]] = None
+    ) -> Optional[cobra.Model]:
+    """
+    Generate a GENRE from an input file, save it to SBML and return it.
+
+    The databases are only loaded on the first call, and the shared universal
+    model is left unchanged after each call, so this can be called repeatedly
+    in one process (e.g. for a batch of genomes).
+
+    Args:
+        alignment_options: How type 1 inputs are aligned (see `AlignmentOptions`).
+        gapfill_options: How gap-filling problems are solved (see `GapfillOptions`).
+        solver_options: How the gap-filling solver is configured (see `SolverOptions`).
+        gene_hits: Already known KEGG gene hits of a type 1 input (e.g. from
+            `reconstructor.dedup.align_batch`), which are used instead of aligning it.
+
+    Other arguments are the same as the command line options. Use
+    `group_options` to build the option groups from flat command line options.
+    """
+    if str(test) == 'yes':
+        run_test_suite(cpu=cpu)
+        return None
+    final_genre, _ = _reconstruct(
+        input_file=input_file, file_type=file_type, media=media, org=org, min_frac=min_frac, max_frac=max_frac,
+        gram=gram, out=out, name=name, cpu=cpu, gapfill=gapfill, tasks=tasks, exchange=exchange,
+        draft_cache=draft_cache, alignment_options=alignment_options, gapfill_options=gapfill_options,
+        solver_options=solver_options, gene_hits=gene_hits
+    )
+    return final_genre
+
+
+def reconstruct_media_set(
+        input_file: str = 'none',
+        media_set: Union[str, Mapping[str, Union[str, list[str]]]] = 'rich,minimal',
+        **kwargs
+    ) -> dict[str, cobra.Model]:
+    """
+    Generate a GENRE for each media of a media set (see
+    `reconstructor.media.get_media_set`) from one draft, save them to SBML and
+    return them by media name.
+
+    The input is only aligned and drafted once, and the draft is then gap-filled
+    on each media. Only the exchange bounds of the universal model change
+    between media, so the gap-filling problem is kept in the solver (the 'bag'
+    engine is replaced by the persistent engine, which adds the same reactions).
+    The GENRE of each media is saved next to the output file with the media name
+    added (e.g. 'genome.rich.sbml'), along with a table of which reactions are
+    in each GENRE ('genome.media_presence.tsv'). Other arguments are the same as
+    for `reconstruct`.
+    """
+    genres, _ = _reconstruct(input_file=input_file, media_set=media_set, **kwargs)
+    return genres
+
+
+def _reconstruct(
+        input_file='none', file_type=1, media='rich', org='default', min_frac=0.01, max_frac=0.5, gram='none',
+        out='default', name='default', cpu=1, gapfill='yes', tasks=[], exchange=1, draft_cache='yes',
+        alignment_options=AlignmentOptions(), gapfill_options=GapfillOptions(), solver_options=SolverOptions(),
+        gene_hits=None, media_set=None
+    ) -> Union[tuple[cobra.Model, str], tuple[dict[str, cobra.Model], dict[str, str]]]:
+    """
+    Same as `reconstruct`, but also returns the path the GENRE was saved to.
+    If `media_set` is given, the draft is gap-filled on each of its media instead
+    of on `media`, and the GENREs and paths are returned by media name.
+    """
+
+    # Process input settings
+    input_file = str(input_file)
+    out_file = str(out)
+    file_type = int(file_type)
+    org = str(org)
+    media = get_media(media)
+    if media_set is not None:
+        media_set = get_media_set(media_set)
+    min_frac = float(min_frac)
+    max_frac = float(max_frac)
+    if isinstance(tasks, str):
+        metabolic_tasks = [x for x in tasks.split(',') if x]
+    else:
+        metabolic_tasks = list(tasks)
+    new_id = str(name)
+    gram_type = str(gram)
+    processors = int(cpu)
+    gapfill = str(gapfill)
+    exchange_arg = int(exchange)
+    gapfill_options = gapfill_options._replace(
+        gapfill_engine=str(gapfill_options.gapfill_engine), prune_hops=int(gapfill_options.prune_hops)
+    )
+
+    if gram_type == 'positive':
+        print('\nUsing Gram positive objective function')
+        universal_obj = 'biomass_GmPos'
+    elif gram_type == 'negative':
+        print('\nUsing Gram negative objective function')
+        universal_obj = 'biomass_GmNeg'
+    elif gram_type == 'auto' and (file_type == 3 or gapfill != 'yes'):
+        print('\nWARNING: The Gram type can only be inferred while gap-filling type 1 and 2 inputs. Using the generic objective function')
+        gram_type = 'none'
+        universal_obj = 'biomass'
+    else:
+        universal_obj = 'biomass'
+
+    if min_frac <= 0.0 or min_frac > 1.0:
+        print('WARNING: Improper minimum fraction selected. Defaulting to 0.01')
+        min_frac = 0.01
+    if max_frac <= 0.0 or max_frac > 1.0:
+        print('WARNING: Improper maximum fraction selected. Defaulting to 0.5')
+        max_frac = 0.5
+    if max_frac < min_frac:
+        print('WARNING: Input maximum fraction less than minimum fraction. Minimum set to half maximum')
+        min_frac = max_frac * 0.5
+
+    if org != 'default':
+        print('Including additional genes from KEGG genome of', org)
+
+    # Maximum fraction should not be too high, otherwise the gapfiller adds too many reactions
+    print('Using minimum objective flux fraction of', min_frac,'and maximum fraction of', max_frac)
+
+    if processors > cpu_count():
+        print('WARNING: Requested more processors than are available. Using maximum of', cpu_count())
+        processors = cpu_count()
+    print('Using', processors, 'processor(s)\n')
+
+    # Load databases (only slow the first time)
+    kegg_prot_db, gene_modelseed, universal, gene_names = load_databases(load_universal=(gapfill == 'yes'))
+    catalog = resources.get_universal_catalog()
+    if gapfill == 'yes':
+        configure_solver(universal, *solver_options)
+    time_limit = None if str(solver_options.time_limit) == 'none' else float(solver_options.time_limit)
+
+    # Check input file type
+    if file_type == 1 and gene_hits is not None:
+        blast_results = input_file
+    elif file_type == 1:
+        print('Aligning peptide sequences to KEGG database, may take some time...')
+        blast_results = None
+        if str(alignment_options.save_blast) == 'yes':
+            blast_results = input_file.rstrip('fastn') + 'KEGGprot.out'
+            print('Blast results will be saved to', blast_results,'\n')
+        cache = AlignmentCache() if str(alignment_options.alignment_cache) == 'yes' else None
+        stage_db, diamond_memory, subdb = (
+            str(alignment_options.stage_db), str(alignment_options.diamond_memory), str(alignment_options.subdb)
+        )
+        if stage_db != 'none':
+            kegg_prot_db = stage_database(kegg_prot_db, stage_db)
+        diamond_options = memory_options(float(diamond_memory)) if diamond_memory != 'none' else []
+        subdb_path = get_subdb(subdb, kegg_prot_db) if subdb != 'none' else None
+        gene_hits = stream_blast(
+            input_file, kegg_prot_db, str(processors), blast_results, cache,
+            mode=str(alignment_options.alignment_mode), sensitivity=str(alignment_options.sensitivity),
+            subdb=subdb_path, diamond_options=diamond_options
+        )
+    elif file_type == 2:
+        blast_results = input_file
+    else:
+        try:
+            draft_genre = cobra.io.read_sbml_model(input_file)
+        except:
+            draft_genre = cobra.io.load_json_model(input_file)
+
+    # Handle gap-filling if that's all that is needed
+    if file_type != 3 and gene_hits is None and blast_results == 'none' and org != 'default' and str(draft_cache) == 'yes':
+        print('Creating draft GENRE from the genes of', org)
+        draft_genre = get_reference_draft(org, new_id)
+    elif file_type != 3:
+        if gene_hits is not None:
+            print('Creating draft GENRE from', len(gene_hits), 'aligned genes...')
+            gene_hits = set(gene_hits)
+        elif blast_results != 'none':
+            print('Creating draft GENRE from BLAST results...')
+            gene_hits = read_blast(blast_results)
+        else:
+            gene_hits = set()
+        rxns = genes_to_rxns(gene_hits, gene_modelseed, org)
+        draft_genre = create_model(rxns, catalog, new_id)
+        draft_genre = add_names(draft_genre, gene_names)
+    else:
+        universal_obj = str(draft_genre.objective.expression).split()[0].split('*')[-1]
+
+    if gapfill == 'yes':
+        match_solver(universal, draft_genre)
+    draft_reactions = set([x.id for x in draft_genre.reactions])
+    draft_metabolites = set([x.id for x in draft_genre.metabolites])
+    if out_file == "default":
+        out_file = get_default_out_file(input_file, file_type, new_id, org)
+
+    # Infer the Gram type by racing the first gap-filling step of both objectives
+    step_1 = None
+    if gram_type == 'auto':
+        print('Inferring the Gram type from the first gap-filling step of both objectives...')
+        first_media = media if media_set is None else next(iter(media_set.values()))
+        gram_type, first_step = infer_gram(
+            draft_genre, universal, first_media, metabolic_tasks, min_frac, max_frac, file_type,
+            gapfill_options, time_limit
+        )
+        universal_obj = GRAM_OBJECTIVES[gram_type]
+        step_1 = (first_media, first_step)
+        print('\nUsing Gram', gram_type, 'objective function')
+
+    def finish(draft_genre, media, out_file):
+        if gapfill == 'yes':
+            final_genre = _gapfill(
+                draft_genre, universal, media, metabolic_tasks, universal_obj, min_frac, max_frac, file_type, gram_type,
+                gapfill_options, time_limit,
+                step_1=(step_1[1] if step_1 is not None and step_1[0] == media else None)
+            )
+        else:
+            final_genre = draft_genre
+            final_genre = add_annotation(final_genre, gram_type)
+
+        # Correct exchanges and check new model
+        if exchange_arg == 0:
+            for exch in final_genre.exchanges: exch.bounds = (0., 0.)
+        else:
+            for exch in final_genre.exchanges: exch.bounds = (-1000., 1000.)
+        for rxn in final_genre.reactions:
+            if 'Exchange reaction for' in rxn.name:
+                rxn.name = list(rxn.metabolites)[0].name + ' exchange'
+        biomass = check_model(draft_reactions, draft_metabolites, final_genre)
+
+        # Write new model to sbml
+        print('\nSaving new GENRE to', out_file, '\n')
+        cobra.io.write_sbml_model(final_genre, out_file)
+        return final_genre
+
+    if media_set is None:
+        return finish(draft_genre, media, out_file), out_file
+
+    # Gap-fill the same draft on every media. Only the exchange bounds of the
+    # universal model change between media, so a persistent engine keeps its
+    # problem and starts each solve from the basis of the previous one
+    if gapfill_options.gapfill_engine == 'bag':
+        gapfill_options = gapfill_options._replace(gapfill_engine='persistent')
+    genres = {}
+    out_files = {}
+    for media_name, media in media_set.items():
+        print(f'\nReconstructing on media {media_name} ({len(media)} metabolites)')
+        out_files[media_name] = get_media_out_file(out_file, media_name)
+        genres[media_name] = finish(draft_genre.copy(), media, out_files[media_name])
+
+    presence_file = write_media_presence(genres, get_media_out_file(out_file, 'media_presence', '.tsv'))
+    print('Reaction presence on each media saved to', presence_file)
+    return genres, out_files
+
+
+def get_reference_draft(org: str, new_id: str = 'default') -> cobra.Model:
+    """
+    Get the draft GENRE made from only the genes of a KEGG organism.
+
+    Reference drafts are cached on disk for each organism (and universal model
+    and gene map version), so they are only built the first time.
+    """
+    key = {'universal': resources.get_universal_version(), 'genes': resources.get_gene_map_version(), 'org': org}
+    key = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    path = resources.get_cache_dir().joinpath('drafts', f'{org}-{key[:16]}.snapshot')
+    try:
+        draft_genre = snapshot.read_snapshot(path, key)
+    except (OSError, errors.SnapshotError):
+        _, gene_modelseed, _, gene_names = load_databases(load_universal=False)
+        rxns = genes_to_rxns(set(), gene_modelseed, org)
+        draft_genre = create_model(rxns, resources.get_universal_catalog(), 'default')
+        draft_genre = add_names(draft_genre, gene_names)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            snapshot.write_snapshot(draft_genre, path, key, include_solver=False)
+        except OSError:
+            pass
+    if new_id != 'default':
+        draft_genre.id = new_id
+    return draft_genre
+
+
+def load_databases(load_universal: bool = True) -> tuple[Path, Mapping[str, list[str]], Optional[cobra.Model], Mapping[str, str]]:
+    """
+    Load the GENRE construction databases.
+
+    Returns the path to the KEGG peptide DIAMOND database, the gene to ModelSEED
+    reaction map, the universal model and the gene name map. Each of them is
+    cached after it is first loaded, so this is only slow the first time it is
+    called in a process. The universal model is only needed for gap-filling
+    (drafts are built from the universal catalog), so if `load_universal` is
+    False it isn't loaded and None is returned in its place.
+    """
+    print('Loading GENRE construction databases...')
+    kegg_prot_db = resources.get_diamond_db_path()
+    print('\r[                                         ]', end='', flush=True)
+    gene_modelseed = resources.get_gene_mseed_map()
+    print('\r[---------------                          ]', end='', flush=True)
+    universal = resources.get_universal_model() if load_universal else None
+    resources.get_universal_catalog()
+    print('\r[------------------------------           ]', end='', flush=True)
+    gene_names = resources.get_gene_name_map()
+    print('\r[-----------------------------------------]')
+    return kegg_prot_db, gene_modelseed, universal, gene_names
+
+
+def _remove_new_constraints(model: cobra.Model, keep: set[str]):
+    new_constraints = [c for c in model.constraints if c.name not in keep]
+    if len(new_constraints) != 0:
+        model.solver.remove(new_constraints)
+
+
+def infer_gram(
+        draft_genre: cobra.Model,
+        universal: cobra.Model,
+        media: list[str],
+        metabolic_tasks: list[str],
+        min_frac: float,
+        max_frac: float,
+        file_type: int,
+        gapfill_options: GapfillOptions = GapfillOptions(),
+        time_limit: Optional[float] = None
+    ) -> tuple[str, Optional[tuple[set[str], tuple[float, float]]]]:
+    """
+    Infer the Gram type of a draft GENRE by running the first gap-filling step
+    (`_gapfill` with `gapfill_options` and `time_limit`) with both Gram
+    objectives, in two forked processes that share the draft and the universal
+    model. The type whose
+    objective needs fewer added reactions is chosen (among those that the
+    universal model can grow with), and on a tie the type whose biomass
+    precursors the draft already has more of. Returns the Gram type and the
+    chosen first step (see the `step_1` argument of `_gapfill`), which is None
+    if it was memoized.
+    """
+    args = (draft_genre, universal, media, metabolic_tasks)
+    options = {'first_step_only': True}
+    if 'fork' in multiprocessing.get_all_start_methods() and not multiprocessing.current_process().daemon:
+        context = multiprocessing.get_context('fork')
+        children = []
+        for obj in GRAM_OBJECTIVES.values():
+            receiver, sender = context.Pipe(duplex=False)
+            child = context.Process(
+                target=_send_result,
+                args=(
+                    sender, _gapfill,
+                    (*args, obj, min_frac, max_frac, file_type, 'none', gapfill_options, time_limit), options
+                )
+            )
+            child.start()
+            sender.close()
+            children.append((obj, child, receiver))
+        results = {}
+        for obj, child, receiver in children:
+            try:
+                succeeded, result = receiver.recv()
+            except EOFError:
+                succeeded, result = False, errors.ReconstructorError(f'Gap-filling with {obj} stopped unexpectedly')
+            child.join()
+            if not succeeded:
+                raise result
+            results[obj] = result
+    else:
+        # Batch workers can't start processes of their own
+        print('WARNING: Inferring the Gram type in a batch worker, so both objectives are gap-filled in turn')
+        results = {
+            obj: _gapfill(*args, obj, min_frac, max_frac, file_type, 'none', gapfill_options, time_limit, **options)
+            for obj in GRAM_OBJECTIVES.values()
+        }
+
+    draft_mets = set(met.id for met in draft_genre.metabolites)
+    def rank(obj):
+        new_rxn_ids, bounds = results[obj]
+        precursors = set(met.id for met in universal.reactions.get_by_id(obj).reactants)
+        return bounds is not None and bounds[1] <= 1e-6, len(new_rxn_ids), -len(precursors & draft_mets)
+    for obj, (new_rxn_ids, _) in results.items():
+        print(f'\t{obj} needs {len(new_rxn_ids)} new reaction(s)')
+
+    obj = min(results, key=rank)
+    gram_type = next(gram_type for gram_type, gram_obj in GRAM_OBJECTIVES.items() if gram_obj == obj)
+    new_rxn_ids, bounds = results[obj]
+    return gram_type, (None if bounds is None else (new_rxn_ids, bounds))
+
+
+def _send_result(connection, function, args, kwargs):
+    try:
+        result = (True, function(*args, **kwargs))
+    except Exception as e:
+        result = (False, e)
+    connection.send(result)
+    connection.close()
+
+
+def get_media_out_file(out_file: str, media_name: str, suffix: Optional[str] = None) -> str:
+    """
+    Get the output file for one media of a media set from the output file of
+    the reconstruction, e.g. 'genome.rich.sbml' for 'genome.sbml'.
+    """
+    root, ext = os.path.splitext(out_file)
+    return f'{root}.{media_name}{ext if suffix is None else suffix}'
+
+
+def write_media_presence(genres: Mapping[str, cobra.Model], path: Union[str, os.PathLike]) -> Path:
+    """
+    Write a tab-separated table of which reactions are in the GENRE of each
+    media (1 if a reaction is present and 0 otherwise).
+    """
+    present = {media_name: set(rxn.id for rxn in genre.reactions) for media_name, genre in genres.items()}
+    rxn_ids = sorted(set().union(*present.values()))
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['reaction', *present])
+        for rxn_id in rxn_ids:
+            writer.writerow([rxn_id, *(int(rxn_id in reactions) for reactions in present.values())])
+    return Path(path)
+
+
+def _gapfill(
+        draft_genre, universal, media, metabolic_tasks, universal_obj, min_frac, max_frac, file_type, gram_type,
+        gapfill_options=GapfillOptions(), time_limit=None, step_1=None, first_step_only=False
+    ) -> Union[cobra.Model, tuple[set[str], Optional[tuple[float, float]]]]:
+    """
+    Gap-fill a draft GENRE against the universal model (in one step for type 3
+    inputs and in two steps otherwise) and annotate it, solving the problems as
+    `gapfill_options` selects. If its `gapfill_memo` is 'yes', the reactions
+    added in each step are looked up in and saved to the gap-filling memo (see
+    `reconstructor.memo`). Gap-filling is stopped with a `SolverTimeLimitError`
+    if it takes longer than `time_limit` seconds.
+
+    The maximum of the objective over the universal model is reused between
+    drafts where possible (see `reconstructor.gapfill.ObjectiveMaxima`), and
+    also kept in the gap-filling memo if there is one. If the first step was already solved
+    (e.g. by `infer_gram`), `step_1` is its added reactions and objective bounds.
+    If `first_step_only` is True, only the first step is run and its added
+    reactions and objective bounds (None if they were memoized) are returned.
+    """
+    gapfill_engine, prune_hops, prune_blocked, prune_verify, gapfill_memo = gapfill_options
+    prune_hops = int(prune_hops)
+    memo = GapfillMemo() if str(gapfill_memo) == 'yes' else None
+    maxima = get_objective_maxima(universal)
+    maxima.memo = memo
+
+    # Choose how gap-filling problems are solved
+    if prune_hops > 0:
+        engine = PrunedGapfillEngine(
+            universal,
+            hops=prune_hops,
+            remove_blocked=(str(prune_blocked) == 'yes'),
+            verify=(str(prune_verify) == 'yes'),
+            kind=gapfill_engine
+        )
+        _find_reactions = partial(engine.find_reactions, objective_maxima=maxima)
+    elif gapfill_engine == 'bag':
+        engine = None
+        def _find_reactions(model, tasks, obj, fraction, max_fraction, step, file_type):
+            # Only the first step starts without objective constraints of earlier steps
+            return find_reactions(
+                model, universal, tasks, obj, fraction, max_fraction, step, file_type,
+                fast_path=(step == 1), objective_maxima=(maxima if step == 1 else None)
+            )
+    else:
+        engine = get_engine(gapfill_engine, universal)
+        _find_reactions = partial(engine.find_reactions, objective_maxima=maxima)
+
+    # Changes to the universal model are reverted when leaving this context so
+    # that it can be reused for the next reconstruction
+    universal_constraints = set(c.name for c in universal.constraints)
+    timer = Watchdog(time_limit)
+    try:
+        with universal:
+
+            # Set media condition
+            set_media(universal, media)
+
+            # Reuse the results of an identical earlier gap-filling problem
+            memoized = None
+            if memo is not None:
+                memo_key = memo.key(
+                    draft_genre, resources.get_universal_version(), media_key(universal), metabolic_tasks,
+                    universal_obj, min_frac, max_frac, file_type,
+                    engine=[
+                        gapfill_engine, prune_hops, str(prune_blocked), str(prune_verify),
+                        interface_to_str(universal.problem)
+                    ]
+                )
+                memoized = memo.get(memo_key)
+                if memoized is not None:
+                    print('Using memoized gap-filling results')
+            found = []
+
+            def find(model, step):
+                if memoized is not None:
+                    result = memoized[step - 1]
+                elif step == 1 and step_1 is not None:
+                    result, bounds = step_1
+                    # The next step is constrained by the objective bounds of this one
+                    if engine is not None:
+                        engine.add_objective_bounds(universal_obj, bounds)
+                    else:
+                        universal.solver.add(universal.problem.Constraint(
+                            universal.reactions.get_by_id(universal_obj).flux_expression, lb=bounds[0], ub=bounds[1]
+                        ))
+                else:
+                    with timer.limit_solver(universal):
+                        result = _find_reactions(model, metabolic_tasks, universal_obj, min_frac, max_frac, step, file_type)
+                    timer.check()
+                found.append(result)
+                return result
+
+            # Gapfill new model
+            if file_type != 3:
+                print('Identifying new metabolism (Step 1 of 2)...')
+            if file_type == 3:
+                print('Identifying new metabolism...')
+            new_reactions = find(draft_genre, 1)
+            print(new_reactions)
+            if first_step_only:
+                if memoized is not None:
+                    return new_reactions, None
+                if engine is not None:
+                    return new_reactions, engine.objective_bounds(universal_obj)
+                constraint = [c for c in universal.constraints if c.name not in universal_constraints][-1]
+                return new_reactions, (constraint.lb, constraint.ub)
+            filled_genre = gapfill_model(draft_genre, universal, new_reactions, universal_obj, 1)
+            if file_type != 3:
+                print('Identifying new metabolism (Step 2 of 2)...')
+                filled_genre = set_base_inputs(filled_genre, universal)
+                media_reactions = find(filled_genre, 2)
+                final_genre = gapfill_model(filled_genre, universal, media_reactions, universal_obj, 2)
+                final_genre = add_annotation(final_genre, gram_type)
+            else:
+                final_genre = add_annotation(filled_genre, universal_obj)
+            if memo is not None and memoized is None:
+                memo.put(memo_key, found)
+    finally:
+        maxima.memo = None
+        if memo is not None:
+            memo.close()
+        # The objective constraints added while gap-filling are not reverted by
+        # the context, so remove them before the next reconstruction
+        if engine is not None:
+            engine.reset()
+        else:
+            _remove_new_constraints(universal, universal_constraints)
+
+    return final_genre
+
+
+def get_default_out_file(input_file: str, file_type: int, new_id: str, org: str) -> str:
+    """
+    Get the name of the output GENRE file used when no name is given.
+    """
+    input_file = input_file.split('/')[-1] # write to working directory
+    if file_type == 1:
+        if new_id != 'default':
+            out_file = input_file.rstrip('fastn') + new_id + '.sbml'
+        else:
+            out_file = input_file.rstrip('fastn') + 'sbml'
+    elif file_type == 2:
+        if new_id != 'default':
+            if input_file != 'none':
+                out_file = input_file.rstrip('out') + new_id + '.sbml'
+            else:
+                out_file = new_id + '.sbml'
+        else:
+            if org != 'default':
+                out_file = org + '.sbml'
+            else:
+                out_file = input_file.rstrip('out') + 'sbml'
+    elif file_type == 3:
+        if new_id != 'default':
+            out_file = input_file.rstrip('sbml') + new_id + '.extended.sbml'
+        else:
+            out_file = input_file.rstrip('sbml') + 'extended.sbml'
+    return out_file
+
+
+def run_test_suite(cpu: int = 1, diamond_version: Optional[str] = None, skip_diamond: bool = False):
+    """
+    Run the installation tests, downloading DIAMOND and the DIAMOND database
+    first if needed.
+    """
+
+    # Download a diamond binary if needed
+    if diamond_version is not None:
+        print(f"Getting DIAMOND v{diamond_version} from https://github.com/bbuchfink/diamond/releases")
+        download_diamond(diamond_version=diamond_version)
+    if not skip_diamond:
+        try:
+            diamond = Diamond()
+        except errors.DiamondNotFoundError:
+            print("DIAMOND not found...getting DIAMOND from https://github.com/bbuchfink/diamond/releases")
+            download_diamond()
+            diamond = Diamond()
+        finally:
+            print(f"Using DIAMOND v{diamond.get_version()} at {diamond.path}")
+
+    # Download the diamond database file if it hasn't been downloaded yet
+    diamond_db_path = resources.get_diamond_db_path()
+    if not diamond_db_path.exists():
+        print("Downloading the DIAMOND database for blasting...")
+        resources.download_diamond_db()
+        print("Done")
+
+    # Run the three tests (each with a different input file)
+    # - 488.146.clean.fa: an amino acid .fasta file used to test a type 1 input to reconstructor
+    # - JCP8151B.KEGGprot.out: a blast output file used to test a type 2 input to reconstructor
+    # - fmt.metaG.01044A.bin.149.KEGGprot.sbml: a .sbml genre used to test a type three input to reconstructor
+    test_file_names = ["488.146.clean.fa", "JCP8151B.KEGGprot.out", "fmt.metaG.01044A.bin.149.KEGGprot.sbml"]
+    input_types = [1, 2, 3]
+    test_num = 0
+    for test_file_name, input_type in zip(test_file_names, input_types):
+        test_num += 1
+        print(f"Performing test {test_num}")
+
+        # Temporary directory to hold test files (and clean them up after test finishes)
+        with TemporaryDirectory(dir=resources.RESOURCE_DIR) as tempdir:
+
+            # Extract the test file
+            with zipfile.ZipFile(resources.RESOURCE_DIR.joinpath("testfiles.zip")) as archive:
+                test_file = archive.extract(test_file_name, tempdir)
+
+            # Run reconstructor (in this process, so the databases are only loaded once)
+            output_file = Path(test_file).with_suffix(".out.sbml")
+            try:
+                reconstruct(test_file, file_type=input_type, out=str(output_file), gram='negative', cpu=cpu)
+            except Exception as e:
+                raise errors.ReconstructorError(f"Test {test_num} failed with an error") from e
@@ -0,0 +1,219 @@
+"""
+Lazy, read-only catalog of the universal model's reactions.
+
+Building a draft GENRE only needs copies of a few thousand universal reactions,
+but the universal cobra model holds all of its reactions and metabolites as
+full objects with their own solver variables. A `UniversalCatalog` holds the
+same reactions as small `__slots__` records instead (stoichiometry, bounds,
+names and annotations) and only creates cobra objects for the reactions that
+are pulled into a draft.
+
+The catalog implements the part of the cobra model interface that drafting
+uses (`catalog.reactions.has_id(id)` and `catalog.reactions.get_by_id(id).copy()`),
+so it can be passed to `create_model`, `gapfill_model` and `set_base_inputs`
+in place of the universal model. It is saved to the cache directory, so
+drafting doesn't need the universal cobra model to be loaded at all.
+"""
+
+from typing import Iterator, Optional, Union
+from pathlib import Path
+import os
+import pickle
+
+import cobra
+
+
+CATALOG_VERSION = 1
+
+
+class MetaboliteRecord:
+    __slots__ = ("id", "name", "formula", "charge", "compartment", "annotation", "notes")
+
+    def __init__(self, id, name, formula, charge, compartment, annotation, notes):
+        self.id = id
+        self.name = name
+        self.formula = formula
+        self.charge = charge
+        self.compartment = compartment
+        self.annotation = annotation
+        self.notes = notes
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_metabolite(cls, metabolite: cobra.Metabolite) -> "MetaboliteRecord":
+        return cls(
+            metabolite.id, metabolite.name, metabolite.formula, metabolite.charge, metabolite.compartment,
+            dict(metabolite.annotation), dict(metabolite.notes)
+        )
+
+    def copy(self) -> cobra.Metabolite:
+        """
+        Create a new cobra Metabolite from this record.
+        """
+        metabolite = cobra.Metabolite(self.id, self.formula, self.name, self.charge, self.compartment)
+        metabolite.annotation = dict(self.annotation)
+        metabolite.notes = dict(self.notes)
+        return metabolite
+
+
+class ReactionRecord:
+    __slots__ = (
+        "id", "name", "subsystem", "lower_bound", "upper_bound", "metabolites", "gene_reaction_rule",
+        "annotation", "notes", "_catalog"
+    )
+
+    def __init__(self, id, name, subsystem, lower_bound, upper_bound, metabolites, gene_reaction_rule, annotation, notes, catalog=None):
+        self.id = id
+        self.name = name
+        self.subsystem = subsystem
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.metabolites = metabolites  # tuple of (metabolite ID, coefficient)
+        self.gene_reaction_rule = gene_reaction_rule
+        self.annotation = annotation
+        self.notes = notes
+        self._catalog = catalog
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__[:-1])
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+        self._catalog = None
+
+    @classmethod
+    def from_reaction(cls, reaction: cobra.Reaction) -> "ReactionRecord":
+        return cls(
+            reaction.id, reaction.name, reaction.subsystem, reaction.lower_bound, reaction.upper_bound,
+            tuple((metabolite.id, coefficient) for metabolite, coefficient in reaction.metabolites.items()),
+            reaction.gene_reaction_rule, dict(reaction.annotation), dict(reaction.notes)
+        )
+
+    @property
+    def bounds(self) -> tuple[float, float]:
+        return self.lower_bound, self.upper_bound
+
+    def copy(self) -> cobra.Reaction:
+        """
+        Create a new cobra Reaction (with new metabolites) from this record.
+        """
+        return self._catalog.materialize([self.id])[0]
+
+
+class RecordList:
+    """
+    Read-only collection of records with the lookup methods of a cobra DictList.
+    """
+
+    def __init__(self, records: dict):
+        self._records = records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator:
+        return iter(self._records.values())
+
+    def __contains__(self, item) -> bool:
+        return getattr(item, "id", item) in self._records
+
+    def has_id(self, id: str) -> bool:
+        return id in self._records
+
+    def get_by_id(self, id: str):
+        return self._records[id]
+
+
+class UniversalCatalog:
+    """
+    Read-only catalog of the reactions and metabolites of a universal model.
+    """
+
+    def __init__(self, reactions: list[ReactionRecord], metabolites: list[MetaboliteRecord], id: str = "universal"):
+        self.id = id
+        self.metabolites = {metabolite.id: metabolite for metabolite in metabolites}
+        self._reactions = {reaction.id: reaction for reaction in reactions}
+        for reaction in reactions:
+            reaction._catalog = self
+        self.reactions = RecordList(self._reactions)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.id} with {len(self._reactions)} reactions>"
+
+    def __getstate__(self):
+        return self.id, list(self._reactions.values()), list(self.metabolites.values())
+
+    def __setstate__(self, state):
+        id, reactions, metabolites = state
+        self.__init__(reactions, metabolites, id)
+
+    @classmethod
+    def from_model(cls, model: cobra.Model) -> "UniversalCatalog":
+        """
+        Make a catalog of the reactions and metabolites of a cobra model.
+        """
+        return cls(
+            [ReactionRecord.from_reaction(reaction) for reaction in model.reactions],
+            [MetaboliteRecord.from_metabolite(metabolite) for metabolite in model.metabolites],
+            model.id
+        )
+
+    def materialize(self, reaction_ids) -> list[cobra.Reaction]:
+        """
+        Create cobra Reactions for the given reaction IDs (skipping IDs that
+        aren't in the catalog). The reactions share their metabolite objects.
+        """
+        metabolites = {}
+        reactions = []
+        for rxn_id in reaction_ids:
+            record = self._reactions.get(rxn_id)
+            if record is None:
+                continue
+            reaction = cobra.Reaction(record.id, record.name, record.subsystem, record.lower_bound, record.upper_bound)
+            stoichiometry = {}
+            for met_id, coefficient in record.metabolites:
+                if met_id not in metabolites:
+                    metabolites[met_id] = self.metabolites[met_id].copy()
+                stoichiometry[metabolites[met_id]] = coefficient
+            reaction.add_metabolites(stoichiometry)
+            if record.gene_reaction_rule:
+                reaction.gene_reaction_rule = record.gene_reaction_rule
+            reaction.annotation = dict(record.annotation)
+            reaction.notes = dict(record.notes)
+            reactions.append(reaction)
+        return reactions
+
+
+def write_catalog(catalog: UniversalCatalog, path: Union[str, os.PathLike], source_digest: str) -> Path:
+    """
+    Save a catalog to a file, along with the digest of the model it was made
+    from.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump((CATALOG_VERSION, source_digest, catalog), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_catalog(path: Union[str, os.PathLike], source_digest: Optional[str] = None) -> Optional[UniversalCatalog]:
+    """
+    Load a saved catalog. Returns None if the file is from another catalog
+    version or (if `source_digest` is given) was made from another model.
+    """
+    with open(path, "rb") as f:
+        try:
+            version, digest, catalog = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+            return None
+    if version != CATALOG_VERSION or (source_digest is not None and digest != source_digest):
+        return None
+    return catalog
@@ -0,0 +1,206 @@
+"""
+Cross-genome protein deduplication before alignment.
+
+Genomes in a batch (especially metagenome bins) often share identical protein
+sequences. `align_batch` streams all of the input FASTA files, identifies each
+sequence by a hash of its residues, and aligns every unique sequence only once
+in a single DIAMOND run. The hits are then fanned back out to each genome.
+
+The unique sequences are aligned in the same way as a single genome (see
+`reconstructor._funcs.stream_blast`), so the sensitivity, alignment mode,
+sub-database and DIAMOND memory options of a reconstruction apply to them too.
+
+The hit of every aligned sequence is also stored in a persistent hit index (one
+per database, DIAMOND version and set of options), so sequences that have been
+aligned in an earlier batch are not aligned again.
+"""
+
+from typing import Iterable, Iterator, Optional, Sequence, Union
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import hashlib
+import json
+import os
+import sqlite3
+
+from reconstructor.alignment_cache import AlignmentCache, result_options
+from reconstructor.diamond import Diamond
+from reconstructor import resources
+
+
+def read_fasta(path: Union[str, os.PathLike]) -> Iterator[tuple[str, str]]:
+    """
+    Stream the (header, sequence) records of a FASTA file.
+    """
+    header = None
+    chunks = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(chunks)
+                header = line[1:]
+                chunks = []
+            elif line:
+                chunks.append(line)
+    if header is not None:
+        yield header, "".join(chunks)
+
+
+def sequence_hash(sequence: str) -> str:
+    """
+    Get the hash that identifies a protein sequence (ignoring case and a
+    trailing stop codon).
+    """
+    return hashlib.sha1(sequence.upper().rstrip("*").encode()).hexdigest()
+
+
+class HitIndex:
+    """
+    Persistent index of the DIAMOND hits of protein sequence hashes. Sequences
+    without a hit are recorded too, so they aren't aligned again.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), timeout=60)
+        # Sequences without a hit have a single row with an empty target
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS hits (seq_hash TEXT NOT NULL, target TEXT NOT NULL, PRIMARY KEY (seq_hash, target))"
+        )
+        self._connection.commit()
+
+    def __enter__(self) -> "HitIndex":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(DISTINCT seq_hash) FROM hits").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def lookup(self, seq_hashes: Iterable[str]) -> dict[str, set[str]]:
+        """
+        Get the indexed hits of the given sequence hashes. Hashes that haven't
+        been aligned yet are left out; hashes without a hit map to an empty set.
+        """
+        found = {}
+        seq_hashes = list(seq_hashes)
+        for i in range(0, len(seq_hashes), 500):
+            chunk = seq_hashes[i:i + 500]
+            query = f"SELECT seq_hash, target FROM hits WHERE seq_hash IN ({','.join('?' * len(chunk))})"
+            for seq_hash, target in self._connection.execute(query, chunk):
+                targets = found.setdefault(seq_hash, set())
+                if target:
+                    targets.add(target)
+        return found
+
+    def add(self, hits: dict[str, set[str]]):
+        """
+        Add aligned sequence hashes and their hits to the index.
+        """
+        rows = [(seq_hash, target) for seq_hash, targets in hits.items() for target in (targets or [""])]
+        with self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO hits VALUES (?, ?)", rows)
+
+
+def get_hit_index(
+        database: Union[str, os.PathLike],
+        diamond_version: str,
+        sensitivity: str = "more-sensitive",
+        mode: str = "single",
+        subdb: Optional[Union[str, os.PathLike]] = None
+    ) -> HitIndex:
+    """
+    Get the persistent hit index for a database, DIAMOND version and the
+    alignment options that change the hits.
+    """
+    cache = AlignmentCache()
+    key = {
+        "database": cache.database_digest(database),
+        "diamond": diamond_version,
+        "options": result_options([f"--{sensitivity}", "--max-target-seqs", "1"]),
+        "mode": mode,
+        "subdb": cache.database_digest(subdb) if subdb is not None else None
+    }
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return HitIndex(resources.get_cache_dir().joinpath("hits", f"{digest}.sqlite"))
+
+
+def align_batch(
+        fasta_files: Sequence[Union[str, os.PathLike]],
+        database: Union[str, os.PathLike],
+        processors: Union[int, str] = 1,
+        sensitivity: str = "more-sensitive",
+        mode: str = "single",
+        subdb: Optional[Union[str, os.PathLike]] = None,
+        diamond_options: Sequence[str] = (),
+        use_index: bool = True
+    ) -> dict[str, set[str]]:
+    """
+    Align the proteins of many FASTA files against a database, aligning each
+    unique sequence only once.
+
+    `sensitivity`, `mode`, `subdb` and `diamond_options` have the same meaning
+    as for `reconstructor._funcs.stream_blast`. Returns the set of KEGG gene
+    hits of each FASTA file (the same sets that `stream_blast` would return for
+    the file on its own), keyed by the file path as given.
+    """
+    # _funcs reads FASTA files with this module
+    from reconstructor._funcs import align_query_hits
+
+    diamond = Diamond()
+
+    # Hash every sequence of every genome
+    genome_hashes = {}
+    unique = {}
+    for fasta in fasta_files:
+        hashes = set()
+        for _, sequence in read_fasta(fasta):
+            seq_hash = sequence_hash(sequence)
+            hashes.add(seq_hash)
+            unique.setdefault(seq_hash, sequence)
+        genome_hashes[str(fasta)] = hashes
+    total = sum(len(hashes) for hashes in genome_hashes.values())
+
+    index = get_hit_index(database, diamond.get_version(), sensitivity, mode, subdb) if use_index else None
+    try:
+        known = index.lookup(unique) if index is not None else {}
+        todo = [seq_hash for seq_hash in unique if seq_hash not in known]
+        print(
+            f'{len(fasta_files)} genome(s) have {total} protein(s), {len(unique)} unique; '
+            f'{len(unique) - len(todo)} already aligned, aligning {len(todo)}'
+        )
+
+        # Align the new unique sequences in one DIAMOND run
+        hits = dict(known)
+        if len(todo) != 0:
+            with TemporaryDirectory() as tempdir:
+                query = Path(tempdir).joinpath("unique.fa")
+                with open(query, "w") as f:
+                    for seq_hash in todo:
+                        f.write(f">{seq_hash}\n{unique[seq_hash]}\n")
+                new_hits = {seq_hash: set() for seq_hash in todo}
+                new_hits.update(align_query_hits(
+                    str(query), str(database), str(processors), mode=mode, sensitivity=sensitivity,
+                    subdb=(str(subdb) if subdb is not None else None), diamond_options=diamond_options
+                ))
+            if index is not None:
+                index.add(new_hits)
+            hits.update(new_hits)
+    finally:
+        if index is not None:
+            index.close()
+
+    # Fan the hits back out to each genome
+    genome_hits = {}
+    for fasta, hashes in genome_hashes.items():
+        genome_hits[fasta] = set()
+        for seq_hash in hashes:
+            genome_hits[fasta] |= hits[seq_hash]
+    return genome_hits
@@ -1,7 +1,7 @@
-from typing import Optional, Callable, Any, Union, Sequence
+from typing import Optional, Callable, Any, Union, Sequence, Iterator, TextIO
 import tarfile
 import zipfile
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, TemporaryFile
 import os
 import platform
 from urllib import request
@@ -11,6 +11,7 @@ import shutil
 from importlib import resources
 import subprocess
 import re
+from contextlib import contextmanager
 
 from reconstructor import errors
 
@@ -70,6 +71,67 @@ class Diamond:
         args.extend(options)
         return self.__call__(args, **sp_kwargs)
     
+    def blastp_stream(
+            self,
+            db: Union[str, bytes, os.PathLike],
+            query: Union[str, bytes, os.PathLike],
+            *options: str,
+            tee: Optional[TextIO] = None
+        ) -> Iterator[str]:
+        """
+        Run blastp and yield the lines of its tabular output as DIAMOND writes
+        them, instead of writing them to an output file first. If `tee` is
+        given, every line is also written to it.
+        """
+        args = ["blastp", "--db", db, "--query", query, *options]
+        return self.stream(args, tee=tee)
+
+    def getseq_stream(self, db: Union[str, bytes, os.PathLike], *options: str) -> Iterator[str]:
+        """
+        Yield the lines of the FASTA sequences stored in a database.
+        """
+        return self.stream(["getseq", "--db", db, *options])
+
+    def makedb(
+            self,
+            fasta: Union[str, bytes, os.PathLike],
+            db: Union[str, bytes, os.PathLike],
+            *options: str,
+            **sp_kwargs
+        ):
+        args = ["makedb", "--in", fasta, "--db", db]
+        args.extend(options)
+        return self.__call__(args, **sp_kwargs)
+
+    def makeidx(self, db: Union[str, bytes, os.PathLike], *options: str, **sp_kwargs):
+        """
+        Build DIAMOND's precomputed seed index of a database. The index is
+        saved next to the database and used automatically by later searches
+        with the same sensitivity.
+        """
+        args = ["makeidx", "--db", db]
+        args.extend(options)
+        return self.__call__(args, **sp_kwargs)
+
+    def stream(self, options: Sequence[str], tee: Optional[TextIO] = None) -> Iterator[str]:
+        """
+        Run DIAMOND and yield the lines it writes to stdout as they are written.
+        If `tee` is given, every line is also written to it.
+        """
+        args = [self.path, *options]
+        # stderr goes to a file so that a chatty DIAMOND can't fill the pipe
+        # and block while we're reading stdout
+        with TemporaryFile("w+") as stderr:
+            with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr, text=True, bufsize=1024**2) as process:
+                for line in process.stdout:
+                    if tee is not None:
+                        tee.write(line)
+                    yield line
+            if process.returncode != 0:
+                stderr.seek(0)
+                error = subprocess.CalledProcessError(process.returncode, args, stderr=stderr.read())
+                raise errors.DiamondProcessError(error)
+
     def get_version(self):
         args = ["version"]
         result: subprocess.CompletedProcess[str] = self.__call__(args, capture_output=True, text=True)
@@ -78,6 +140,83 @@ class Diamond:
         return version
     
 
+def get_index_path(db: Union[str, os.PathLike]) -> str:
+    """
+    Get the path of the precomputed seed index of a database.
+    """
+    return f"{os.fspath(db)}.seed_idx"
+
+
+def memory_options(memory: float) -> list[str]:
+    """
+    Get the --block-size and --index-chunks options that make the most of a
+    memory budget (in GB).
+
+    DIAMOND uses roughly 6 times the block size (in GB) with the default 4
+    index chunks, and roughly (2 + 16 / chunks) times the block size in
+    general. Larger blocks are faster, as are fewer chunks, so the fewest
+    chunks that still allow a block size of at least 2 are used.
+    """
+    if memory <= 0:
+        raise ValueError("The DIAMOND memory budget must be positive")
+    for chunks in (1, 2, 4):
+        block_size = memory / (2 + 16 / chunks)
+        if block_size >= 2:
+            break
+    block_size = max(round(block_size, 1), 0.1)
+    return ["--block-size", str(block_size), "--index-chunks", str(chunks)]
+
+
+def stage_database(db: Union[str, os.PathLike], stage_dir: Union[str, os.PathLike]) -> str:
+    """
+    Copy a database (and its seed index, if it has one) to a local fast path
+    such as a tmpfs directory and return the path of the copy.
+
+    The copy is only made once per node: concurrent runs wait for the first
+    one to finish copying, and later runs reuse the copy as long as its size
+    and modification time still match the original.
+    """
+    os.makedirs(stage_dir, exist_ok=True)
+    staged = os.path.join(stage_dir, os.path.basename(db))
+    files = [(os.fspath(db), staged)]
+    if os.path.exists(get_index_path(db)):
+        files.append((get_index_path(db), get_index_path(staged)))
+
+    with _file_lock(os.path.join(stage_dir, ".stage.lock")):
+        for source, target in files:
+            source_stat = os.stat(source)
+            try:
+                target_stat = os.stat(target)
+            except FileNotFoundError:
+                target_stat = None
+            if target_stat is not None and (target_stat.st_size, target_stat.st_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns):
+                continue
+            print(f"Staging {source} to {target}")
+            tmp_target = f"{target}.{os.getpid()}.tmp"
+            shutil.copy2(source, tmp_target)
+            os.replace(tmp_target, target)
+    return staged
+
+
+@contextmanager
+def _file_lock(path: str):
+    """
+    Hold an exclusive lock on a file (only between processes on the same node,
+    and not at all on Windows).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def get_diamond_path(name: Optional[str] = None) -> Optional[str]:
     """
     Get the path to a DIAMOND executable or raise an error if one is not found.
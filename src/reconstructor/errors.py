@@ -60,3 +60,19 @@ class DiamondProcessError(DiamondError, subprocess.CalledProcessError):
             output=error.output,
             stderr=error.stderr
         )
+
+
+class SnapshotError(ReconstructorError):
+    """
+    The error raised if a universal model snapshot cannot be used (e.g. it is
+    corrupted, out of date, or was written with a different format version).
+    """
+    pass
+
+
+class SolverTimeLimitError(ReconstructorError):
+    """
+    The error raised if a gap-filling LP, or all of the gap-filling of a genome,
+    takes longer than the time limit.
+    """
+    pass
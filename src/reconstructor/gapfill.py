@@ -0,0 +1,822 @@
+"""
+Gap-filling engines that reuse one LP for many gap-filling problems.
+
+`reconstructor._funcs.find_reactions` rebuilds its pFBA problem from scratch for
+every call: it removes each draft reaction from the universal model, adds a
+copy back, adds an objective constraint and assembles a new objective over every
+reaction, and then the context manager undoes all of it. The engines in this
+module build the parts of that problem that are the same for every draft once,
+and express each draft only through changes to bounds and objective
+coefficients. Because the solver problem is kept between solves, the solver can
+also start from the basis of the previous solve.
+
+Engines give the same results as `find_reactions` (including the objective
+constraints of earlier steps staying active until the engine is reset, which is
+what happens to the universal model in `find_reactions`) and are selected with
+the `gapfill_engine` argument of `reconstruct`.
+"""
+
+from typing import Optional
+import hashlib
+import json
+import warnings
+
+import numpy as np
+import cobra
+from optlang.symbolics import Zero
+
+from reconstructor import errors
+from reconstructor.media import set_bounds
+from reconstructor.solver import check_status, reset_basis, solve_counting_iterations, solver_time_limit
+
+
+GAPFILL_ENGINES = ('bag', 'persistent', 'matrix')
+
+FAST_PATH_MESSAGE = '\tThe draft already meets the objective bounds, skipped the gap-filling LP'
+
+_ENGINES = {}
+_OBJECTIVE_MAXIMA = {}
+
+
+def get_engine(kind: str, universal: cobra.Model) -> "GapfillEngine":
+    """
+    Get the gap-filling engine of the given kind for a universal model.
+
+    Engines are cached, so the same engine is returned for every call with the
+    same universal model (as long as its solver isn't changed).
+    """
+    if kind not in _ENGINE_CLASSES:
+        raise errors.ReconstructorError(
+            f"Unknown gap-filling engine {kind!r} (choose from {', '.join(GAPFILL_ENGINES)})"
+        )
+    key = (kind, id(universal))
+    engine = _ENGINES.get(key)
+    if engine is None or engine.universal is not universal or engine.solver is not universal.solver:
+        engine = _ENGINE_CLASSES[kind](universal)
+        _ENGINES[key] = engine
+    return engine
+
+
+class GapfillEngine:
+    """
+    pFBA gapfiller that keeps its problem in the solver of the universal model.
+
+    Draft reactions that are already in the universal model (with the same
+    stoichiometry) are not removed and re-added; instead their bounds are set to
+    the draft's bounds and their costs are set to zero. Only draft reactions that
+    are missing from the universal model, or that have a different stoichiometry
+    there, are added to it for the duration of a solve. The objective constraint
+    for each objective reaction is added to the solver once and is then only
+    re-bounded. All changes other than the objective constraint bounds are
+    reverted after each solve, so the universal model can still be shared.
+
+    The engine assumes that reactions are not added to or removed from the
+    universal model outside of the engine once it has been created.
+
+    Because the problem stays in the solver, step 2 of a reconstruction is only
+    a change to the problem of step 1: the objective constraint is tightened,
+    the base inputs are bounded and the reactions added in step 1 become free.
+    The solver starts step 2 from the basis of step 1 instead of from scratch
+    (unless `warm_start` is False). The simplex iterations of the LPs of each
+    step are kept in `iterations` (for glpk, cplex and gurobi). If
+    `measure_cold_start` is True, the gap-filling LP of step 2 is solved a
+    second time from a reset basis (for glpk and gurobi), and the iterations of
+    both solves are kept in `step_2_iterations` as (warm, cold) and reported.
+
+    If `fast_path` is True, the gap-filling LP is skipped when the draft alone
+    already meets the objective bounds (see `draft_meets_objective`).
+    """
+
+    fast_path = True
+
+    def __init__(self, universal: cobra.Model, warm_start: bool = True, measure_cold_start: bool = False):
+        self.universal = universal
+        self.solver = universal.solver
+        self.warm_start = warm_start
+        self.measure_cold_start = measure_cold_start
+        self.iterations = {}
+        self.step_2_iterations = None
+        self._costs = None
+        self._flux_names = None
+        self._obj_constraints = {}
+        self._obj_bounds = {}
+
+    def find_reactions(
+            self, model, tasks, obj, fraction, max_fraction, step, file_type, objective_maxima=None, keep=None
+        ) -> set[str]:
+        """
+        pFBA gapfiller.
+
+        Takes the same arguments as `reconstructor._funcs.find_reactions` (except
+        for the universal reaction bag, which is the engine's universal model)
+        and returns the IDs of the universal reactions that are active in the
+        minimal solution. If `keep` is given, only those universal reactions
+        (and the draft reactions) can carry flux.
+        """
+
+        print('\r[                                         ]', end="", flush=True)
+
+        universal = self.universal
+        self.prepare()
+
+        # Without objective constraints of earlier steps, the maximum objective
+        # flux can usually be taken from the cached maxima
+        obj_maximum = None
+        if objective_maxima is not None and obj not in self._obj_bounds:
+            obj_maximum = objective_maxima.maximum(model, tasks, obj, fraction, file_type, keep)
+
+        with universal:
+
+            # Express the draft as bounds on the universal model, and only add
+            # draft reactions that the universal model doesn't already have
+            orig_rxn_ids, replaced = self._apply_draft(model, obj, file_type)
+
+            # Universal reactions outside of `keep` can't carry flux
+            if keep is not None:
+                set_bounds(universal, [
+                    (rxn, (0, 0)) for rxn in universal.reactions
+                    if rxn.id not in keep and rxn.id not in orig_rxn_ids and rxn.bounds != (0, 0)
+                ])
+
+            # Set lower bounds for metaboloic tasks
+            if len(tasks) != 0:
+                for rxn in tasks:
+                    if universal.reactions.has_id(rxn):
+                        universal.reactions.get_by_id(rxn).lower_bound = fraction
+
+            print('\r[---------------                          ]', end="", flush=True)
+
+            # Objective constraints of earlier steps are still active
+            if obj in self._obj_bounds:
+                self._constrain_objective(obj, self._obj_bounds[obj], transient=(obj in replaced))
+
+            # Set minimum lower bound for previous objective
+            if obj_maximum is not None:
+                prev_obj_val, obj_iterations = obj_maximum, 0
+            else:
+                universal.objective = universal.reactions.get_by_id(obj)
+                prev_obj_val, obj_iterations = self._optimize()
+                check_status(universal)
+            if step == 1:
+                bounds = (prev_obj_val*fraction, prev_obj_val*max_fraction)
+            elif step == 2:
+                bounds = (prev_obj_val*max_fraction, prev_obj_val)
+            self._constrain_objective(obj, bounds, transient=(obj in replaced))
+
+            # The gap-filling LP can be skipped if the draft already meets the
+            # objective bounds on its own
+            new_rxn_ids = None
+            if self.fast_path:
+                new_rxn_ids = draft_meets_objective(model, universal, tasks, obj, self._obj_bounds[obj], file_type, orig_rxn_ids)
+            skipped = new_rxn_ids is not None
+            if skipped:
+                pfba_iterations = 0
+            else:
+                # Costs of all reactions, with draft reactions being free
+                costs = self._draft_costs(orig_rxn_ids, replaced)
+
+                print('\r[--------------------------               ]', end="", flush=True)
+
+                # Create objective, based on pFBA
+                universal.objective = universal.problem.Objective(Zero, direction='min', sloppy=True)
+                universal.objective.set_linear_coefficients(costs)
+
+                print('\r[----------------------------------       ]', end="", flush=True)
+
+                # Run FBA and identify reactions from universal that are now active
+                _, pfba_iterations = self._optimize()
+                new_rxn_ids = self._active_reactions().difference(orig_rxn_ids)
+
+                # Solve the same LP again from scratch to see what the warm start saved
+                if step == 2 and self.warm_start and self.measure_cold_start and reset_basis(universal):
+                    _, cold_iterations = solve_counting_iterations(universal, universal.slim_optimize)
+                    self.step_2_iterations = (pfba_iterations, cold_iterations)
+
+        # Replacing reactions gives them new solver variables
+        if len(replaced) != 0:
+            self._costs = None
+
+        print('\r[-----------------------------------------]')
+        if skipped:
+            print(FAST_PATH_MESSAGE)
+        self._report_iterations(step, obj_iterations, pfba_iterations)
+
+        return new_rxn_ids
+
+    def reset(self):
+        """
+        Remove the objective constraints left by earlier solves.
+        """
+        self.restore_objective_bounds({})
+        self.iterations.clear()
+        self.step_2_iterations = None
+
+    def restore_objective_bounds(self, obj_bounds: dict[str, tuple[float, float]]):
+        """
+        Replace the objective constraints left by earlier solves with ones
+        saved from an earlier state of the engine (e.g. to solve the same step
+        again in another way).
+        """
+        for constraint in self._obj_constraints.values():
+            constraint.ub = None
+            constraint.lb = None
+        self._obj_bounds.clear()
+        self._obj_bounds.update(obj_bounds)
+
+    def prepare(self):
+        """
+        Build the parts of the problem that are shared by every draft.
+        """
+        if self._costs is not None:
+            return
+        self._costs = {}
+        self._flux_names = []
+        for rxn in self.universal.reactions:
+            self._costs[rxn.forward_variable] = 1.0
+            self._costs[rxn.reverse_variable] = 1.0
+            self._flux_names.append((rxn.id, rxn.forward_variable.name, rxn.reverse_variable.name))
+
+    def _optimize(self) -> tuple[float, Optional[int]]:
+        """
+        Solve the problem and count the simplex iterations.
+        """
+        if not self.warm_start:
+            reset_basis(self.universal)
+        return solve_counting_iterations(self.universal, self.universal.slim_optimize)
+
+    def _report_iterations(self, step: int, obj_iterations: Optional[int], pfba_iterations: Optional[int]):
+        if obj_iterations is None or pfba_iterations is None:
+            return
+        self.iterations[step] = obj_iterations + pfba_iterations
+        if step == 2 and self.step_2_iterations is not None:
+            warm, cold = self.step_2_iterations
+            print(
+                f'\tLPs took {self.iterations[step]} simplex iterations. Starting from the basis of step 1, the '
+                f'gap-filling LP took {warm} instead of {cold} from a cold start'
+            )
+        elif step == 2 and self.warm_start:
+            print(f'\tLPs took {self.iterations[step]} simplex iterations, starting from the basis of step 1')
+        else:
+            print(f'\tLPs took {self.iterations[step]} simplex iterations')
+
+    def _apply_draft(self, model: cobra.Model, obj: str, file_type: int) -> tuple[set[str], dict[str, tuple]]:
+        """
+        Apply the draft reactions to the universal model. Returns the IDs of the
+        draft reactions and the solver variables of the universal reactions that
+        were replaced by draft reactions with a different stoichiometry.
+        """
+        universal = self.universal
+        orig_rxn_ids = set()
+        replaced = {}
+        add_rxns = []
+        for rxn in model.reactions:
+            if rxn.id == obj and file_type != 3:
+                continue
+
+            orig_rxn_ids.add(rxn.id)
+            if universal.reactions.has_id(rxn.id):
+                universal_rxn = universal.reactions.get_by_id(rxn.id)
+                if _same_stoichiometry(rxn, universal_rxn):
+                    if universal_rxn.bounds != rxn.bounds:
+                        universal_rxn.bounds = rxn.bounds
+                    continue
+                replaced[rxn.id] = (universal_rxn.forward_variable, universal_rxn.reverse_variable)
+            add_rxns.append(rxn.copy())
+
+        universal.remove_reactions(list(replaced))
+        universal.add_reactions(add_rxns)
+
+        return orig_rxn_ids, replaced
+
+    def objective_bounds(self, obj: str) -> Optional[tuple[float, float]]:
+        """
+        Get the bounds of the objective constraint left by earlier steps.
+        """
+        return self._obj_bounds.get(obj)
+
+    def add_objective_bounds(self, obj: str, bounds: tuple[float, float]):
+        """
+        Add the objective constraint of a step that was solved elsewhere (e.g.
+        in another process), so that later steps are constrained as if this
+        engine had solved it.
+        """
+        self._intersect_objective_bounds(obj, bounds)
+
+    def _intersect_objective_bounds(self, obj: str, bounds: tuple[float, float]) -> tuple[float, float]:
+        """
+        The bounds of earlier objective constraints stay active (as they would
+        in `find_reactions`), so new bounds are intersected with them.
+        """
+        lb, ub = bounds
+        prev_lb, prev_ub = self._obj_bounds.get(obj, (lb, ub))
+        lb, ub = max(lb, prev_lb), min(ub, prev_ub)
+        self._obj_bounds[obj] = (lb, ub)
+        return lb, ub
+
+    def _constrain_objective(self, obj: str, bounds: tuple[float, float], transient: bool = False):
+        """
+        Constrain the flux through the objective reaction.
+        """
+        universal = self.universal
+        lb, ub = self._intersect_objective_bounds(obj, bounds)
+
+        if transient:
+            # The objective reaction was replaced by the draft's version, so the
+            # persistent constraint doesn't refer to its variables
+            constraint = universal.problem.Constraint(universal.reactions.get_by_id(obj).flux_expression, lb=lb, ub=ub)
+            universal.add_cons_vars(constraint)
+            return
+
+        constraint = self._obj_constraints.get(obj)
+        if constraint is None:
+            constraint = universal.problem.Constraint(universal.reactions.get_by_id(obj).flux_expression)
+            universal.solver.add(constraint)
+            self._obj_constraints[obj] = constraint
+        constraint.ub = None
+        constraint.lb = lb
+        constraint.ub = ub
+        universal.solver.update()
+
+    def _draft_costs(self, orig_rxn_ids: set[str], replaced: dict[str, tuple]) -> dict:
+        costs = dict(self._costs)
+        for variables in replaced.values():
+            for var in variables:
+                del costs[var]
+        for rxn_id in orig_rxn_ids:
+            rxn = self.universal.reactions.get_by_id(rxn_id)
+            costs[rxn.forward_variable] = 0.0
+            costs[rxn.reverse_variable] = 0.0
+        return costs
+
+    def _active_reactions(self) -> set[str]:
+        check_status(self.universal)
+        status = self.universal.solver.status
+        if status != 'optimal':
+            warnings.warn(f"Gap-filling LP finished with status {status!r}; no reactions were added")
+            return set()
+        primals = self.universal.solver.primal_values
+        return set(
+            rxn_id for rxn_id, forward, reverse in self._flux_names
+            if abs(primals[forward] - primals[reverse]) > 1e-6
+        )
+
+
+class MatrixGapfillEngine(GapfillEngine):
+    """
+    pFBA gapfiller that builds its LP directly from the stoichiometric matrix.
+
+    The universal model is converted once into a sparse (CSR) stoichiometric
+    matrix, and each gap-filling problem is assembled from that matrix and
+    NumPy bound and cost vectors instead of going through the cobra reaction
+    objects and their solver variables. Problems are solved with HiGHS through
+    `scipy.optimize.linprog`, and active reactions are read back as a vectorized
+    mask over the primal values. Every reaction is split into a forward and a
+    reverse column, as in cobra, so the LP is the same as the one solved by
+    `find_reactions`. Note that if the LP has several optimal solutions, HiGHS
+    and the solver of the universal model may return different ones.
+
+    The solver of the universal model is not used, so its choice and its
+    threads and LP method settings don't apply to this engine; only its time
+    limit is passed on to HiGHS.
+
+    Requires scipy (the 'matrix' extra).
+    """
+
+    def __init__(self, universal: cobra.Model):
+        super().__init__(universal)
+        self._sparse = None
+        self._linprog = None
+        self._rxn_ids = None
+        self._rxn_index = None
+        self._met_index = None
+        self._stoichiometry = None
+
+    def find_reactions(
+            self, model, tasks, obj, fraction, max_fraction, step, file_type, objective_maxima=None, keep=None
+        ) -> set[str]:
+        """
+        pFBA gapfiller.
+
+        Takes the same arguments as `reconstructor._funcs.find_reactions` (except
+        for the universal reaction bag, which is the engine's universal model)
+        and returns the IDs of the universal reactions that are active in the
+        minimal solution. If `keep` is given, only those universal reactions
+        (and the draft reactions) can carry flux.
+        """
+
+        print('\r[                                         ]', end="", flush=True)
+
+        self.prepare()
+        sparse = self._sparse
+
+        obj_maximum = None
+        if objective_maxima is not None and obj not in self._obj_bounds:
+            obj_maximum = objective_maxima.maximum(model, tasks, obj, fraction, file_type, keep)
+
+        # Current bounds of the universal reactions (these include the media)
+        reactions = self.universal.reactions
+        lower = np.fromiter((rxn.lower_bound for rxn in reactions), dtype=float, count=len(reactions))
+        upper = np.fromiter((rxn.upper_bound for rxn in reactions), dtype=float, count=len(reactions))
+        free = np.zeros(len(reactions), dtype=bool)
+
+        # Universal reactions outside of `keep` can't carry flux
+        if keep is not None:
+            blocked = np.fromiter((rxn_id not in keep for rxn_id in self._rxn_ids), dtype=bool, count=len(reactions))
+            lower[blocked] = 0.0
+            upper[blocked] = 0.0
+
+        # Express the draft as bounds and free columns, and add columns (and rows)
+        # for draft reactions that the universal model doesn't have
+        orig_rxn_ids = set()
+        met_index = dict(self._met_index)
+        extra_ids, extra_columns, extra_lower, extra_upper = [], [], [], []
+        for rxn in model.reactions:
+            if rxn.id == obj and file_type != 3:
+                continue
+
+            orig_rxn_ids.add(rxn.id)
+            i = self._rxn_index.get(rxn.id)
+            if i is not None:
+                free[i] = True
+                if _same_stoichiometry(rxn, reactions[i]):
+                    lower[i], upper[i] = rxn.bounds
+                    continue
+                # Replaced by the draft's version
+                lower[i], upper[i] = 0.0, 0.0
+            extra_ids.append(rxn.id)
+            extra_columns.append({met_index.setdefault(met.id, len(met_index)): coef for met, coef in rxn.metabolites.items()})
+            extra_lower.append(rxn.lower_bound)
+            extra_upper.append(rxn.upper_bound)
+
+        stoichiometry = self._stoichiometry
+        if len(extra_ids) != 0:
+            rows = [row for column in extra_columns for row in column]
+            cols = [j for j, column in enumerate(extra_columns) for _ in column]
+            data = [coef for column in extra_columns for coef in column.values()]
+            extra = sparse.csr_matrix((data, (rows, cols)), shape=(len(met_index), len(extra_ids)))
+            stoichiometry = sparse.vstack([
+                stoichiometry,
+                sparse.csr_matrix((len(met_index) - stoichiometry.shape[0], stoichiometry.shape[1]))
+            ])
+            stoichiometry = sparse.hstack([stoichiometry, extra], format='csr')
+            lower = np.concatenate([lower, extra_lower])
+            upper = np.concatenate([upper, extra_upper])
+            free = np.concatenate([free, np.ones(len(extra_ids), dtype=bool)])
+        column_ids = self._rxn_ids + extra_ids
+        # Later columns win, so replaced reactions refer to the draft's version
+        column_index = {rxn_id: j for j, rxn_id in enumerate(column_ids)}
+
+        # Set lower bounds for metaboloic tasks
+        if len(tasks) != 0:
+            for rxn in tasks:
+                if rxn in column_index:
+                    lower[column_index[rxn]] = fraction
+
+        print('\r[---------------                          ]', end="", flush=True)
+
+        # Split reactions into forward and reverse columns
+        n = stoichiometry.shape[1]
+        A_eq = sparse.hstack([stoichiometry, -stoichiometry], format='csr')
+        b_eq = np.zeros(stoichiometry.shape[0])
+        bounds = np.column_stack([
+            np.concatenate([np.maximum(lower, 0.0), np.maximum(-upper, 0.0)]),
+            np.concatenate([np.maximum(upper, 0.0), np.maximum(-lower, 0.0)])
+        ])
+        obj_flux = np.zeros(2 * n)
+        obj_flux[column_index[obj]] = 1.0
+        obj_flux[n + column_index[obj]] = -1.0
+
+        # Set minimum lower bound for previous objective (maximizing the objective flux)
+        if obj_maximum is not None:
+            prev_obj_val = obj_maximum
+        else:
+            result = self._solve(-obj_flux, A_eq=A_eq, b_eq=b_eq, **self._objective_constraint(obj, obj_flux), bounds=bounds)
+            if result.status != 0:
+                warnings.warn(f"Maximizing {obj} failed ({result.message}); no reactions were added")
+                print('\r[-----------------------------------------]')
+                return set()
+            prev_obj_val = -result.fun
+        if step == 1:
+            self._intersect_objective_bounds(obj, (prev_obj_val*fraction, prev_obj_val*max_fraction))
+        elif step == 2:
+            self._intersect_objective_bounds(obj, (prev_obj_val*max_fraction, prev_obj_val))
+
+        # The gap-filling LP can be skipped if the draft already meets the
+        # objective bounds on its own. The bounds with the draft applied show
+        # whether every other universal reaction can carry no flux
+        if self.fast_path:
+            others = ~free
+            others[column_index[obj]] = False
+            new_rxn_ids = None
+            if not np.any(others & ((lower > 0) | (upper < 0))):
+                new_rxn_ids = draft_meets_objective(
+                    model, self.universal, tasks, obj, self._obj_bounds[obj], file_type, orig_rxn_ids,
+                    check_universal=False
+                )
+            if new_rxn_ids is not None:
+                print('\r[-----------------------------------------]')
+                print(FAST_PATH_MESSAGE)
+                return new_rxn_ids
+
+        print('\r[--------------------------               ]', end="", flush=True)
+
+        # Create objective, based on pFBA
+        costs = np.ones(n)
+        costs[free] = 0.0
+        costs = np.concatenate([costs, costs])
+
+        print('\r[----------------------------------       ]', end="", flush=True)
+
+        # Run FBA and identify reactions from universal that are now active
+        result = self._solve(costs, A_eq=A_eq, b_eq=b_eq, **self._objective_constraint(obj, obj_flux), bounds=bounds)
+        print('\r[-----------------------------------------]')
+        if result.status != 0:
+            warnings.warn(f"Gap-filling LP failed ({result.message}); no reactions were added")
+            return set()
+        n_universal = len(self._rxn_ids)
+        fluxes = result.x[:n_universal] - result.x[n:n + n_universal]
+        active = np.flatnonzero(np.abs(fluxes) > 1e-6)
+
+        return set(self._rxn_ids[i] for i in active).difference(orig_rxn_ids)
+
+    def prepare(self):
+        """
+        Build the stoichiometric matrix of the universal model.
+        """
+        if self._stoichiometry is not None:
+            return
+        try:
+            from scipy import sparse
+            from scipy.optimize import linprog
+        except ImportError as e:
+            raise errors.ReconstructorError(
+                "The matrix gap-filling engine requires scipy, which can be installed with: pip install scipy"
+            ) from e
+        self._sparse = sparse
+        self._linprog = linprog
+
+        universal = self.universal
+        self._rxn_ids = [rxn.id for rxn in universal.reactions]
+        self._rxn_index = {rxn_id: j for j, rxn_id in enumerate(self._rxn_ids)}
+        self._met_index = {met.id: i for i, met in enumerate(universal.metabolites)}
+        rows, cols, data = [], [], []
+        for j, rxn in enumerate(universal.reactions):
+            for met, coef in rxn.metabolites.items():
+                rows.append(self._met_index[met.id])
+                cols.append(j)
+                data.append(coef)
+        self._stoichiometry = sparse.csr_matrix(
+            (data, (rows, cols)), shape=(len(self._met_index), len(self._rxn_ids))
+        )
+
+    def _solve(self, c: np.ndarray, **kwargs):
+        """
+        Solve an LP with HiGHS, using the time limit of the universal model's
+        solver (see `reconstructor.solver.solver_time_limit`).
+        """
+        time_limit = solver_time_limit(self.universal)
+        options = {} if time_limit is None else {'time_limit': time_limit}
+        result = self._linprog(c, **kwargs, method='highs', options=options)
+        if time_limit is not None and result.status == 1 and 'time limit' in result.message.lower():
+            raise errors.SolverTimeLimitError(f"A gap-filling LP was stopped after the time limit of {time_limit} seconds")
+        return result
+
+    def _objective_constraint(self, obj: str, obj_flux: np.ndarray) -> dict:
+        """
+        Inequality constraints for the active objective constraint bounds.
+        """
+        if obj not in self._obj_bounds:
+            return {}
+        lb, ub = self._obj_bounds[obj]
+        return dict(
+            A_ub=self._sparse.csr_matrix(np.vstack([obj_flux, -obj_flux])),  # lb <= flux <= ub
+            b_ub=np.array([ub, -lb])
+        )
+
+
+def get_objective_maxima(universal: cobra.Model) -> "ObjectiveMaxima":
+    """
+    Get the objective maxima of a universal model.
+
+    Like the engines, one instance is kept for each universal model, so maxima
+    solved for one genome are reused for the next ones in the same process
+    (or in workers forked from it), with or without a gap-filling memo.
+    """
+    maxima = _OBJECTIVE_MAXIMA.get(id(universal))
+    if maxima is None or maxima.universal is not universal:
+        maxima = ObjectiveMaxima(universal)
+        _OBJECTIVE_MAXIMA[id(universal)] = maxima
+    return maxima
+
+
+def model_digest(model: cobra.Model) -> str:
+    """
+    Get a digest of the reactions of a model: their stoichiometry and, except
+    for exchanges (which depend on the media), their bounds.
+    """
+    digest = hashlib.sha256()
+    for rxn in model.reactions:
+        stoichiometry = sorted((met.id, coef) for met, coef in rxn.metabolites.items())
+        bounds = None if rxn.id.startswith('EX_') else rxn.bounds
+        digest.update(repr((rxn.id, stoichiometry, bounds)).encode())
+    return digest.hexdigest()
+
+
+def media_key(model: cobra.Model) -> str:
+    """
+    Get a key identifying the media of a model, which is a digest of the bounds
+    of its exchange reactions.
+    """
+    bounds = sorted((rxn.id, rxn.lower_bound, rxn.upper_bound) for rxn in model.reactions if rxn.id.startswith('EX_'))
+    return hashlib.sha256(repr(bounds).encode()).hexdigest()
+
+
+class ObjectiveMaxima:
+    """
+    Maximum objective fluxes over the universal model, per objective, media and
+    universal model version.
+
+    Every gap-filling problem starts by maximizing the objective over the
+    universal model with the draft applied. In the first step of gap-filling,
+    the draft usually doesn't change that maximum, so it is taken from here
+    instead of being solved for every genome (see `maximum`). Maxima are solved
+    once and kept with an optimal flux distribution (not a solver basis, since
+    the flux distribution is all that `maximum` needs), in memory and in
+    `memo`, the gap-filling memo, if it is set (see `reconstructor.memo`).
+
+    The version identifies the universal model in the memo. By default it is a
+    digest of the model's reactions (see `model_digest`), so different
+    universal models never share maxima. Use `get_objective_maxima` to get the
+    shared instance of a universal model.
+    """
+
+    def __init__(self, universal: cobra.Model, memo=None, version: Optional[str] = None):
+        self.universal = universal
+        self.memo = memo
+        self.version = model_digest(universal) if version is None else version
+        self._maxima = {}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.universal.id!r}, memo={self.memo!r})"
+
+    def get(self, obj: str) -> tuple[float, dict[str, float]]:
+        """
+        Get the maximum flux of an objective over the universal model with its
+        current media, and the nonzero fluxes of an optimal solution. Must be
+        called without any draft or objective constraints applied.
+        """
+        key = hashlib.sha256(json.dumps([self.version, media_key(self.universal), obj]).encode()).hexdigest()
+        if key in self._maxima:
+            return self._maxima[key]
+        maximum = None if self.memo is None else self.memo.get_maximum(key)
+        if maximum is None:
+            universal = self.universal
+            with universal:
+                universal.objective = universal.reactions.get_by_id(obj)
+                value = universal.slim_optimize()
+                check_status(universal)
+                primals = universal.solver.primal_values
+                fluxes = {}
+                for rxn in universal.reactions:
+                    flux = primals[rxn.forward_variable.name] - primals[rxn.reverse_variable.name]
+                    if flux != 0:
+                        fluxes[rxn.id] = flux
+            maximum = (value, fluxes)
+            if self.memo is not None:
+                self.memo.put_maximum(key, value, fluxes)
+        self._maxima[key] = maximum
+        return maximum
+
+    def maximum(
+            self,
+            model: cobra.Model,
+            tasks: list[str],
+            obj: str,
+            fraction: float,
+            file_type: int,
+            keep: Optional[set[str]] = None
+        ) -> Optional[float]:
+        """
+        Get the maximum objective flux of a gap-filling problem without solving
+        it, or None if the cached maximum can't be used for the draft.
+
+        Applying the draft can't raise the maximum if every draft reaction is a
+        universal reaction with the same stoichiometry and bounds within the
+        universal ones, and doesn't lower it if the cached optimal solution
+        still meets the draft's bounds and the metabolic tasks. Drafts with
+        reactions that the universal model doesn't have are always solved.
+        Only valid without objective constraints of earlier steps. If only the
+        universal reactions in `keep` can carry flux, the cached maximum is used
+        if its solution doesn't need any others.
+        """
+        universal = self.universal
+        if not universal.reactions.has_id(obj):
+            return None
+        value, fluxes = self.get(obj)
+        if keep is not None and not keep.issuperset(fluxes):
+            return None
+        for rxn in model.reactions:
+            if rxn.id == obj and file_type != 3:
+                continue
+            if not universal.reactions.has_id(rxn.id):
+                return None
+            universal_rxn = universal.reactions.get_by_id(rxn.id)
+            if not _same_stoichiometry(rxn, universal_rxn):
+                return None
+            if rxn.lower_bound < universal_rxn.lower_bound or rxn.upper_bound > universal_rxn.upper_bound:
+                return None
+            flux = fluxes.get(rxn.id, 0.0)
+            if flux < rxn.lower_bound - 1e-9 or flux > rxn.upper_bound + 1e-9:
+                return None
+        for rxn_id in tasks:
+            if universal.reactions.has_id(rxn_id) and fluxes.get(rxn_id, 0.0) < fraction - 1e-9:
+                return None
+        return value
+
+
+def draft_meets_objective(
+        model: cobra.Model,
+        universal: cobra.Model,
+        tasks: list[str],
+        obj: str,
+        bounds: tuple[float, float],
+        file_type: int,
+        draft_rxn_ids: set[str],
+        check_universal: bool = True
+    ) -> Optional[set[str]]:
+    """
+    Get the result of a gap-filling problem without solving its LP if the draft
+    alone already meets the objective bounds. Returns None otherwise.
+
+    If the draft (with the universal objective reaction added, unless the
+    objective is part of the draft) has a flux distribution that meets the
+    objective constraint, with the universal objective at its lower bound,
+    while every other universal reaction carries no flux, that is an optimal
+    pFBA solution: draft reactions are free, and no solution can have a lower
+    cost. Every optimal solution then only uses draft reactions and the
+    objective, so the universal reactions added are known. This takes one LP on
+    the draft instead of an LP over the whole universal model, and is only
+    tried without metabolic tasks.
+
+    `universal` must have the media applied. Whether the draft is applied to it
+    doesn't matter, since only the bounds of universal reactions that aren't in
+    `draft_rxn_ids` are used. Callers that have already checked that those
+    reactions can carry no flux (e.g. on their own bound vectors) can skip the
+    check with `check_universal`.
+    """
+    lb, ub = bounds
+    if len(tasks) != 0 or not lb <= ub:
+        return None
+    if file_type == 3:
+        # The draft's objective is free, so any flux within the bounds will do
+        if not model.reactions.has_id(obj):
+            return None
+        draft_obj = model.reactions.get_by_id(obj)
+        lb, ub = max(lb, draft_obj.lower_bound), min(ub, draft_obj.upper_bound)
+    else:
+        # The universal objective is used, and it costs as much as its flux
+        universal_obj = universal.reactions.get_by_id(obj)
+        if model.reactions.has_id(obj) and not _same_stoichiometry(model.reactions.get_by_id(obj), universal_obj):
+            return None
+        if not max(0, universal_obj.lower_bound) <= lb <= universal_obj.upper_bound:
+            return None
+        ub = lb
+    if not lb <= ub:
+        return None
+
+    # Every other universal reaction must be able to carry no flux
+    if check_universal:
+        for rxn in universal.reactions:
+            if rxn.id in draft_rxn_ids or rxn.id == obj:
+                continue
+            if rxn.lower_bound > 0 or rxn.upper_bound < 0:
+                return None
+
+    with model:
+        if not model.reactions.has_id(obj):
+            model.add_reactions([universal_obj.copy()])
+        draft_obj = model.reactions.get_by_id(obj)
+        draft_obj.bounds = (lb, ub)
+        model.objective = draft_obj
+        model.slim_optimize()
+        if model.solver.status != 'optimal':
+            return None
+
+    if file_type == 3 or lb <= 1e-6:
+        return set()
+    return {obj}
+
+
+def _same_stoichiometry(rxn: cobra.Reaction, other: cobra.Reaction) -> bool:
+    metabolites = rxn.metabolites
+    other_metabolites = other.metabolites
+    if len(metabolites) != len(other_metabolites):
+        return False
+    other_coefficients = {met.id: coef for met, coef in other_metabolites.items()}
+    return all(other_coefficients.get(met.id) == coef for met, coef in metabolites.items())
+
+
+_ENGINE_CLASSES = {
+    'persistent': GapfillEngine,
+    'matrix': MatrixGapfillEngine
+}
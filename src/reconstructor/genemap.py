@@ -0,0 +1,196 @@
+"""
+Compiled, memory-mapped gene maps.
+
+The gene to ModelSEED reaction map and the gene name map have millions of
+entries. Loading them from JSON creates millions of Python strings in every
+process, which is slow and takes a lot of memory. They are compiled once into a
+compact array format instead:
+
+    keys.npy     sorted gene IDs (fixed-width bytes), so a gene's position is its integer ID
+    offsets.npy  CSR-style offsets: the values of key i are values[offsets[i]:offsets[i + 1]]
+    values.npy   integer value IDs (indices into names.npy)
+    names.npy    the interned values (e.g. ModelSEED reaction IDs)
+
+The arrays are memory-mapped when they are loaded, so loading takes
+milliseconds and processes on the same node share one page-cached copy.
+`CompiledMap` is a read-only mapping that can be used in place of the original
+dictionaries, and it can look up many keys at once with `group_by_value` and
+all of the keys with a prefix (e.g. the genes of a KEGG organism) with
+`prefix_keys`.
+"""
+
+from typing import Iterable, Iterator, Mapping, Optional, Union
+from pathlib import Path
+import gzip
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+_ARRAYS = ("keys", "offsets", "values", "names")
+
+
+class CompiledMap(Mapping):
+    """
+    Read-only mapping from string keys to lists of strings (or to single
+    strings if `single` is True) backed by compiled arrays.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], single: bool = False):
+        self.path = Path(path)
+        self.single = single
+        arrays = {name: np.load(self.path.joinpath(f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        self.keys_array = arrays["keys"]
+        self.offsets = arrays["offsets"]
+        self.values_array = arrays["values"]
+        self.names = arrays["names"]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({repr(str(self.path))}, single={self.single})"
+
+    def __len__(self) -> int:
+        return len(self.keys_array)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.keys_array:
+            yield key.decode()
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._position(key) is not None
+
+    def __getitem__(self, key: str) -> Union[list[str], str]:
+        i = self._position(key) if isinstance(key, str) else None
+        if i is None:
+            raise KeyError(key)
+        values = [self.names[v].decode() for v in self.values_array[self.offsets[i]:self.offsets[i + 1]]]
+        return values[0] if self.single else values
+
+    def positions(self, keys: Iterable[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the positions (integer IDs) of many keys at once. Returns the
+        positions and a mask of the keys that were found.
+        """
+        keys = np.asarray([key.encode() for key in keys], dtype=bytes)
+        if len(keys) == 0 or len(self.keys_array) == 0:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(self.keys_array, keys)
+        positions = np.minimum(positions, len(self.keys_array) - 1)
+        return positions, self.keys_array[positions] == keys
+
+    def prefix_keys(self, prefix: str) -> list[str]:
+        """
+        Get every key that starts with a prefix (e.g. all of the genes of a
+        KEGG organism). The keys are sorted, so they are found with two binary
+        searches.
+        """
+        prefix = prefix.encode()
+        upper = _prefix_upper_bound(prefix)
+        start = np.searchsorted(self.keys_array, prefix, side="left")
+        end = len(self.keys_array) if upper is None else np.searchsorted(self.keys_array, upper, side="left")
+        return [key.decode() for key in self.keys_array[start:end]]
+
+    def group_by_value(self, keys: Iterable[str]) -> dict[str, list[str]]:
+        """
+        Invert the map for the given keys: get every value of the keys mapped to
+        the keys that have it (in the order the keys are given).
+        """
+        keys = list(keys)
+        positions, found = self.positions(keys)
+        key_index = np.flatnonzero(found)
+        starts = self.offsets[positions[found]]
+        counts = self.offsets[positions[found] + 1] - starts
+
+        # Gather the value IDs of all found keys with one fancy index
+        total = int(counts.sum())
+        pair_keys = np.repeat(key_index, counts)
+        gather = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        pair_values = self.values_array[gather]
+
+        order = np.argsort(pair_values, kind="stable")
+        pair_keys = pair_keys[order]
+        pair_values = pair_values[order]
+        unique_values, group_starts = np.unique(pair_values, return_index=True)
+        group_ends = np.append(group_starts[1:], len(pair_values))
+
+        groups = {}
+        for value, start, end in zip(unique_values, group_starts, group_ends):
+            groups[self.names[value].decode()] = [keys[k] for k in pair_keys[start:end]]
+        return groups
+
+    def _position(self, key: str):
+        positions, found = self.positions([key])
+        return int(positions[0]) if found[0] else None
+
+
+def _prefix_upper_bound(prefix: bytes) -> Optional[bytes]:
+    """
+    Get the smallest byte string that is greater than every string starting
+    with a prefix, or None if there is none (the prefix is empty or all 0xFF
+    bytes). Trailing 0xFF bytes can't be incremented, so they are dropped and
+    the increment is carried into the byte before them.
+    """
+    stripped = prefix.rstrip(b"\xff")
+    if len(stripped) == 0:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
+
+
+def compile_map(data: Mapping[str, Union[list[str], str]], path: Union[str, os.PathLike], **metadata) -> Path:
+    """
+    Compile a mapping from strings to lists of strings (or single strings) into
+    a `CompiledMap` directory, replacing any existing one.
+    """
+    path = Path(path)
+    keys = sorted(data)
+    names = {}
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    values = []
+    for i, key in enumerate(keys):
+        key_values = data[key]
+        if isinstance(key_values, str):
+            key_values = [key_values]
+        for value in key_values:
+            values.append(names.setdefault(value, len(names)))
+        offsets[i + 1] = len(values)
+
+    arrays = {
+        "keys": np.array([key.encode() for key in keys], dtype=bytes),
+        "offsets": offsets,
+        "values": np.array(values, dtype=np.int32),
+        "names": np.array([name.encode() for name in names], dtype=bytes)
+    }
+
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(tmp_path.joinpath(f"{name}.npy"), array)
+    with open(tmp_path.joinpath("metadata.json"), "w") as f:
+        json.dump({"format": FORMAT_VERSION, **metadata}, f)
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_compiled_json(source: Union[str, os.PathLike], path: Union[str, os.PathLike], single: bool = False) -> CompiledMap:
+    """
+    Load the compiled version of a gzipped JSON map, compiling it first if it
+    hasn't been compiled yet or the JSON file has changed since.
+    """
+    path = Path(path)
+    stat = os.stat(source)
+    source_id = {"source_size": stat.st_size, "source_mtime": stat.st_mtime_ns}
+    try:
+        with open(path.joinpath("metadata.json"), "r") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        metadata = {}
+
+    if metadata != {"format": FORMAT_VERSION, **source_id}:
+        with gzip.open(source, "rt") as f:
+            data = json.load(f)
+        compile_map(data, path, **source_id)
+    return CompiledMap(path, single=single)
@@ -0,0 +1,189 @@
+"""
+Media presets, user media files and applying media to models.
+
+Media are lists of extracellular ModelSEED metabolites (e.g. 'cpd00027_e') that
+can be taken up through their exchange reactions ('EX_cpd00027_e'). Named media
+are kept in a registry that starts with the built-in presets (`MEDIA_PRESETS`)
+and that user media files can be added to with `load_media_file`. A media file
+is either
+
+- a list of metabolites (one per line or comma separated), which is registered
+  under the file name without its extension, or
+- a tab-separated file with a media name and a media (a registered name or
+  comma separated metabolites) on each line.
+
+Lines starting with '#' are ignored. `set_media` applies a media to a model by
+only changing the exchange bounds that differ from the media's, so switching
+between media (e.g. in a media sweep or a batch) only touches the few exchanges
+that actually change. The changes are passed to the solver in one update and
+recorded as one change in the model's context.
+"""
+
+from typing import Mapping, Union
+from functools import partial
+from pathlib import Path
+import os
+
+import cobra
+from cobra.util.context import get_context
+
+from reconstructor import errors
+
+
+MEDIA_PRESETS = {
+    'rich': ['cpd00001_e','cpd00035_e','cpd00041_e','cpd00023_e','cpd00119_e','cpd00107_e','cpd00060_e','cpd00161_e','cpd00069_e','cpd00084_e','cpd00033_e',
+    'cpd00322_e','cpd00066_e','cpd00054_e','cpd00065_e','cpd00156_e','cpd00220_e','cpd00644_e','cpd00393_e','cpd00133_e','cpd00263_e','cpd00104_e','cpd00149_e',
+    'cpd00971_e','cpd00099_e','cpd00205_e','cpd00009_e','cpd00063_e','cpd00254_e','cpd10515_e','cpd00030_e','cpd00242_e','cpd00226_e','cpd01242_e','cpd00307_e',
+    'cpd00092_e','cpd00117_e','cpd00067_e','cpd00567_e','cpd00132_e','cpd00210_e','cpd00320_e','cpd03279_e','cpd00246_e','cpd00311_e','cpd00367_e','cpd00277_e',
+    'cpd00182_e','cpd00654_e','cpd00412_e','cpd00438_e','cpd00274_e','cpd00186_e','cpd00637_e','cpd00105_e','cpd00305_e','cpd00309_e','cpd00098_e','cpd00207_e',
+    'cpd00082_e','cpd00129_e'],
+    'minimal': ['cpd00001_e','cpd00065_e','cpd00060_e','cpd00322_e','cpd00129_e','cpd00156_e','cpd00107_e','cpd00084_e',
+    'cpd00149_e','cpd00099_e','cpd10515_e','cpd00030_e','cpd00254_e','cpd00063_e','cpd00205_e','cpd00009_e','cpd00971_e','cpd00242_e',
+    'cpd00104_e','cpd00644_e','cpd00263_e','cpd00082_e'],
+    'default': ['cpd00035_e','cpd00051_e','cpd00132_e','cpd00041_e','cpd00084_e','cpd00053_e','cpd00023_e',
+    'cpd00033_e','cpd00119_e','cpd00322_e','cpd00107_e','cpd00039_e','cpd00060_e','cpd00066_e','cpd00129_e',
+    'cpd00054_e','cpd00161_e','cpd00065_e','cpd00069_e','cpd00156_e','cpd00027_e','cpd00149_e','cpd00030_e',
+    'cpd00254_e','cpd00971_e','cpd00063_e','cpd10515_e','cpd00205_e','cpd00099_e']
+}
+MEDIA_PRESETS['default_media'] = MEDIA_PRESETS['default']
+
+# Exchange bounds of metabolites in and out of the media
+MEDIA_BOUNDS = (-1000.0, 10000)
+CLOSED_BOUNDS = (0, 1000.0)
+
+_REGISTRY = {name: list(media) for name, media in MEDIA_PRESETS.items()}
+
+
+def register_media(name: str, media: Union[str, list[str]]):
+    """
+    Add a named media to the registry (replacing any media with the same name).
+    """
+    media = get_media(media)
+    if len(media) == 0:
+        raise errors.ReconstructorError(f"Media {name} has no metabolites")
+    _REGISTRY[name] = media
+
+
+def media_names() -> list[str]:
+    """
+    Get the names of the registered media.
+    """
+    return list(_REGISTRY)
+
+
+def read_media_file(path: Union[str, os.PathLike]) -> dict[str, list[str]]:
+    """
+    Read the named media of a media file (see the module documentation).
+    """
+    with open(path, 'r') as f:
+        rows = [line.rstrip('\n').split('\t') for line in f if line.strip() and not line.startswith('#')]
+
+    if all(len(row) == 1 for row in rows):
+        media = [cpd.strip() for row in rows for cpd in row[0].split(',') if cpd.strip()]
+        return {Path(path).stem: media}
+    for row in rows:
+        if len(row) != 2:
+            raise errors.ReconstructorError(f"Media file {path} needs a name and a media on each line, got {row}")
+    return {name.strip(): get_media(media.strip()) for name, media in rows}
+
+
+def load_media_file(path: Union[str, os.PathLike]) -> list[str]:
+    """
+    Add the media of a media file to the registry. Returns their names.
+    """
+    media_set = read_media_file(path)
+    for name, media in media_set.items():
+        register_media(name, media)
+    return list(media_set)
+
+
+def get_media(media: Union[str, os.PathLike, list[str]]) -> list[str]:
+    """
+    Get the list of media metabolites for a registered media name, a media file
+    with one media, a comma separated string of metabolites or a list of
+    metabolites.
+    """
+    if isinstance(media, os.PathLike):
+        media = str(media)
+    if isinstance(media, str):
+        if media in _REGISTRY:
+            return list(_REGISTRY[media])
+        if os.path.isfile(media):
+            media_set = read_media_file(media)
+            if len(media_set) != 1:
+                raise errors.ReconstructorError(f"Media file {media} has more than one media, use it as a media set")
+            return next(iter(media_set.values()))
+        return media.split(",")
+    return list(media)
+
+
+def get_media_set(media_set: Union[str, os.PathLike, Mapping[str, Union[str, list[str]]]]) -> dict[str, list[str]]:
+    """
+    Get the media of a media set by name. A media set is a mapping of names to
+    media, a comma separated string of registered media names or a media file.
+    """
+    if isinstance(media_set, Mapping):
+        media_set = {str(name): get_media(media) for name, media in media_set.items()}
+    elif os.path.isfile(media_set):
+        media_set = read_media_file(media_set)
+    else:
+        names = [name.strip() for name in str(media_set).split(',') if name.strip()]
+        unknown = [name for name in names if name not in _REGISTRY]
+        if len(unknown) != 0:
+            raise errors.ReconstructorError(
+                f"Unknown media {', '.join(unknown)} (choose from {', '.join(_REGISTRY)} or give a media file)"
+            )
+        media_set = {name: get_media(name) for name in names}
+    if len(media_set) == 0:
+        raise errors.ReconstructorError('A media set needs at least one media')
+    return media_set
+
+
+def set_media(model: cobra.Model, media: list[str]) -> int:
+    """
+    Close uptake through every exchange of a model except for the exchanges of
+    the media metabolites. Only the exchanges whose bounds differ from the
+    media's are changed. Returns the number of changed exchanges.
+
+    Nothing is changed if the media is empty.
+    """
+    if len(media) == 0:
+        return 0
+    media_exchanges = set('EX_' + cpd for cpd in media)
+    changes = []
+    for rxn in model.reactions:
+        if not rxn.id.startswith('EX_'):
+            continue
+        bounds = MEDIA_BOUNDS if rxn.id in media_exchanges else CLOSED_BOUNDS
+        if rxn.bounds != bounds:
+            changes.append((rxn, bounds))
+    return set_bounds(model, changes)
+
+
+def set_bounds(model: cobra.Model, changes: list[tuple[cobra.Reaction, tuple[float, float]]]) -> int:
+    """
+    Set the bounds of many reactions of a model at once. The solver is updated
+    once for all of them, and they are reverted together (as one entry in the
+    model's context) when leaving the model's context. Returns the number of
+    changed reactions.
+    """
+    if len(changes) == 0:
+        return 0
+    context = get_context(model)
+    if context is not None:
+        context(partial(_set_bounds, model, [(rxn, rxn.bounds) for rxn, _ in changes]))
+    _set_bounds(model, changes)
+    return len(changes)
+
+
+def _set_bounds(model: cobra.Model, changes: list[tuple[cobra.Reaction, tuple[float, float]]]):
+    """
+    Set the bounds of many reactions and pass them to the solver in one update.
+    Unlike setting `Reaction.bounds`, the changes are not recorded in the
+    model's context.
+    """
+    for rxn, (lower_bound, upper_bound) in changes:
+        rxn._lower_bound = lower_bound
+        rxn._upper_bound = upper_bound
+        rxn.update_variable_bounds()
+    model.solver.update()
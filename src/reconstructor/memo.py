@@ -0,0 +1,197 @@
+"""
+Persistent memoization of gap-filling results.
+
+Repeated reconstructions of the same strain, or parameter sweeps that only
+change settings that don't affect gap-filling, solve exactly the same
+gap-filling problems again. `GapfillMemo` stores the reactions added in each
+gap-filling step under a canonical hash of everything the steps depend on:
+
+- the draft's reactions (IDs, bounds and stoichiometry)
+- the universal model version and its media (exchange bounds)
+- the metabolic tasks, objective, flux fractions and input file type
+- the gap-filling engine settings
+
+so that a repeated problem is answered without building or solving any LP. The
+memo is a small SQLite database in the cache directory. The least recently used
+results are evicted once it has more than `max_entries` results, and hits and
+misses are counted.
+
+The memo also keeps the maximum objective fluxes over the universal model (see
+`reconstructor.gapfill.ObjectiveMaxima`), which new drafts on the same media
+can reuse.
+"""
+
+from typing import Any, Optional, Sequence, Union
+from pathlib import Path
+import hashlib
+import json
+import os
+import sqlite3
+
+import cobra
+
+from reconstructor import resources
+
+
+DEFAULT_MAX_ENTRIES = 100000
+
+# Results are ordered by a use counter rather than a timestamp, so that uses in
+# quick succession are still ordered. The counter is indexed, so its maximum is
+# looked up in the index instead of by scanning every result
+_NEXT_USE = "(SELECT COALESCE(MAX(last_used), 0) + 1 FROM results)"
+
+
+class GapfillMemo:
+    """
+    Size-limited, least recently used store of gap-filling results.
+    """
+
+    def __init__(self, path: Optional[Union[str, os.PathLike]] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if path is None:
+            path = resources.get_cache_dir().joinpath("gapfill_memo.sqlite")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._connection = sqlite3.connect(str(self.path), timeout=60)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, steps TEXT NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS maxima (key TEXT PRIMARY KEY, value REAL NOT NULL, fluxes TEXT NOT NULL)"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._connection.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({repr(str(self.path))}, max_entries={self.max_entries})"
+
+    def __enter__(self) -> "GapfillMemo":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def key(
+            self,
+            model: cobra.Model,
+            universal_version: str,
+            media: str,
+            tasks: Sequence[str],
+            obj: str,
+            fraction: float,
+            max_fraction: float,
+            file_type: int,
+            engine: Any = None
+        ) -> str:
+        """
+        Get the memo key of gap-filling a draft. `media` identifies the media
+        of the universal model (see `reconstructor.gapfill.media_key`) and
+        `engine` is anything JSON serializable that identifies the gap-filling
+        engine settings.
+        """
+        reactions = sorted(
+            (
+                rxn.id,
+                rxn.lower_bound,
+                rxn.upper_bound,
+                sorted((met.id, coef) for met, coef in rxn.metabolites.items())
+            )
+            for rxn in model.reactions
+        )
+        key = {
+            "reactions": reactions,
+            "universal": universal_version,
+            "media": media,
+            "tasks": sorted(tasks),
+            "obj": obj,
+            "fraction": fraction,
+            "max_fraction": max_fraction,
+            "file_type": file_type,
+            "engine": engine
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[list[set[str]]]:
+        """
+        Get the reactions added in each gap-filling step for a key, or None if
+        the key isn't memoized.
+        """
+        with self._connection:
+            row = self._connection.execute("SELECT steps FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._connection.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self._connection.execute(f"UPDATE results SET last_used = {_NEXT_USE} WHERE key = ?", (key,))
+            self._connection.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        return [set(step) for step in json.loads(row[0])]
+
+    def put(self, key: str, steps: Sequence[set[str]]):
+        """
+        Memoize the reactions added in each gap-filling step and evict old
+        results if there are too many.
+        """
+        steps = json.dumps([sorted(step) for step in steps])
+        with self._connection:
+            self._connection.execute(f"INSERT OR REPLACE INTO results VALUES (?, ?, {_NEXT_USE})", (key, steps))
+        self.prune()
+
+    def get_maximum(self, key: str) -> Optional[tuple[float, dict[str, float]]]:
+        """
+        Get a maximum objective flux and the fluxes of its solution, or None if
+        it isn't saved.
+        """
+        row = self._connection.execute("SELECT value, fluxes FROM maxima WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def put_maximum(self, key: str, value: float, fluxes: dict[str, float]):
+        """
+        Save a maximum objective flux and the fluxes of its solution.
+        """
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO maxima VALUES (?, ?, ?)", (key, value, json.dumps(fluxes)))
+
+    def prune(self, max_entries: Optional[int] = None) -> int:
+        """
+        Evict the least recently used results until there are no more than
+        `max_entries` (the memo's maximum by default). Returns the number of
+        evicted results.
+        """
+        if max_entries is None:
+            max_entries = self.max_entries
+        with self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (max_entries,)
+            )
+        return cursor.rowcount
+
+    def clear(self) -> int:
+        """
+        Remove every result and objective maximum and reset the statistics.
+        """
+        removed = self.prune(0)
+        with self._connection:
+            self._connection.execute("DELETE FROM maxima")
+            self._connection.execute("UPDATE stats SET value = 0")
+        return removed
+
+    def stats(self) -> dict:
+        """
+        Get the number of memoized results and objective maxima and the hit and
+        miss counts.
+        """
+        stats = dict(self._connection.execute("SELECT name, value FROM stats").fetchall())
+        stats["entries"] = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        stats["maxima"] = self._connection.execute("SELECT COUNT(*) FROM maxima").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["path"] = str(self.path)
+        return stats
@@ -0,0 +1,221 @@
+"""
+Pipelined batch reconstruction that overlaps alignment with gap-filling.
+
+In a plain batch (`reconstructor.batch`) each genome is aligned and then
+gap-filled before the next one starts, so DIAMOND and the gap-filling solver
+never run at the same time. `run_pipeline` runs the two stages concurrently
+instead:
+
+    manifest -> [align queue] -> DIAMOND jobs -> [gapfill queue] -> gap-filling workers
+
+Up to `align_jobs` DIAMOND processes run at once (each streamed by
+`reconstructor._funcs.align_queries` in a thread, so the hits are parsed as
+they are written and the alignment cache is used as in a plain batch), and the
+hit sets are handed to a pool of forked gap-filling workers. Both queues are bounded, so alignments don't run
+far ahead of gap-filling and hold many hit sets in memory.
+
+The gap-filling workers are forked before any alignment thread starts. If one
+of them dies (e.g. when it runs out of memory), the genomes that haven't been
+gap-filled yet are recorded as failed instead of being run.
+
+Type 2 and 3 inputs skip the alignment stage. So do type 1 inputs that use
+two-pass alignment or a sub-database, which are aligned by their gap-filling
+worker as in a plain batch.
+"""
+
+from typing import Any, Optional, Union
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import gc
+import multiprocessing
+import os
+import platform
+import time
+
+from reconstructor.alignment_cache import AlignmentCache
+from reconstructor.batch import BatchResult, _run_entry, prepare_shared, read_manifest, report_batch
+from reconstructor.diamond import memory_options, stage_database
+from reconstructor._funcs import align_queries, sensitivity_options
+from reconstructor import resources
+
+
+def run_pipeline(
+        manifest: Union[str, os.PathLike, list[dict[str, Any]]],
+        align_jobs: int = 1,
+        workers: int = 1,
+        **defaults
+    ) -> list[BatchResult]:
+    """
+    Reconstruct every genome in a batch manifest (see `reconstructor.batch`),
+    running up to `align_jobs` DIAMOND alignments at the same time as `workers`
+    gap-filling processes.
+    """
+    if isinstance(manifest, (str, os.PathLike)):
+        entries = read_manifest(manifest)
+    else:
+        entries = list(manifest)
+
+    align_jobs = max(1, int(align_jobs))
+    workers = max(1, min(int(workers), len(entries)))
+    print(
+        f'Reconstructing {len(entries)} genome(s) in pipeline mode with {align_jobs} alignment job(s) '
+        f'and {workers} gap-filling worker(s)'
+    )
+    start = time.time()
+
+    prepare_shared(defaults)
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    else:
+        # The shared universal model can't be used by several threads at once
+        print(f'WARNING: Parallel gap-filling is not supported on {platform.system()}. Using 1 worker')
+        workers = 1
+        executor = ThreadPoolExecutor(1)
+
+    # As in a plain batch, keep the forked workers from copying the shared
+    # databases when they collect garbage
+    gc.freeze()
+    try:
+        with executor:
+            # A fork pool only forks its workers on the first submit. Fork them
+            # now, before any alignment thread exists whose locks they could
+            # inherit
+            executor.submit(os.getpid).result()
+            results = asyncio.run(_run(entries, defaults, align_jobs, workers, executor))
+    finally:
+        gc.unfreeze()
+
+    report_batch(results, time.time() - start)
+    return results
+
+
+async def align_async(
+        input_file: Union[str, os.PathLike],
+        database: Union[str, os.PathLike],
+        processors: Union[int, str],
+        options: list[str],
+        outputfile: Optional[Union[str, os.PathLike]] = None,
+        cache: Optional[AlignmentCache] = None,
+        executor: Optional[Executor] = None
+    ) -> set[str]:
+    """
+    Align an input file with DIAMOND (see `reconstructor._funcs.align_queries`)
+    in a thread of `executor` and return the KEGG hits. DIAMOND, the alignment
+    cache and the output file are all used from that thread, so the event loop
+    isn't blocked while they are.
+    """
+    loop = asyncio.get_running_loop()
+    query_hits = await loop.run_in_executor(
+        executor, align_queries, str(input_file), str(database), str(processors), options, outputfile, cache
+    )
+    hits = set()
+    for targets in query_hits.values():
+        hits.update(targets)
+    return hits
+
+
+async def _run(
+        entries: list[dict[str, Any]],
+        defaults: dict[str, Any],
+        align_jobs: int,
+        workers: int,
+        executor: Executor
+    ) -> list[BatchResult]:
+    align_queue = asyncio.Queue(maxsize=align_jobs)
+    gapfill_queue = asyncio.Queue(maxsize=workers)
+    results = []
+    # DIAMOND runs in threads, which mostly wait for its output
+    align_executor = ThreadPoolExecutor(align_jobs)
+    # Set to the error once a gap-filling worker dies (e.g. killed when out of
+    # memory), after which the remaining genomes are failed without running them
+    broken = None
+
+    def fail(entry, error, elapsed=0.0):
+        results.append(BatchResult(entry['input_file'], None, elapsed, error))
+        print(f'\nFailed {len(results)} of {len(entries)} genome(s): {entry["input_file"]}')
+
+    async def feed():
+        for entry in entries:
+            if _needs_alignment({**defaults, **entry}):
+                await align_queue.put(entry)
+            else:
+                await gapfill_queue.put(entry)
+        for _ in range(align_jobs):
+            await align_queue.put(None)
+
+    async def align():
+        loop = asyncio.get_running_loop()
+        while (entry := await align_queue.get()) is not None:
+            if broken is not None:
+                fail(entry, broken)
+                continue
+            kwargs = {**defaults, **entry}
+            start = time.time()
+            try:
+                # Staging the database copies it on first use
+                args = await loop.run_in_executor(align_executor, _alignment_args, kwargs)
+                gene_hits = await align_async(*args, executor=align_executor)
+            except Exception as e:
+                fail(entry, f'{type(e).__name__}: {e}', time.time() - start)
+                continue
+            await gapfill_queue.put({**entry, 'gene_hits': gene_hits})
+
+    async def gapfill():
+        nonlocal broken
+        loop = asyncio.get_running_loop()
+        while (entry := await gapfill_queue.get()) is not None:
+            if broken is not None:
+                fail(entry, broken)
+                continue
+            start = time.time()
+            try:
+                result = await loop.run_in_executor(executor, _run_entry, entry, defaults)
+            except BrokenProcessPool as e:
+                # Keep taking entries off the queue so that alignments waiting
+                # to hand over their hits don't block
+                broken = f'{type(e).__name__}: {e}'
+                print('\nWARNING: A gap-filling worker stopped unexpectedly. Failing the remaining genomes')
+                fail(entry, broken, time.time() - start)
+                continue
+            except Exception as e:
+                fail(entry, f'{type(e).__name__}: {e}', time.time() - start)
+                continue
+            results.append(result)
+            print(f'\nFinished {len(results)} of {len(entries)} genome(s): {result.input_file}')
+
+    gapfillers = [asyncio.create_task(gapfill()) for _ in range(workers)]
+    with align_executor:
+        await asyncio.gather(feed(), *(align() for _ in range(align_jobs)))
+    for _ in range(workers):
+        await gapfill_queue.put(None)
+    await asyncio.gather(*gapfillers)
+    return results
+
+
+def _needs_alignment(kwargs: dict[str, Any]) -> bool:
+    return (
+        int(kwargs.get('file_type', 1)) == 1
+        and str(kwargs.get('alignment_mode', 'single')) == 'single'
+        and str(kwargs.get('subdb', 'none')) == 'none'
+    )
+
+
+def _alignment_args(kwargs: dict[str, Any]) -> tuple:
+    """
+    Get the `align_async` arguments of a batch entry, as `build._reconstruct`
+    would align it.
+    """
+    input_file = str(kwargs['input_file'])
+    database = resources.get_diamond_db_path()
+    if str(kwargs.get('stage_db', 'none')) != 'none':
+        database = stage_database(database, str(kwargs['stage_db']))
+    options = sensitivity_options(str(kwargs.get('sensitivity', 'more-sensitive')))
+    if str(kwargs.get('diamond_memory', 'none')) != 'none':
+        options.extend(memory_options(float(kwargs['diamond_memory'])))
+    outputfile = None
+    if str(kwargs.get('save_blast', 'yes')) == 'yes':
+        outputfile = input_file.rstrip('fastn') + 'KEGGprot.out'
+    cache = AlignmentCache() if str(kwargs.get('alignment_cache', 'yes')) == 'yes' else None
+    return input_file, database, kwargs.get('cpu', 1), options, outputfile, cache
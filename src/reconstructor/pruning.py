@@ -0,0 +1,261 @@
+"""
+Network-neighbourhood pruning of the universal model before gap-filling.
+
+Most universal reactions cannot connect to a given draft network or to the
+biomass objective within a few steps, but every gap-filling LP includes all of
+them. The metabolite-reaction graph of the universal model is indexed once, and
+for each draft only the universal reactions within a given number of hops of
+the draft's metabolites and of the biomass precursors are kept (along with all
+exchange reactions). Reactions that are blocked under the current media can be
+dropped as well. The gap-filling LP is then solved with every other universal
+reaction bounded to zero.
+
+Pruning is a heuristic: a gap-filling solution may need reactions further away
+than the chosen number of hops. Use the `verify` option to compare the pruned
+result against the full solve.
+"""
+
+from typing import Optional, Iterable
+import hashlib
+import json
+import math
+
+import cobra
+from cobra.flux_analysis import find_blocked_reactions
+
+from reconstructor.gapfill import get_engine, media_key
+from reconstructor import resources
+
+
+DEFAULT_MAX_DEGREE = 100
+MAX_CACHED_PRUNINGS = 32
+
+_INDEXES = {}
+_BLOCKED = {}
+_PRUNED = {}
+
+
+class NetworkIndex:
+    """
+    Bipartite metabolite-reaction index of a model.
+    """
+
+    def __init__(self, model: cobra.Model):
+        self.rxn_mets = {}
+        self.met_rxns = {}
+        for rxn in model.reactions:
+            mets = frozenset(met.id for met in rxn.metabolites)
+            self.rxn_mets[rxn.id] = mets
+            for met in mets:
+                self.met_rxns.setdefault(met, set()).add(rxn.id)
+
+    def neighbourhood(self, metabolites: Iterable[str], hops: int, max_degree: Optional[int] = DEFAULT_MAX_DEGREE) -> set[str]:
+        """
+        Get the IDs of the reactions within `hops` reaction steps of the given
+        metabolites.
+
+        Metabolites that take part in more than `max_degree` reactions (such as
+        water, protons and ATP) are not expanded, since almost every reaction
+        would otherwise be within a couple of hops.
+        """
+        reactions = set()
+        seen = set()
+        frontier = set(metabolites)
+        for _ in range(hops):
+            seen |= frontier
+            new_reactions = set()
+            for met in frontier:
+                met_rxns = self.met_rxns.get(met, ())
+                if max_degree is not None and len(met_rxns) > max_degree:
+                    continue
+                new_reactions.update(met_rxns)
+            new_reactions -= reactions
+            reactions |= new_reactions
+            frontier = set()
+            for rxn in new_reactions:
+                frontier.update(self.rxn_mets[rxn])
+            frontier -= seen
+            if len(frontier) == 0:
+                break
+        return reactions
+
+
+def get_network_index(model: cobra.Model) -> NetworkIndex:
+    """
+    Get the (cached) network index of a model.
+    """
+    index = _INDEXES.get(id(model))
+    if index is None or index[0] is not model:
+        index = (model, NetworkIndex(model))
+        _INDEXES[id(model)] = index
+    return index[1]
+
+
+def get_blocked_reactions(universal: cobra.Model) -> set[str]:
+    """
+    Get the reactions of the universal model that cannot carry flux under its
+    current media.
+
+    Finding blocked reactions is expensive, so the result is cached for each
+    media. For the bundled universal model it is also saved in the cache
+    directory so that later runs can reuse it.
+    """
+    key = media_key(universal)
+    blocked = _BLOCKED.get((id(universal), key))
+    if blocked is not None:
+        return blocked
+
+    path = None
+    if universal is resources.get_universal_model():
+        path = resources.get_cache_dir().joinpath("blocked", f"{resources.get_universal_version()[:16]}-{key[:16]}.json")
+        if path.exists():
+            with open(path, "r") as f:
+                blocked = set(json.load(f))
+
+    if blocked is None:
+        print('Finding blocked universal reactions for this media (only needed once)...')
+        blocked = set(find_blocked_reactions(universal, open_exchanges=False))
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "w") as f:
+                    json.dump(sorted(blocked), f)
+            except OSError:
+                pass
+
+    _BLOCKED[(id(universal), key)] = blocked
+    return blocked
+
+
+def get_pruned_reactions(
+        universal: cobra.Model,
+        model: cobra.Model,
+        obj: str,
+        hops: int,
+        max_degree: Optional[int] = DEFAULT_MAX_DEGREE,
+        remove_blocked: bool = False,
+        tasks: Iterable[str] = ()
+    ) -> set[str]:
+    """
+    Get the IDs of the universal reactions that are within `hops` reaction
+    steps of the draft model's metabolites or of the precursors of the
+    objective reaction. Draft reactions, exchange reactions, metabolic tasks and
+    the objective reaction are always kept.
+
+    The result is cached for each media (if blocked reactions are removed) and
+    draft neighbourhood, so the steps and media of a reconstruction that start
+    from the same draft share it.
+    """
+    index = get_network_index(universal)
+    seeds = set(met.id for met in model.metabolites)
+    draft_rxn_ids = set(rxn.id for rxn in model.reactions if rxn.id in index.rxn_mets)
+    key = hashlib.sha256(json.dumps([
+        id(universal), media_key(universal) if remove_blocked else None, sorted(seeds), sorted(draft_rxn_ids),
+        obj, sorted(tasks), hops, max_degree
+    ]).encode()).hexdigest()
+    keep = _PRUNED.get(key)
+    if keep is not None:
+        return keep
+
+    seeds |= index.rxn_mets[obj]
+    keep = index.neighbourhood(seeds, hops, max_degree)
+    if remove_blocked:
+        keep -= get_blocked_reactions(universal)
+    keep |= draft_rxn_ids
+    keep |= set(rxn_id for rxn_id in index.rxn_mets if rxn_id.startswith('EX_'))
+    keep |= set(rxn_id for rxn_id in tasks if rxn_id in index.rxn_mets)
+    keep.add(obj)
+
+    if len(_PRUNED) >= MAX_CACHED_PRUNINGS:
+        del _PRUNED[next(iter(_PRUNED))]
+    _PRUNED[key] = keep
+    return keep
+
+
+class PrunedGapfillEngine:
+    """
+    Gapfiller that solves each gap-filling problem on the part of the universal
+    model found by `get_pruned_reactions`.
+
+    Problems are solved by the shared engine of the given kind (see
+    `reconstructor.gapfill.get_engine`), with the universal reactions outside
+    of the pruned part bounded to zero for the duration of the solve, so the
+    universal problem is reused rather than rebuilt for every draft.
+
+    If `verify` is True, every problem is also solved on the full universal
+    model. Pruning can lower the maximum of the objective, which changes the
+    objective bounds of the gap-filling LP, so the bounds are compared first
+    and then the reactions added with them. If either differs, a warning is
+    printed and the full result is used.
+    """
+
+    def __init__(
+            self,
+            universal: cobra.Model,
+            hops: int = 3,
+            max_degree: Optional[int] = DEFAULT_MAX_DEGREE,
+            remove_blocked: bool = False,
+            verify: bool = False,
+            kind: str = 'persistent'
+        ):
+        self.universal = universal
+        self.hops = hops
+        self.max_degree = max_degree
+        self.remove_blocked = remove_blocked
+        self.verify = verify
+        self.engine = get_engine('persistent' if kind == 'bag' else kind, universal)
+
+    def find_reactions(self, model, tasks, obj, fraction, max_fraction, step, file_type, objective_maxima=None) -> set[str]:
+        engine = self.engine
+        keep = get_pruned_reactions(self.universal, model, obj, self.hops, self.max_degree, self.remove_blocked, tasks)
+        print(
+            f'\tPruned gap-filling to {len(keep)} of {len(self.universal.reactions)} universal reactions '
+            f'(the others are fixed to zero flux)'
+        )
+        obj_bounds = dict(engine._obj_bounds)
+        new_rxn_ids = engine.find_reactions(
+            model, tasks, obj, fraction, max_fraction, step, file_type, objective_maxima=objective_maxima, keep=keep
+        )
+
+        if self.verify:
+            pruned_bounds = engine.objective_bounds(obj)
+            engine.restore_objective_bounds(obj_bounds)
+            full_rxn_ids = engine.find_reactions(
+                model, tasks, obj, fraction, max_fraction, step, file_type, objective_maxima=objective_maxima
+            )
+            full_bounds = engine.objective_bounds(obj)
+            if not _same_bounds(pruned_bounds, full_bounds):
+                print(
+                    f'\tWARNING: Pruning changed the objective bounds of the gap-filling LP from {full_bounds} '
+                    f'to {pruned_bounds}. Using the full result'
+                )
+                new_rxn_ids = full_rxn_ids
+            elif full_rxn_ids != new_rxn_ids:
+                print(
+                    f'\tWARNING: Pruned gap-filling result differs from the full solve '
+                    f'({len(new_rxn_ids)} vs {len(full_rxn_ids)} reactions). Using the full result'
+                )
+                new_rxn_ids = full_rxn_ids
+            else:
+                print('\tPruned gap-filling result matches the full solve')
+
+        return new_rxn_ids
+
+    def objective_bounds(self, obj: str) -> Optional[tuple[float, float]]:
+        return self.engine.objective_bounds(obj)
+
+    def add_objective_bounds(self, obj: str, bounds: tuple[float, float]):
+        self.engine.add_objective_bounds(obj, bounds)
+
+    def prepare(self):
+        self.engine.prepare()
+        get_network_index(self.universal)
+
+    def reset(self):
+        self.engine.reset()
+
+
+def _same_bounds(bounds: Optional[tuple[float, float]], other: Optional[tuple[float, float]]) -> bool:
+    if bounds is None or other is None:
+        return bounds == other
+    return all(math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-9) for a, b in zip(bounds, other))
@@ -1,47 +1,176 @@
+from typing import Mapping
 from functools import lru_cache
 from importlib import resources
 from pathlib import Path
 import gzip
 import json
+import os
 
 import wget
 import cobra
+from platformdirs import user_cache_dir
+
+from reconstructor import snapshot, errors, genemap, catalog
 
 
 RESOURCE_DIR = resources.files(__package__)
 
 
+def get_cache_dir() -> Path:
+    """
+    Get the directory where Reconstructor keeps its generated cache files.
+
+    This is the `RECONSTRUCTOR_CACHE_DIR` environment variable if it is set and
+    the user's cache directory (e.g. `~/.cache/reconstructor` on Linux)
+    otherwise, since the installed package is often read-only. The directory is
+    created if it does not exist yet, which raises an OSError if it can't be.
+    """
+    path = os.environ.get("RECONSTRUCTOR_CACHE_DIR")
+    path = Path(path) if path else Path(user_cache_dir("reconstructor"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 @lru_cache(maxsize=None)
 def get_universal_model() -> cobra.Model:
     """
     Get the universal reaction model.
 
-    The first time this function is called, the universal model is loaded from
-    the resources directory (which can take 30+ seconds) and then is cached so
-    that subsequent calls can simply return the model without loading it again.
+    The first time this function is called, the universal model is loaded and
+    then is cached so that subsequent calls can simply return the model without
+    loading it again. The model is loaded from the universal model snapshot if
+    there is an up to date one (which takes about 7 seconds). Otherwise it is
+    parsed from the SBML file in the resources directory (which can take 30+
+    seconds) and the snapshot is (re)built so that later processes can skip the
+    parsing.
+    """
+    try:
+        snapshot_path = get_universal_snapshot_path()
+    except OSError:
+        # The cache directory may not be writable; the model is still usable
+        return _read_universal_sbml()
+    try:
+        return snapshot.read_snapshot(snapshot_path, get_universal_version())
+    except (OSError, errors.SnapshotError):
+        pass
+
+    model = _read_universal_sbml()
+    try:
+        snapshot.write_snapshot(model, snapshot_path, get_universal_version())
+    except OSError:
+        pass
+    return model
+
+
+@lru_cache(maxsize=None)
+def get_universal_version() -> str:
+    """
+    Get the version of the universal model, which is the SHA-256 digest of the
+    universal model SBML file.
+    """
+    return snapshot.file_digest(RESOURCE_DIR.joinpath("universal.sbml.gz"))
+
+
+def get_universal_snapshot_path() -> Path:
+    """
+    Get the filepath to the universal model snapshot.
+    """
+    return get_cache_dir().joinpath("universal.snapshot")
+
+
+def build_universal_snapshot(include_solver: bool = True) -> Path:
+    """
+    Parse the universal model SBML file and write a new universal model
+    snapshot, replacing any existing one.
+
+    See `reconstructor.snapshot.write_snapshot` for a description of the
+    `include_solver` option.
+    """
+    model = _read_universal_sbml()
+    return snapshot.write_snapshot(
+        model,
+        get_universal_snapshot_path(),
+        get_universal_version(),
+        include_solver=include_solver
+    )
+
+
+@lru_cache(maxsize=None)
+def get_universal_catalog() -> catalog.UniversalCatalog:
+    """
+    Get the read-only catalog of the universal model's reactions (see
+    `reconstructor.catalog`), which is enough for building drafts.
+
+    The catalog is loaded from the cache directory if there is an up to date
+    one. Otherwise it is made from the universal model and saved.
     """
+    try:
+        catalog_path = get_cache_dir().joinpath("universal.catalog")
+        universal_catalog = catalog.read_catalog(catalog_path, get_universal_version())
+    except OSError:
+        catalog_path = None
+        universal_catalog = None
+    if universal_catalog is not None:
+        return universal_catalog
+
+    universal_catalog = catalog.UniversalCatalog.from_model(get_universal_model())
+    if catalog_path is None:
+        return universal_catalog
+    try:
+        catalog.write_catalog(universal_catalog, catalog_path, get_universal_version())
+    except OSError:
+        pass
+    return universal_catalog
+
+
+def _read_universal_sbml() -> cobra.Model:
     resource = RESOURCE_DIR.joinpath("universal.sbml.gz")
     return cobra.io.read_sbml_model(resource)
 
 
 @lru_cache(maxsize=None)
-def get_gene_name_map() -> dict[str, str]:
+def get_gene_name_map() -> Mapping[str, str]:
     """
-    Get the dictionary mapping KEGG gene IDs to gene names.
+    Get the mapping of KEGG gene IDs to gene names.
+
+    This is a memory-mapped `CompiledMap` (see `reconstructor.genemap`) that is
+    compiled from the JSON resource the first time it is needed. If the
+    compiled map can't be written, the JSON resource is loaded instead.
     """
-    resource = RESOURCE_DIR.joinpath("gene_names.json.gz")
-    with gzip.open(resource, "rt") as f:
-        return json.load(f)
+    return _load_gene_map("gene_names", single=True)
 
 
 @lru_cache(maxsize=None)
-def get_gene_mseed_map() -> dict[str, list[str]]:
+def get_gene_mseed_map() -> Mapping[str, list[str]]:
+    """
+    Get the mapping of KEGG gene IDs to ModelSEED reaction IDs.
+
+    This is a memory-mapped `CompiledMap` (see `reconstructor.genemap`) that is
+    compiled from the JSON resource the first time it is needed. If the
+    compiled map can't be written, the JSON resource is loaded instead.
+    """
+    return _load_gene_map("gene_modelseed")
+
+
+def get_gene_map_version() -> str:
     """
-    Get the dictionary mapping KEGG gene IDs to ModelSEED reaction IDs.
+    Get a version string of the gene maps that changes whenever one of their
+    resource files is replaced.
     """
-    resource = RESOURCE_DIR.joinpath("gene_modelseed.json.gz")
-    with gzip.open(resource, "rt") as f:
-        return json.load(f)
+    parts = []
+    for name in ("gene_modelseed", "gene_names"):
+        stat = os.stat(RESOURCE_DIR.joinpath(f"{name}.json.gz"))
+        parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+    return "-".join(parts)
+
+
+def _load_gene_map(name: str, single: bool = False) -> Mapping:
+    resource = RESOURCE_DIR.joinpath(f"{name}.json.gz")
+    try:
+        return genemap.load_compiled_json(resource, get_cache_dir().joinpath("genemaps", name), single=single)
+    except OSError:
+        with gzip.open(resource, "rt") as f:
+            return json.load(f)
 
 
 def get_diamond_db_path() -> Path:
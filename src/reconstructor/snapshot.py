@@ -0,0 +1,141 @@
+"""
+Binary snapshots of the universal model.
+
+Parsing `universal.sbml.gz` with `cobra.io.read_sbml_model` takes about 30
+seconds, so the parsed model can be stored as a snapshot. Loading a snapshot
+with the solver problem takes about 7 seconds, almost all of which is optlang
+recreating the variables and constraints of the solver problem; this is also
+why a compact array form of the model wouldn't load faster, since building a
+cobra model from it has to create the same solver objects (and is slower than
+unpickling them). Loading a snapshot without the solver problem takes about
+25 seconds. A snapshot file consists of a fixed-size header, a JSON metadata
+block and a pickled payload:
+
+    magic (8 bytes) | format version (uint16) | metadata length (uint32) | metadata | payload
+
+The metadata records the SHA-256 digest of the SBML file the snapshot was made
+from and the SHA-256 digest of the payload, so a snapshot is only used if it
+is intact and still matches its source file.
+"""
+
+from typing import Optional, Union
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import struct
+import time
+
+import cobra
+
+from reconstructor import errors
+
+
+SNAPSHOT_MAGIC = b"RCNSNAP\x00"
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct(">8sHI")
+
+
+def file_digest(path: Union[str, os.PathLike], chunk_size: int = 1 << 20) -> str:
+    """
+    Get the SHA-256 hex digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_snapshot(
+        model: cobra.Model,
+        path: Union[str, os.PathLike],
+        source_digest: str,
+        include_solver: bool = True
+    ) -> Path:
+    """
+    Write a snapshot of a model to a file.
+
+    If `include_solver` is True, the model is pickled together with its solver
+    problem, which optlang restores from the solver's own problem format.
+    Otherwise only the model contents (stoichiometry, bounds, annotations, etc.)
+    are stored and the solver problem is rebuilt from them on load, which is
+    several times slower but doesn't depend on the solver interface being
+    available.
+    """
+    if include_solver:
+        payload = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    else:
+        payload = pickle.dumps(cobra.io.model_to_dict(model), protocol=pickle.HIGHEST_PROTOCOL)
+
+    metadata = json.dumps({
+        "source_digest": source_digest,
+        "payload_digest": hashlib.sha256(payload).hexdigest(),
+        "payload_size": len(payload),
+        "include_solver": include_solver,
+        "cobra_version": cobra.__version__,
+        "created": time.time()
+    }).encode()
+
+    # Write to a temporary file first so that readers never see a partial snapshot
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(metadata)))
+        f.write(metadata)
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def read_snapshot_metadata(path: Union[str, os.PathLike]) -> dict:
+    """
+    Read the metadata block of a snapshot without loading the model.
+    """
+    with open(path, "rb") as f:
+        return _read_metadata(f, path)
+
+
+def read_snapshot(path: Union[str, os.PathLike], source_digest: Optional[str] = None) -> cobra.Model:
+    """
+    Load a model from a snapshot file.
+
+    Raises a SnapshotError if the snapshot is corrupted, was written with a
+    different snapshot format version, or (if `source_digest` is given) was
+    made from a different source file.
+    """
+    with open(path, "rb") as f:
+        metadata = _read_metadata(f, path)
+        if source_digest is not None and metadata["source_digest"] != source_digest:
+            raise errors.SnapshotError(f"Snapshot {path} is out of date with its source file")
+        if metadata["cobra_version"] != cobra.__version__:
+            raise errors.SnapshotError(f"Snapshot {path} was written with cobra v{metadata['cobra_version']}")
+        payload = f.read()
+
+    if len(payload) != metadata["payload_size"] or hashlib.sha256(payload).hexdigest() != metadata["payload_digest"]:
+        raise errors.SnapshotError(f"Snapshot {path} failed its checksum")
+
+    try:
+        if metadata["include_solver"]:
+            return pickle.loads(payload)
+        return cobra.io.model_from_dict(pickle.loads(payload))
+    except Exception as e:
+        raise errors.SnapshotError(f"Snapshot {path} could not be loaded") from e
+
+
+def _read_metadata(f, path) -> dict:
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise errors.SnapshotError(f"{path} is not a snapshot file")
+    magic, version, metadata_size = _HEADER.unpack(header)
+    if magic != SNAPSHOT_MAGIC:
+        raise errors.SnapshotError(f"{path} is not a snapshot file")
+    if version != SNAPSHOT_VERSION:
+        raise errors.SnapshotError(f"Snapshot {path} has format version {version} (expected {SNAPSHOT_VERSION})")
+    try:
+        return json.loads(f.read(metadata_size))
+    except ValueError as e:
+        raise errors.SnapshotError(f"Snapshot {path} has corrupted metadata") from e
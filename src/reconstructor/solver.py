@@ -0,0 +1,211 @@
+"""
+Solver configuration and time limits for gap-filling.
+
+`configure_solver` selects the LP solver of the universal model and passes the
+number of threads, the LP algorithm and a time limit on to its optlang
+configuration. Settings that are 'none' are left as they are, except for the
+time limit, which is removed. cobra's default solver for new models is not
+changed; `match_solver` gives a model created later (like a draft) the solver
+of the universal model.
+
+A time limit is enforced in two ways. A `Watchdog` raises a
+`SolverTimeLimitError` between gap-filling steps once all of the gap-filling of
+a genome has taken longer than the limit, so a pathological genome in a batch
+is recorded as failed and the worker moves on to the next one. And while it
+limits the solver of a model (see `Watchdog.limit_solver`), each LP is only
+given the time that is left, and the solver stopping it is reported as the same
+error instead of an empty gap-filling result.
+"""
+
+from typing import Callable, Optional, Union
+from contextlib import contextmanager
+import math
+import time
+import warnings
+
+import cobra
+from cobra.exceptions import SolverNotFound
+from cobra.util.solver import interface_to_str
+
+from reconstructor import errors
+
+
+# Watchdogs limiting the solvers of models and the time limits they replaced, by id(model)
+_WATCHDOGS = {}
+
+
+def configure_solver(
+        model: cobra.Model,
+        solver: str = 'none',
+        threads: Union[str, int] = 'none',
+        lp_method: str = 'none',
+        time_limit: Union[str, float] = 'none'
+    ):
+    """
+    Configure the solver of a model. `solver` is the name of an optlang
+    interface (e.g. 'glpk', 'cplex' or 'gurobi') and `time_limit` is in seconds.
+    """
+    if str(solver) != 'none':
+        if interface_to_str(model.problem) != str(solver):
+            print('Switching the solver of', model.id, 'to', solver)
+            try:
+                model.solver = str(solver)
+            except SolverNotFound as e:
+                raise errors.ReconstructorError(f"Solver {solver} is not available: {e}") from e
+
+    configuration = model.solver.configuration
+    if str(threads) != 'none':
+        if hasattr(type(configuration), 'threads'):
+            configuration.threads = int(threads)
+        else:
+            warnings.warn(f"The {interface_to_str(model.problem)} solver doesn't support threads; --solver-threads is ignored")
+    if str(lp_method) != 'none':
+        try:
+            configuration.lp_method = str(lp_method)
+        except ValueError as e:
+            raise errors.ReconstructorError(f"Invalid LP method {lp_method}: {e}") from e
+    configuration.timeout = None if str(time_limit) == 'none' else max(1, int(float(time_limit)))
+
+
+def copy_solver_configuration(source: cobra.Model, target: cobra.Model):
+    """
+    Give a model (e.g. a pruned copy of the universal model) the solver
+    settings of another model.
+    """
+    source_configuration = source.solver.configuration
+    target_configuration = target.solver.configuration
+    for name in ('threads', 'lp_method', 'timeout'):
+        if hasattr(type(source_configuration), name) and hasattr(type(target_configuration), name):
+            try:
+                setattr(target_configuration, name, getattr(source_configuration, name))
+            except ValueError:
+                continue
+
+
+def match_solver(source: cobra.Model, target: cobra.Model):
+    """
+    Give a model the solver and solver settings of another model.
+    """
+    interface = interface_to_str(source.problem)
+    if interface_to_str(target.problem) != interface:
+        target.solver = interface
+    copy_solver_configuration(source, target)
+
+
+def solver_time_limit(model: cobra.Model) -> Optional[float]:
+    """
+    Get the time limit in seconds of the next LP solved for a model. This is
+    the time limit of its solver, lowered to the time that is left (rounded up
+    to whole seconds, as glpk only takes those) if a `Watchdog` limits the
+    solver. Raises a `SolverTimeLimitError` if no time is left.
+    """
+    if id(model) not in _WATCHDOGS:
+        return model.solver.configuration.timeout
+    watchdog, timeout = _WATCHDOGS[id(model)]
+    watchdog.check()
+    remaining = max(1, math.ceil(watchdog.remaining()))
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def check_status(model: cobra.Model):
+    """
+    Raise a `SolverTimeLimitError` if the last solve of a model hit the time
+    limit.
+    """
+    if model.solver.status == 'time_limit':
+        raise errors.SolverTimeLimitError(
+            f"A gap-filling LP was stopped after the time limit of {model.solver.configuration.timeout} seconds"
+        )
+
+
+def solve_counting_iterations(model: cobra.Model, optimize: Callable[[], float]) -> tuple[float, Optional[int]]:
+    """
+    Solve a model with `optimize` (e.g. `model.slim_optimize`) and count the
+    simplex iterations of the solve. The count is None for solvers other than
+    glpk, cplex and gurobi.
+    """
+    problem = model.solver.problem
+    interface = interface_to_str(model.problem)
+    if interface == 'glpk':
+        import swiglpk
+        before = swiglpk.glp_get_it_cnt(problem)
+        result = optimize()
+        return result, swiglpk.glp_get_it_cnt(problem) - before
+    result = optimize()
+    if interface == 'cplex':
+        return result, problem.solution.progress.get_num_iterations()
+    if interface == 'gurobi':
+        return result, int(problem.IterCount)
+    return result, None
+
+
+def reset_basis(model: cobra.Model) -> bool:
+    """
+    Discard the basis of the last solve, so that the next solve starts cold.
+    Only supported for glpk and gurobi. Returns whether the basis was reset.
+    """
+    problem = model.solver.problem
+    interface = interface_to_str(model.problem)
+    if interface == 'glpk':
+        import swiglpk
+        swiglpk.glp_std_basis(problem)
+        return True
+    if interface == 'gurobi':
+        problem.reset(0)
+        return True
+    return False
+
+
+class Watchdog:
+    """
+    Time limit for all of the gap-filling of a genome.
+
+    `check` raises a `SolverTimeLimitError` once more than `time_limit` seconds
+    have passed, and is called between gap-filling steps, where stopping leaves
+    the universal model and the gap-filling engine in a consistent state. While
+    the watchdog limits the solver of a model (see `limit_solver`), each LP is
+    given the time that is left, so that an LP running when the limit is
+    reached is stopped by the solver. Does nothing if there is no time limit.
+    """
+
+    def __init__(self, time_limit: Optional[float]):
+        self.time_limit = time_limit
+        self.deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    def check(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise errors.SolverTimeLimitError(f"Gap-filling was stopped after the time limit of {self.time_limit} seconds")
+
+    def remaining(self) -> Optional[float]:
+        """
+        Get the number of seconds left before the time limit, or None if there
+        is no time limit.
+        """
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    @contextmanager
+    def limit_solver(self, model: cobra.Model):
+        """
+        Lower the time limit of each LP solved for a model to the time that is
+        left (see `solver_time_limit`) while in this context.
+        """
+        if self.deadline is None or id(model) in _WATCHDOGS:
+            yield
+            return
+        solver = model.solver
+        configuration = solver.configuration
+        timeout = configuration.timeout
+        optimize = solver.optimize
+
+        def limited_optimize():
+            configuration.timeout = solver_time_limit(model)
+            return optimize()
+
+        _WATCHDOGS[id(model)] = (self, timeout)
+        solver.optimize = limited_optimize
+        try:
+            yield
+        finally:
+            del _WATCHDOGS[id(model)]
+            del solver.optimize
+            configuration.timeout = timeout
@@ -0,0 +1,121 @@
+"""
+Taxonomically scoped DIAMOND sub-databases.
+
+A sub-database only holds the KEGG proteins of a list of organisms (given by
+their KEGG organism prefixes, like 'eco' or 'bsu'), so aligning against it is
+much faster than aligning against the full database when the clade of a genome
+is already known. Sub-databases are built from the full database with DIAMOND
+`getseq` and `makedb` and kept in the cache directory.
+
+A sub-database can be given a name when it is built (`build_subdb`) and is then
+referred to by that name. Otherwise it is identified by its prefixes and built
+on demand the first time it is used (`get_subdb`).
+"""
+
+from typing import Iterable, Optional, Union
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import hashlib
+import json
+import os
+import re
+
+from reconstructor.alignment_cache import AlignmentCache
+from reconstructor.diamond import Diamond
+from reconstructor import errors, resources
+
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def get_subdb_dir() -> Path:
+    """
+    Get the directory that sub-databases are kept in.
+    """
+    return resources.get_cache_dir().joinpath("subdb")
+
+
+def parse_prefixes(prefixes: Union[str, Iterable[str]]) -> list[str]:
+    """
+    Get a sorted list of unique KEGG organism prefixes from a comma separated
+    string or a list.
+    """
+    if isinstance(prefixes, str):
+        prefixes = prefixes.split(",")
+    prefixes = sorted(set(p.strip() for p in prefixes if p.strip() != ""))
+    if len(prefixes) == 0:
+        raise errors.ReconstructorError("A sub-database needs at least one KEGG organism prefix")
+    return prefixes
+
+
+def get_subdb(
+        spec: str,
+        database: Optional[Union[str, os.PathLike]] = None,
+        diamond: Optional[Diamond] = None
+    ) -> Path:
+    """
+    Get the path to a sub-database from its name or its comma separated KEGG
+    organism prefixes. Unnamed sub-databases are built if they don't exist yet.
+    """
+    if _NAME_PATTERN.match(spec) and get_subdb_dir().joinpath(f"{spec}.dmnd").exists():
+        return get_subdb_dir().joinpath(f"{spec}.dmnd")
+    return build_subdb(parse_prefixes(spec), database=database, diamond=diamond)
+
+
+def build_subdb(
+        prefixes: Union[str, Iterable[str]],
+        name: Optional[str] = None,
+        database: Optional[Union[str, os.PathLike]] = None,
+        diamond: Optional[Diamond] = None
+    ) -> Path:
+    """
+    Build a sub-database of the proteins of the given KEGG organisms (unless it
+    has been built already) and return its path.
+
+    Unnamed sub-databases are stored under a digest of the full database and
+    the prefixes, so they are rebuilt if the full database changes. Building a
+    named sub-database always replaces any older one with the same name.
+    """
+    if database is None:
+        database = resources.get_diamond_db_path()
+    if diamond is None:
+        diamond = Diamond()
+    prefixes = parse_prefixes(prefixes)
+    source = AlignmentCache().database_digest(database)
+
+    subdb_dir = get_subdb_dir()
+    subdb_dir.mkdir(parents=True, exist_ok=True)
+    if name is None:
+        key = hashlib.sha256(json.dumps({"database": source, "prefixes": prefixes}).encode()).hexdigest()
+        path = subdb_dir.joinpath(f"{key[:32]}.dmnd")
+        if path.exists():
+            return path
+    else:
+        if not _NAME_PATTERN.match(name):
+            raise errors.ReconstructorError(f"Invalid sub-database name {name}, use letters, digits, '_', '-' and '.'")
+        path = subdb_dir.joinpath(f"{name}.dmnd")
+
+    print(f"Building a DIAMOND sub-database for {len(prefixes)} organism(s) from {database}...")
+    wanted = set(prefixes)
+    with TemporaryDirectory(dir=subdb_dir) as tempdir:
+        fasta = Path(tempdir).joinpath("subdb.fa")
+        count = 0
+        keep = False
+        with open(fasta, "w") as f:
+            for line in diamond.getseq_stream(database):
+                if line.startswith(">"):
+                    keep = line[1:].split(":", 1)[0] in wanted
+                    count += keep
+                if keep:
+                    f.write(line)
+        if count == 0:
+            raise errors.ReconstructorError(f"The database has no proteins for the organism(s): {', '.join(prefixes)}")
+
+        tmp_db = Path(tempdir).joinpath("subdb.dmnd")
+        diamond.makedb(fasta, tmp_db, capture_output=True)
+        os.replace(tmp_db, path)
+
+    with open(path.with_suffix(".json"), "w") as f:
+        json.dump({"database": source, "prefixes": prefixes, "proteins": count}, f)
+    print(f"Sub-database with {count} proteins saved to {path}")
+    return path
@@ -1,9 +1,11 @@
 from pathlib import Path
 from importlib import resources
+import sys
 
 import pytest
 import cobra
 
+import reconstructor.diamond
 import reconstructor.resources
 
 
@@ -40,3 +42,41 @@ def tiny_fasta_file(resource_dir: Path) -> Path:
 @pytest.fixture
 def expected_blast_output_file(resource_dir: Path) -> Path:
     return resource_dir.joinpath("tiny_blast_expected.out")
+
+
+STUB_DIAMOND = """\
+#!{python}
+# Stands in for DIAMOND: every query hits the KEGG gene 'stub:<query id>'
+import sys, time
+args = sys.argv[1:]
+if args[0] == "version":
+    print("diamond version 0.0.0")
+elif args[0] == "blastp":
+    with open({log!r}, "a") as log:
+        log.write(" ".join(args) + "\\n")
+    time.sleep({delay})
+    with open(args[args.index("--query") + 1]) as query:
+        for line in query:
+            if line.startswith(">"):
+                query_id = line[1:].split()[0]
+                print(f"{{query_id}}\\tstub:{{query_id}}", flush=True)
+else:
+    sys.exit(f"unsupported command {{args[0]}}")
+"""
+
+
+@pytest.fixture
+def stub_diamond(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """
+    Put a stub DIAMOND on the PATH that takes 0.5 s for each search. Returns
+    the log file that the arguments of each search are appended to.
+    """
+    bin_dir = tmp_path.joinpath("stub_bin")
+    bin_dir.mkdir()
+    log = tmp_path.joinpath("diamond.log")
+    log.touch()
+    path = bin_dir.joinpath("diamond")
+    path.write_text(STUB_DIAMOND.format(python=sys.executable, log=str(log), delay=0.5))
+    path.chmod(0o755)
+    monkeypatch.setattr(reconstructor.diamond, "_BIN_DIR", bin_dir)
+    return log
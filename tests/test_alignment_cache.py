@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from reconstructor.alignment_cache import AlignmentCache
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> AlignmentCache:
+    return AlignmentCache(tmp_path / "cache", max_size=130)
+
+
+def test_key_ignores_threads(cache: AlignmentCache, tiny_fasta_file: Path, blast_output_file: Path):
+    """
+    The number of threads doesn't change alignment results, so it shouldn't
+    change the cache key, but other options should.
+    """
+    key = cache.key(tiny_fasta_file, blast_output_file, "2.1.14", ["-p", "1", "--more-sensitive"])
+    assert key == cache.key(tiny_fasta_file, blast_output_file, "2.1.14", ["-p", "8", "--more-sensitive"])
+    assert key != cache.key(tiny_fasta_file, blast_output_file, "2.1.14", ["--sensitive"])
+    assert key != cache.key(tiny_fasta_file, blast_output_file, "2.1.13", ["-p", "1", "--more-sensitive"])
+
+
+def test_lru_eviction(cache: AlignmentCache, tmp_path: Path):
+    """
+    Adding results beyond the size limit should evict the least recently used
+    results first.
+    """
+    result = tmp_path / "result.out"
+    result.write_text("x" * 40)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, result)
+        os.utime(cache.get(key), (i, i))
+
+    # Use "a" so that "b" becomes the least recently used result
+    assert cache.get("a") is not None
+    cache.put("d", result)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.info()["entries"] == 3
@@ -0,0 +1,77 @@
+from pathlib import Path
+import os
+
+import cobra
+import pytest
+
+from reconstructor import errors
+from reconstructor.batch import read_manifest, run_batch
+
+
+def _empty_genome(out: Path) -> dict[str, str]:
+    """
+    A batch entry of a genome without any gene hits, so gap-filling has to add
+    its whole biomass pathway.
+    """
+    return {"input_file": "none", "file_type": "2", "gram": "negative", "out": str(out)}
+
+
+def _universal_state(universal: cobra.Model) -> tuple:
+    return (
+        len(universal.reactions),
+        {rxn.id: rxn.bounds for rxn in universal.reactions},
+        str(universal.objective.expression),
+        universal.objective.direction,
+        sorted(c.name for c in universal.solver.constraints)
+    )
+
+
+def test_read_manifest(tmp_path: Path):
+    """
+    Manifest rows should become reconstruct keyword arguments, skipping
+    comments, blank lines and empty cells.
+    """
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text(
+        "# genomes to reconstruct\n"
+        "input_file\tfile_type\tgram\tout\n"
+        "genome1.fa\t1\tnegative\tgenome1.sbml\n"
+        "\n"
+        "genome2.out\t2\t\tgenome2.sbml\n"
+    )
+    assert read_manifest(manifest) == [
+        {"input_file": "genome1.fa", "file_type": "1", "gram": "negative", "out": "genome1.sbml"},
+        {"input_file": "genome2.out", "file_type": "2", "out": "genome2.sbml"}
+    ]
+
+
+def test_read_manifest_unknown_column(tmp_path: Path):
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text("input_file\tcolour\ngenome1.fa\tblue\n")
+    with pytest.raises(errors.ReconstructorError):
+        read_manifest(manifest)
+
+
+def test_universal_unchanged(universal_model: cobra.Model, tmp_path: Path):
+    """
+    Reconstructing a genome should leave the shared universal model as it was
+    for the next genome of the batch.
+    """
+    state = _universal_state(universal_model)
+    results = run_batch([_empty_genome(tmp_path / "genre.sbml")], gapfill_memo="no")
+    assert all(result.ok for result in results)
+    assert _universal_state(universal_model) == state
+
+
+def test_parallel_batch(tmp_path: Path):
+    """
+    With several workers, every genome should be reconstructed in a forked
+    worker process. Gap-filling is covered by `test_universal_unchanged`, so
+    it is skipped here to keep the test quick.
+    """
+    entries = [_empty_genome(tmp_path / f"genre{i}.sbml") for i in range(2)]
+    results = run_batch(entries, workers=2, gapfill="no")
+    assert all(result.ok for result in results)
+    assert sorted(result.out_file for result in results) == sorted(entry["out"] for entry in entries)
+    assert all(Path(result.out_file).exists() for result in results)
+    assert all(result.pid != os.getpid() for result in results)
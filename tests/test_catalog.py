@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import cobra
+
+from reconstructor._funcs import create_model
+from reconstructor.catalog import UniversalCatalog, read_catalog, write_catalog
+
+
+def _summary(model: cobra.Model) -> dict:
+    return {
+        rxn.id: (
+            rxn.name, rxn.bounds, rxn.gene_reaction_rule,
+            {met.id: (coef, met.name, met.compartment) for met, coef in rxn.metabolites.items()}
+        )
+        for rxn in model.reactions
+    }
+
+
+def test_catalog_drafts_match_universal(universal_model: cobra.Model, tmp_path: Path):
+    """
+    Drafts built from the catalog (also after saving and loading it) should be
+    the same as drafts built from the universal model.
+    """
+    rxn_ids = [r.id for r in universal_model.reactions[:500]]
+    rxn_db = {rxn_id: ["org:gene1", "org:gene2"] for rxn_id in rxn_ids}
+    expected = _summary(create_model(rxn_db, universal_model, "draft"))
+
+    catalog = UniversalCatalog.from_model(universal_model)
+    assert _summary(create_model(rxn_db, catalog, "draft")) == expected
+
+    path = write_catalog(catalog, tmp_path / "universal.catalog", "digest")
+    assert read_catalog(path, "other digest") is None
+    loaded = read_catalog(path, "digest")
+    assert len(loaded.reactions) == len(universal_model.reactions)
+    assert _summary(create_model(rxn_db, loaded, "draft")) == expected
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pytest
+
+from reconstructor.dedup import HitIndex, align_batch, read_fasta, sequence_hash
+
+
+def test_sequence_hash_ignores_case_and_stop(tmp_path: Path):
+    """
+    Identical proteins should be aligned once, whatever their case or a
+    trailing stop codon.
+    """
+    fasta = tmp_path.joinpath("genome.fa")
+    fasta.write_text(">a\nMKV\nLLA*\n>b\nmkvlla\n>c\nMKVLLG\n")
+    records = list(read_fasta(fasta))
+    assert [header for header, _ in records] == ["a", "b", "c"]
+    hashes = [sequence_hash(sequence) for _, sequence in records]
+    assert hashes[0] == hashes[1]
+    assert hashes[0] != hashes[2]
+
+
+def test_hit_index(tmp_path: Path):
+    """
+    Sequences without hits should be indexed too, so they aren't aligned again.
+    """
+    with HitIndex(tmp_path.joinpath("hits.sqlite")) as index:
+        index.add({"a": {"eco:b0001", "eco:b0002"}, "b": set()})
+        assert len(index) == 2
+        assert index.lookup(["a", "b", "c"]) == {"a": {"eco:b0001", "eco:b0002"}, "b": set()}
+
+
+def test_align_batch_options(stub_diamond: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Identical proteins should be aligned once with the given sensitivity, and
+    hits indexed with one sensitivity shouldn't be reused for another.
+    """
+    monkeypatch.setenv("RECONSTRUCTOR_CACHE_DIR", str(tmp_path.joinpath("cache")))
+    database = tmp_path.joinpath("kegg.dmnd")
+    database.write_text("stub database")
+    genomes = [tmp_path.joinpath("genome1.fa"), tmp_path.joinpath("genome2.fa")]
+    genomes[0].write_text(">a\nMKV\n>b\nMKVLLG\n")
+    genomes[1].write_text(">c\nmkv*\n")
+
+    hits = align_batch(genomes, database, sensitivity="sensitive", diamond_options=["--block-size", "2"])
+    runs = stub_diamond.read_text().splitlines()
+    assert len(runs) == 1
+    assert "--sensitive" in runs[0].split() and "--block-size" in runs[0].split()
+    assert hits[str(genomes[1])] <= hits[str(genomes[0])]
+    assert len(hits[str(genomes[0])]) == 2
+
+    assert align_batch(genomes, database, sensitivity="sensitive") == hits
+    assert len(stub_diamond.read_text().splitlines()) == 1
+    align_batch(genomes, database, sensitivity="more-sensitive", mode="two-pass")
+    runs = stub_diamond.read_text().splitlines()
+    assert len(runs) == 2
+    assert "--more-sensitive" not in runs[1].split()  # the fast first pass hits every query
@@ -0,0 +1,35 @@
+import os
+from pathlib import Path
+
+from reconstructor.diamond import get_index_path, memory_options, stage_database
+
+
+def test_memory_options():
+    """
+    Larger memory budgets should give larger blocks and fewer index chunks.
+    """
+    assert memory_options(12) == ["--block-size", "2.0", "--index-chunks", "4"]
+    assert memory_options(64) == ["--block-size", "3.6", "--index-chunks", "1"]
+    assert memory_options(1) == ["--block-size", "0.2", "--index-chunks", "4"]
+
+
+def test_stage_database(tmp_path: Path):
+    """
+    The database and its seed index should be copied once and reused until the
+    original changes.
+    """
+    db = tmp_path / "db.dmnd"
+    db.write_text("database")
+    Path(get_index_path(db)).write_text("index")
+
+    staged = stage_database(db, tmp_path / "stage")
+    assert Path(staged).read_text() == "database"
+    assert Path(get_index_path(staged)).read_text() == "index"
+
+    mtime = os.stat(staged).st_mtime_ns
+    assert stage_database(db, tmp_path / "stage") == staged
+    assert os.stat(staged).st_mtime_ns == mtime
+
+    db.write_text("new database")
+    stage_database(db, tmp_path / "stage")
+    assert Path(staged).read_text() == "new database"
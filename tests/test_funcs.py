@@ -1,9 +1,15 @@
 from pathlib import Path
 from tempfile import TemporaryDirectory as TempDir
+import zipfile
 
 import pytest
+import cobra
+
+from reconstructor._funcs import (
+    run_blast, stream_blast, align_queries, two_pass_align, read_blast, genes_to_rxns, create_model, gapfill_model
+)
+import reconstructor.resources
 
-from reconstructor._funcs import run_blast, read_blast, genes_to_rxns
 
 
 def test_blast(tiny_fasta_file: Path, expected_blast_output_file: Path, kegg_prot_db: Path):
@@ -19,6 +25,33 @@ def test_blast(tiny_fasta_file: Path, expected_blast_output_file: Path, kegg_pro
             f.write(results)
 
 
+def test_stream_blast(tiny_fasta_file: Path, kegg_prot_db: Path):
+    """
+    Hits parsed from DIAMOND's output as it streams in should be the same as
+    those read from a saved output file.
+    """
+    with TempDir() as tmpdir:
+        out_path = Path(tmpdir).joinpath("blast.out")
+        run_blast(tiny_fasta_file, out_path, kegg_prot_db, 1)
+        assert stream_blast(tiny_fasta_file, kegg_prot_db, "1") == read_blast(out_path)
+
+
+def test_two_pass_blast(tmp_path: Path, kegg_prot_db: Path):
+    """
+    A two-pass (default, then more-sensitive) alignment of the
+    488.146.clean.fa test genome should recover the queries hit by a single
+    more-sensitive alignment.
+    """
+    with zipfile.ZipFile(reconstructor.resources.RESOURCE_DIR.joinpath("testfiles.zip")) as archive:
+        fasta = Path(archive.extract("488.146.clean.fa", tmp_path))
+
+    single = align_queries(fasta, kegg_prot_db, "1", ["--more-sensitive"])
+    two_pass = two_pass_align(fasta, kegg_prot_db, "1", "more-sensitive")
+
+    recovery = len(set(two_pass).intersection(single)) / len(single)
+    assert recovery > 0.98
+
+
 def test_read_blast(blast_output_file: Path):
     """
     This is just a very basic test to ensure that a BLAST output file is read
@@ -73,3 +106,39 @@ def test_genes_to_rxns(blast_output_file: Path, modelseed_db: dict[str, list[str
     blast_hits = read_blast(blast_output_file)
     reactions = genes_to_rxns(blast_hits, modelseed_db, "default")
     assert reactions == expected
+
+
+def test_create_model_bulk(universal_model: cobra.Model):
+    """
+    Building a large (3000+ reaction) draft with one batched addition should
+    give the same model as adding each reaction separately, and the exchanges
+    added by gapfill_model should be the same as those of add_boundary.
+    """
+    rxn_ids = [r.id for r in universal_model.reactions if not r.id.startswith("EX_")][:3500]
+    rxn_db = {rxn_id: [f"org:gene{i}", f"org:gene{i + 1}"] for i, rxn_id in enumerate(rxn_ids)}
+
+    def create_model_per_reaction(rxn_db, universal, input_id):
+        new_model = cobra.Model(input_id)
+        for x in rxn_db:
+            new_model.add_reactions([universal.reactions.get_by_id(x).copy()])
+            new_model.reactions.get_by_id(x).gene_reaction_rule = " or ".join(rxn_db[x])
+        return new_model
+
+    bulk = create_model(rxn_db, universal_model, "bulk")
+    single = create_model_per_reaction(rxn_db, universal_model, "single")
+
+    assert set(rxn.id for rxn in bulk.reactions) == set(rxn.id for rxn in single.reactions) == set(rxn_ids)
+    assert set(met.id for met in bulk.metabolites) == set(met.id for met in single.metabolites)
+    assert {rxn.id: rxn.bounds for rxn in bulk.reactions} == {rxn.id: rxn.bounds for rxn in single.reactions}
+    for rxn in single.reactions:
+        assert bulk.reactions.get_by_id(rxn.id).gene_reaction_rule == rxn.gene_reaction_rule
+
+    obj = "biomass_GmNeg"
+    filled = gapfill_model(bulk, universal_model, [], obj, 1)
+    for cpd in single.metabolites:
+        if cpd.compartment == "extracellular" and not single.reactions.has_id("EX_" + cpd.id):
+            single.add_boundary(cpd, type="exchange", reaction_id="EX_" + cpd.id, lb=-1000.0, ub=1000.0)
+    for exch in single.exchanges:
+        filled_exch = filled.reactions.get_by_id(exch.id)
+        assert filled_exch.bounds == exch.bounds
+        assert filled_exch.metabolites == {filled.metabolites.get_by_id(m.id): c for m, c in exch.metabolites.items()}
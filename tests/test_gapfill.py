@@ -0,0 +1,252 @@
+from pathlib import Path
+
+import pytest
+import cobra
+
+from reconstructor._funcs import read_blast, genes_to_rxns, create_model, find_reactions, gapfill_model, set_base_inputs
+from reconstructor.build import GRAM_OBJECTIVES, GapfillOptions, infer_gram
+from reconstructor.gapfill import GapfillEngine, MatrixGapfillEngine, ObjectiveMaxima, get_engine, get_objective_maxima
+from reconstructor.media import get_media, set_media
+
+
+@pytest.fixture
+def draft_model(blast_output_file: Path, modelseed_db: dict[str, list[str]], universal_model: cobra.Model) -> cobra.Model:
+    rxns = genes_to_rxns(read_blast(blast_output_file), modelseed_db, "default")
+    return create_model(rxns, universal_model, "draft")
+
+
+@pytest.fixture
+def clean_universal(universal_model: cobra.Model):
+    """
+    The universal model, with any objective constraints added by gap-filling
+    removed afterwards.
+    """
+    constraints = set(c.name for c in universal_model.constraints)
+    yield universal_model
+    universal_model.solver.remove([c for c in universal_model.constraints if c.name not in constraints])
+
+
+@pytest.mark.parametrize("kind", ["persistent", "matrix"])
+def test_engine_matches_find_reactions(kind: str, draft_model: cobra.Model, clean_universal: cobra.Model):
+    """
+    Gap-filling engines should add the same reactions as find_reactions.
+    """
+    if kind == "matrix":
+        pytest.importorskip("scipy")
+    args = ([], "biomass_GmNeg", 0.01, 0.5, 1, 1)
+    engine = get_engine(kind, clean_universal)
+    try:
+        result = engine.find_reactions(draft_model, *args)
+    finally:
+        engine.reset()
+    expected = find_reactions(draft_model, clean_universal, *args)
+    assert result == expected
+
+
+def test_warm_started_step_2(draft_model: cobra.Model, clean_universal: cobra.Model):
+    """
+    Starting step 2 from the basis of step 1 should give the same reactions as
+    a cold start in no more simplex iterations.
+    """
+    results = {}
+    for warm_start in (True, False):
+        engine = GapfillEngine(clean_universal, warm_start=warm_start)
+        try:
+            draft = draft_model.copy()
+            new_rxn_ids = engine.find_reactions(draft, [], "biomass_GmNeg", 0.01, 0.5, 1, 1)
+            filled = set_base_inputs(gapfill_model(draft, clean_universal, new_rxn_ids, "biomass_GmNeg", 1), clean_universal)
+            media_rxn_ids = engine.find_reactions(filled, [], "biomass_GmNeg", 0.01, 0.5, 2, 1)
+            results[warm_start] = (new_rxn_ids, media_rxn_ids, dict(engine.iterations))
+        finally:
+            engine.reset()
+
+    assert results[True][:2] == results[False][:2]
+    assert results[True][2][2] <= results[False][2][2]
+
+
+def _pathway_draft(universal: cobra.Model, obj: str) -> cobra.Model:
+    """
+    A draft with the reactions of an optimal solution for an objective over the
+    universal model (with its current media), without the biomass reactions.
+    """
+    _, fluxes = ObjectiveMaxima(universal, version="test").get(obj)
+    draft = cobra.Model("draft")
+    draft.add_reactions([
+        universal.reactions.get_by_id(rxn_id).copy() for rxn_id in fluxes if rxn_id not in GRAM_OBJECTIVES.values()
+    ])
+    return draft
+
+
+def test_warm_start_saves_iterations(clean_universal: cobra.Model):
+    """
+    On glpk, step 2 started from the basis of step 1 should take fewer simplex
+    iterations than the same LP solved from a reset basis.
+    """
+    obj = GRAM_OBJECTIVES["negative"]
+    engine = GapfillEngine(clean_universal, measure_cold_start=True)
+    try:
+        with clean_universal:
+            set_media(clean_universal, get_media("rich"))
+            draft = _pathway_draft(clean_universal, GRAM_OBJECTIVES["positive"])
+            new_rxn_ids = engine.find_reactions(draft, [], obj, 0.01, 0.5, 1, 1)
+            assert len(new_rxn_ids) > 1
+            filled = set_base_inputs(gapfill_model(draft, clean_universal, new_rxn_ids, obj, 1), clean_universal)
+            engine.find_reactions(filled, [], obj, 0.01, 0.5, 2, 1)
+        warm, cold = engine.step_2_iterations
+    finally:
+        engine.reset()
+    assert warm < cold
+
+
+@pytest.mark.parametrize("kind", ["bag", "persistent"])
+def test_fast_path(kind: str, draft_model: cobra.Model, clean_universal: cobra.Model):
+    """
+    A draft that already meets the objective should only get the objective
+    without the gap-filling LP.
+    """
+    args = ([], "biomass_GmNeg", 0.01, 0.5, 1, 1)
+    engine = GapfillEngine(clean_universal)
+    try:
+        new_rxn_ids = engine.find_reactions(draft_model, *args)
+        engine.reset()
+        constraint_names = set(c.name for c in clean_universal.constraints)
+        filled = gapfill_model(draft_model, clean_universal, new_rxn_ids, "biomass_GmNeg", 1)
+        results = {}
+        for fast_path in (True, False):
+            if kind == "bag":
+                maxima = ObjectiveMaxima(clean_universal, version="test")
+                results[fast_path] = find_reactions(filled, clean_universal, *args, fast_path=fast_path, objective_maxima=maxima)
+                clean_universal.solver.remove([c for c in clean_universal.constraints if c.name not in constraint_names])
+            else:
+                engine.fast_path = fast_path
+                results[fast_path] = engine.find_reactions(filled, *args)
+                engine.reset()
+    finally:
+        engine.reset()
+
+    # The LP can return a slightly costlier solution within the solver's
+    # tolerances, but never one without the objective
+    assert results[True] == {"biomass_GmNeg"}
+    assert results[True] <= results[False]
+
+
+def test_fast_path_skips_lp(clean_universal: cobra.Model, monkeypatch):
+    """
+    A type 1 draft that already grows on the media should be gap-filled
+    without solving anything over the universal model.
+    """
+    obj = "biomass_GmNeg"
+    with clean_universal:
+        set_media(clean_universal, get_media("rich"))
+        maxima = ObjectiveMaxima(clean_universal, version="test")
+        _, fluxes = maxima.get(obj)
+        draft = cobra.Model("draft")
+        draft.add_reactions([clean_universal.reactions.get_by_id(rxn_id).copy() for rxn_id in fluxes if rxn_id != obj])
+
+        def fail(*args, **kwargs):
+            raise AssertionError("The universal model was solved")
+        monkeypatch.setattr(clean_universal, "slim_optimize", fail)
+        monkeypatch.setattr(clean_universal, "optimize", fail)
+        new_rxn_ids = find_reactions(draft, clean_universal, [], obj, 0.01, 0.5, 1, 1, fast_path=True, objective_maxima=maxima)
+    assert new_rxn_ids == {obj}
+
+
+def test_objective_maxima(draft_model: cobra.Model, clean_universal: cobra.Model):
+    """
+    Cached objective maxima should be used for drafts that can't change the
+    maximum, and give the same gap-filling result.
+    """
+    maxima = ObjectiveMaxima(clean_universal, version="test")
+    value, fluxes = maxima.get("biomass_GmNeg")
+    assert value == pytest.approx(fluxes["biomass_GmNeg"])
+    assert maxima.maximum(draft_model, [], "biomass_GmNeg", 0.01, 1) == value
+
+    args = ([], "biomass_GmNeg", 0.01, 0.5, 1, 1)
+    engine = GapfillEngine(clean_universal)
+    try:
+        result = engine.find_reactions(draft_model, *args, objective_maxima=maxima)
+        engine.reset()
+        assert result == engine.find_reactions(draft_model, *args)
+    finally:
+        engine.reset()
+
+    # Reactions that the universal model doesn't have could raise the maximum
+    foreign = draft_model.copy()
+    foreign.add_reactions([cobra.Reaction("rxn_foreign", lower_bound=-1000.0, upper_bound=1000.0)])
+    assert maxima.maximum(foreign, [], "biomass_GmNeg", 0.01, 1) is None
+
+
+def _toy_universal(coefficient: float) -> cobra.Model:
+    """
+    A universal model that makes B from A, with `coefficient` B per A.
+    """
+    model = cobra.Model("toy")
+    a, b = cobra.Metabolite("A", compartment="c"), cobra.Metabolite("B", compartment="c")
+    uptake = cobra.Reaction("EX_A", lower_bound=-10, upper_bound=1000)
+    uptake.add_metabolites({a: -1})
+    convert = cobra.Reaction("rxn1")
+    convert.add_metabolites({a: -1, b: coefficient})
+    bio = cobra.Reaction("bio")
+    bio.add_metabolites({b: -1})
+    model.add_reactions([uptake, convert, bio])
+    return model
+
+
+def test_shared_objective_maxima(monkeypatch: pytest.MonkeyPatch):
+    """
+    Objective maxima should be kept in memory for each universal model, and
+    universal models with different reactions shouldn't share them.
+    """
+    universal, other = _toy_universal(1), _toy_universal(2)
+    maxima = get_objective_maxima(universal)
+    assert get_objective_maxima(universal) is maxima
+    assert get_objective_maxima(other) is not maxima
+    assert get_objective_maxima(other).version != maxima.version
+    assert maxima.get("bio")[0] == pytest.approx(10)
+    assert get_objective_maxima(other).get("bio")[0] == pytest.approx(20)
+
+    def fail():
+        raise AssertionError("the maximum should not be solved again")
+    monkeypatch.setattr(universal, "slim_optimize", fail)
+    assert maxima.memo is None
+    assert get_objective_maxima(universal).get("bio")[0] == pytest.approx(10)
+
+
+def test_matrix_fast_path(monkeypatch: pytest.MonkeyPatch):
+    """
+    The matrix engine should skip its LPs when the draft, applied to its
+    bounds, already meets the objective.
+    """
+    pytest.importorskip("scipy")
+    universal = _toy_universal(1)
+    draft = cobra.Model("draft")
+    draft.add_reactions([universal.reactions.get_by_id(rxn_id).copy() for rxn_id in ("EX_A", "rxn1")])
+    engine = MatrixGapfillEngine(universal)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("no LP should be solved")
+    monkeypatch.setattr(engine, "_solve", fail)
+    maxima = get_objective_maxima(universal)
+    assert engine.find_reactions(draft, [], "bio", 0.01, 0.5, 1, 1, objective_maxima=maxima) == {"bio"}
+
+
+@pytest.mark.parametrize("gram", ["positive", "negative"])
+def test_infer_gram(gram: str, clean_universal: cobra.Model):
+    """
+    A draft with the pathways of one Gram type's biomass should be inferred as
+    that type, and the universal model should be left unchanged.
+    """
+    media = get_media("rich")
+    with clean_universal:
+        set_media(clean_universal, media)
+        draft = _pathway_draft(clean_universal, GRAM_OBJECTIVES[gram])
+
+    constraints = set(c.name for c in clean_universal.constraints)
+    gram_type, (new_rxn_ids, (lb, ub)) = infer_gram(
+        draft, clean_universal, media, [], 0.01, 0.5, 1,
+        GapfillOptions(gapfill_engine="persistent", gapfill_memo="no")
+    )
+    assert gram_type == gram
+    assert new_rxn_ids == {GRAM_OBJECTIVES[gram]}
+    assert 0 < lb <= ub
+    assert set(c.name for c in clean_universal.constraints) == constraints
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from reconstructor._funcs import genes_to_rxns
+from reconstructor.genemap import CompiledMap, compile_map, _prefix_upper_bound
+
+
+GENE_RXNS = {
+    "eco:b0001": ["rxn00001", "rxn00002"],
+    "eco:b0002": ["rxn00002"],
+    "sen:SEN0001": ["rxn00003"],
+    "aai:AARI_1": []
+}
+
+
+def test_compiled_map(tmp_path: Path):
+    """
+    A compiled map should behave like the dictionary it was compiled from.
+    """
+    compiled = CompiledMap(compile_map(GENE_RXNS, tmp_path / "map"))
+    assert dict(compiled) == GENE_RXNS
+    assert "eco:b0002" in compiled
+    assert "eco:b0003" not in compiled
+    assert compiled.get("eco:b0003", []) == []
+
+    names = CompiledMap(compile_map({"eco:b0001": "thrL"}, tmp_path / "names"), single=True)
+    assert names["eco:b0001"] == "thrL"
+
+
+def test_prefix_keys(tmp_path: Path):
+    """
+    The genes of an organism should be found by their prefix, without matching
+    organisms whose codes start with the same letters.
+    """
+    compiled = CompiledMap(compile_map({**GENE_RXNS, "ecoa:x1": ["rxn00004"]}, tmp_path / "map"))
+    assert compiled.prefix_keys("eco:") == ["eco:b0001", "eco:b0002"]
+    assert compiled.prefix_keys("xyz:") == []
+    assert compiled.prefix_keys("") == sorted(compiled)
+
+
+def test_prefix_upper_bound():
+    """
+    A trailing 0xFF byte can't be incremented, so the increment should carry
+    into the previous byte, and there should be no upper bound if every byte
+    is 0xFF.
+    """
+    assert _prefix_upper_bound(b"eco:") == b"eco;"
+    assert _prefix_upper_bound(b"a\xff") == b"b"
+    assert _prefix_upper_bound(b"a\xfe\xff\xff") == b"a\xff"
+    assert _prefix_upper_bound(b"\xff\xff") is None
+    assert _prefix_upper_bound(b"") is None
+
+
+def test_compiled_genes_to_rxns(tmp_path: Path):
+    """
+    The vectorized lookup should give the same reactions as the dictionary one.
+    """
+    compiled = CompiledMap(compile_map(GENE_RXNS, tmp_path / "map"))
+    hits = {"eco:b0001", "eco:b0002", "sen:SEN0001", "aai:AARI_1", "xyz:unknown"}
+    expected = genes_to_rxns(set(hits), GENE_RXNS, "default")
+    result = genes_to_rxns(set(hits), compiled, "default")
+    assert {k: sorted(v) for k, v in result.items()} == {k: sorted(v) for k, v in expected.items()}
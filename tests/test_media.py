@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import pytest
+import cobra
+
+from reconstructor.build import get_media_out_file, write_media_presence
+from reconstructor.media import MEDIA_PRESETS, get_media, get_media_set, load_media_file, set_bounds, set_media
+from reconstructor.errors import ReconstructorError
+import reconstructor.media
+
+
+@pytest.fixture
+def media_registry(monkeypatch: pytest.MonkeyPatch) -> dict[str, list[str]]:
+    """
+    A copy of the media registry that is discarded after the test, so media
+    registered by one test aren't seen by others.
+    """
+    registry = {name: list(media) for name, media in reconstructor.media._REGISTRY.items()}
+    monkeypatch.setattr(reconstructor.media, "_REGISTRY", registry)
+    return registry
+
+
+def test_get_media_set(tmp_path: Path, media_registry: dict[str, list[str]]):
+    """
+    Media sets can be preset names or a file of named media.
+    """
+    media_set = get_media_set("rich,minimal")
+    assert media_set == {"rich": MEDIA_PRESETS["rich"], "minimal": MEDIA_PRESETS["minimal"]}
+
+    path = tmp_path / "media.tsv"
+    path.write_text("# name\tmedia\nglucose\tcpd00027_e,cpd00001_e\nrich\trich\n")
+    assert get_media_set(str(path)) == {"glucose": ["cpd00027_e", "cpd00001_e"], "rich": MEDIA_PRESETS["rich"]}
+
+    with pytest.raises(ReconstructorError):
+        get_media_set("rich,unknown")
+
+
+def test_load_media_file(tmp_path: Path, media_registry: dict[str, list[str]]):
+    """
+    Media from media files should be usable by name.
+    """
+    path = tmp_path / "glucose_m9.txt"
+    path.write_text("cpd00027_e\ncpd00001_e,cpd00009_e\n")
+    assert load_media_file(path) == ["glucose_m9"]
+    assert get_media("glucose_m9") == ["cpd00027_e", "cpd00001_e", "cpd00009_e"]
+    assert get_media_set("rich,glucose_m9")["glucose_m9"] == get_media("glucose_m9")
+    assert "glucose_m9" in media_registry
+
+
+def test_set_media():
+    """
+    Only the exchanges whose bounds change should be updated.
+    """
+    model = cobra.Model("model")
+    model.add_reactions([cobra.Reaction(f"EX_cpd0000{i}_e", lower_bound=-1000.0, upper_bound=1000.0) for i in range(4)])
+    model.add_reactions([cobra.Reaction("rxn00001_c", lower_bound=-1000.0, upper_bound=1000.0)])
+
+    assert set_media(model, ["cpd00000_e", "cpd00001_e"]) == 4
+    assert model.reactions.get_by_id("EX_cpd00000_e").bounds == (-1000.0, 10000)
+    assert model.reactions.get_by_id("EX_cpd00002_e").bounds == (0, 1000.0)
+    assert model.reactions.get_by_id("rxn00001_c").bounds == (-1000.0, 1000.0)
+    assert set_media(model, ["cpd00001_e", "cpd00002_e"]) == 2
+    assert set_media(model, []) == 0
+
+    # Changes are reverted with the model's context, in the solver too
+    exchange = model.reactions.get_by_id("EX_cpd00000_e")
+    with model:
+        assert set_media(model, ["cpd00000_e"]) == 3
+        assert exchange.bounds == (-1000.0, 10000)
+        assert exchange.reverse_variable.ub == 1000.0
+    assert exchange.bounds == (0, 1000.0)
+    assert exchange.reverse_variable.ub == 0
+    assert model.reactions.get_by_id("EX_cpd00002_e").bounds == (-1000.0, 10000)
+
+
+def test_set_bounds():
+    """
+    Bounds set together should be reverted together, as one context entry.
+    """
+    model = cobra.Model("model")
+    model.add_reactions([cobra.Reaction(f"rxn0000{i}_c", lower_bound=-1000.0, upper_bound=1000.0) for i in range(3)])
+    with model:
+        assert set_bounds(model, [(rxn, (0, 0)) for rxn in model.reactions]) == 3
+        assert len(model._contexts[-1]._history) == 1
+        assert all(rxn.forward_variable.ub == 0 for rxn in model.reactions)
+    assert all(rxn.bounds == (-1000.0, 1000.0) for rxn in model.reactions)
+    assert all(rxn.forward_variable.ub == 1000.0 for rxn in model.reactions)
+    assert set_bounds(model, []) == 0
+
+
+def test_write_media_presence(tmp_path: Path):
+    """
+    The presence table should have a row per reaction and a column per media.
+    """
+    genres = {}
+    for media_name, rxn_ids in [("rich", ["rxn1", "rxn2"]), ("minimal", ["rxn2", "rxn3"])]:
+        genres[media_name] = cobra.Model(media_name)
+        genres[media_name].add_reactions([cobra.Reaction(rxn_id) for rxn_id in rxn_ids])
+
+    path = write_media_presence(genres, tmp_path / "presence.tsv")
+    assert path.read_text().splitlines() == [
+        "reaction\trich\tminimal",
+        "rxn1\t1\t0",
+        "rxn2\t1\t1",
+        "rxn3\t0\t1"
+    ]
+    assert get_media_out_file("genome.sbml", "rich") == "genome.rich.sbml"
+    assert get_media_out_file("genome.sbml", "media_presence", ".tsv") == "genome.media_presence.tsv"
@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import pytest
+import cobra
+
+from reconstructor._funcs import read_blast, genes_to_rxns, create_model
+from reconstructor.build import _gapfill
+from reconstructor.media import get_media
+from reconstructor.memo import GapfillMemo, _NEXT_USE
+
+
+@pytest.fixture
+def memo(tmp_path: Path) -> GapfillMemo:
+    with GapfillMemo(tmp_path / "memo.sqlite", max_entries=2) as memo:
+        yield memo
+
+
+def _model(bounds=(-1000.0, 1000.0), coefficient=-1.0) -> cobra.Model:
+    model = cobra.Model("draft")
+    a = cobra.Metabolite("cpd00001_c")
+    b = cobra.Metabolite("cpd00002_c")
+    rxn = cobra.Reaction("rxn00001_c", lower_bound=bounds[0], upper_bound=bounds[1])
+    rxn.add_metabolites({a: coefficient, b: 1.0})
+    model.add_reactions([rxn])
+    return model
+
+
+def test_key(memo: GapfillMemo):
+    """
+    The key should depend on the draft's bounds and stoichiometry and on the
+    run parameters, but not on the order of the tasks.
+    """
+    args = ("v1", "media", ["a", "b"], "biomass", 0.01, 0.5, 1)
+    key = memo.key(_model(), *args)
+    assert key == memo.key(_model(), "v1", "media", ["b", "a"], "biomass", 0.01, 0.5, 1)
+    assert key != memo.key(_model(bounds=(0.0, 1000.0)), *args)
+    assert key != memo.key(_model(coefficient=-2.0), *args)
+    assert key != memo.key(_model(), "v2", *args[1:])
+    assert key != memo.key(_model(), "v1", "other media", *args[2:])
+    assert key != memo.key(_model(), *args[:-1], 3)
+    assert key != memo.key(_model(), *args, engine=["matrix", 0, "no"])
+
+
+def test_get_put_and_eviction(memo: GapfillMemo):
+    """
+    Memoized steps should be returned as they were saved, and the least
+    recently used results should be evicted beyond the maximum.
+    """
+    assert memo.get("a") is None
+    memo.put("a", [{"rxn1", "rxn2"}, set()])
+    memo.put("b", [{"rxn3"}])
+    assert memo.get("a") == [{"rxn1", "rxn2"}, set()]
+    memo.put("c", [{"rxn4"}])
+    assert memo.get("b") is None
+    assert memo.get("a") is not None
+
+    stats = memo.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (2, 2, 2)
+    assert memo.clear() == 2
+    assert memo.stats()["hits"] == 0
+
+
+def test_next_use_is_indexed(memo: GapfillMemo):
+    """
+    The next use counter and eviction should be looked up in the index of the
+    use counter rather than by scanning every result.
+    """
+    for query in (f"SELECT {_NEXT_USE}", "SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET 2"):
+        plan = " ".join(row[-1] for row in memo._connection.execute(f"EXPLAIN QUERY PLAN {query}"))
+        assert "results_last_used" in plan
+
+
+def test_objective_maxima(memo: GapfillMemo):
+    """
+    Objective maxima should be saved with their fluxes and removed by clear.
+    """
+    assert memo.get_maximum("a") is None
+    memo.put_maximum("a", 1.5, {"biomass": 1.5, "rxn1": -2.0})
+    assert memo.get_maximum("a") == (1.5, {"biomass": 1.5, "rxn1": -2.0})
+    assert memo.stats()["maxima"] == 1
+    memo.clear()
+    assert memo.get_maximum("a") is None
+
+
+def test_memoized_gapfill(
+        blast_output_file: Path,
+        modelseed_db: dict[str, list[str]],
+        universal_model: cobra.Model,
+        tmp_path: Path,
+        monkeypatch
+    ):
+    """
+    Gap-filling the same draft again should reuse the memoized reactions and
+    give the same GENRE.
+    """
+    monkeypatch.setenv("RECONSTRUCTOR_CACHE_DIR", str(tmp_path))
+    rxns = genes_to_rxns(read_blast(blast_output_file), modelseed_db, "default")
+    args = (universal_model, get_media("rich"), [], "biomass_GmNeg", 0.01, 0.5, 1, "negative")
+    first = _gapfill(create_model(rxns, universal_model, "draft"), *args)
+    second = _gapfill(create_model(rxns, universal_model, "draft"), *args)
+    assert set(r.id for r in second.reactions) == set(r.id for r in first.reactions)
+
+    with GapfillMemo() as memo:
+        stats = memo.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
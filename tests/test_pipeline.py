@@ -0,0 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import asyncio
+import multiprocessing
+import os
+
+import reconstructor.pipeline
+from reconstructor.alignment_cache import AlignmentCache
+from reconstructor.pipeline import _run, align_async
+
+
+def _killed_worker(entry, defaults):
+    # A worker that is killed, e.g. when it runs out of memory
+    os._exit(1)
+
+
+def test_align_async(stub_diamond: Path, tiny_fasta_file: Path, tmp_path: Path):
+    """
+    Alignments should run without blocking the event loop, and a cached
+    alignment shouldn't run DIAMOND again.
+    """
+    database = tmp_path.joinpath("kegg.dmnd")
+    database.write_text("stub database")
+    cache = AlignmentCache(tmp_path.joinpath("cache"))
+    outputfile = tmp_path.joinpath("genome.KEGGprot.out")
+
+    async def align_and_tick():
+        ticks = 0
+        task = asyncio.create_task(align_async(tiny_fasta_file, database, 1, [], outputfile, cache))
+        while not task.done():
+            await asyncio.sleep(0.05)
+            ticks += 1
+        return await task, ticks
+
+    hits, ticks = asyncio.run(align_and_tick())
+    assert len(hits) == 5
+    assert all(hit.startswith("stub:fig|488.146.peg.") for hit in hits)
+    assert ticks >= 5
+    assert len(outputfile.read_text().splitlines()) == 5
+
+    outputfile.unlink()
+    assert asyncio.run(align_async(tiny_fasta_file, database, 1, [], outputfile, cache)) == hits
+    assert len(stub_diamond.read_text().splitlines()) == 1
+    assert outputfile.exists()
+
+
+def test_broken_pool(monkeypatch):
+    """
+    If a gap-filling worker dies, every genome should be recorded as failed
+    instead of the pipeline waiting forever on its queues.
+    """
+    monkeypatch.setattr(reconstructor.pipeline, "_run_entry", _killed_worker)
+    entries = [{"input_file": f"genome{i}.out", "file_type": "2"} for i in range(4)]
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork")) as executor:
+        results = asyncio.run(asyncio.wait_for(_run(entries, {}, 1, 1, executor), timeout=60))
+    assert sorted(result.input_file for result in results) == [entry["input_file"] for entry in entries]
+    assert all("BrokenProcessPool" in result.error for result in results)
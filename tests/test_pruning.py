@@ -0,0 +1,95 @@
+import pytest
+import cobra
+
+from reconstructor.pruning import NetworkIndex, PrunedGapfillEngine, get_pruned_reactions
+
+
+@pytest.fixture
+def chain_model() -> cobra.Model:
+    """
+    A linear chain A -> B -> C -> D.
+    """
+    model = cobra.Model("chain")
+    mets = {x: cobra.Metabolite(x, compartment="c") for x in "ABCD"}
+    for i, (a, b) in enumerate(zip("ABC", "BCD"), start=1):
+        rxn = cobra.Reaction(f"r{i}")
+        rxn.add_metabolites({mets[a]: -1, mets[b]: 1})
+        model.add_reactions([rxn])
+    return model
+
+
+@pytest.fixture
+def long_chain_universal() -> cobra.Model:
+    """
+    A universal model with the linear pathway A -> B -> ... -> F, an uptake of
+    A and an objective consuming F.
+    """
+    model = cobra.Model("long_chain")
+    mets = {x: cobra.Metabolite(x, compartment="c") for x in "ABCDEF"}
+    for i, (a, b) in enumerate(zip("ABCDE", "BCDEF"), start=1):
+        rxn = cobra.Reaction(f"r{i}", upper_bound=1000)
+        rxn.add_metabolites({mets[a]: -1, mets[b]: 1})
+        model.add_reactions([rxn])
+    uptake = cobra.Reaction("EX_A", lower_bound=-10, upper_bound=1000)
+    uptake.add_metabolites({mets["A"]: -1})
+    bio = cobra.Reaction("bio", upper_bound=1000)
+    bio.add_metabolites({mets["F"]: -1})
+    model.add_reactions([uptake, bio])
+    return model
+
+
+@pytest.fixture
+def chain_draft(long_chain_universal: cobra.Model) -> cobra.Model:
+    draft = cobra.Model("draft")
+    draft.add_reactions([long_chain_universal.reactions.r1.copy()])
+    return draft
+
+
+def test_neighbourhood(chain_model: cobra.Model):
+    index = NetworkIndex(chain_model)
+    assert index.neighbourhood(["A"], 1) == {"r1"}
+    assert index.neighbourhood(["A"], 2) == {"r1", "r2"}
+    assert index.neighbourhood(["A"], 5) == {"r1", "r2", "r3"}
+
+
+def test_neighbourhood_skips_hubs(chain_model: cobra.Model):
+    """
+    Metabolites in more than max_degree reactions should not be expanded.
+    """
+    index = NetworkIndex(chain_model)
+    assert index.neighbourhood(["B"], 1) == {"r1", "r2"}
+    assert index.neighbourhood(["B"], 1, max_degree=1) == set()
+
+
+def test_pruned_reactions(long_chain_universal: cobra.Model, chain_draft: cobra.Model):
+    keep = get_pruned_reactions(long_chain_universal, chain_draft, "bio", 1)
+    assert keep == {"EX_A", "r1", "r2", "r5", "bio"}
+    assert get_pruned_reactions(long_chain_universal, chain_draft, "bio", 1) is keep
+    assert get_pruned_reactions(long_chain_universal, chain_draft, "bio", 2) == keep | {"r3", "r4"}
+
+
+def test_pruned_gapfill(long_chain_universal: cobra.Model, chain_draft: cobra.Model, capsys):
+    """
+    Pruning should only switch bounds on the universal model, and verifying
+    should fall back to the full result when pruning lowers the objective.
+    """
+    bounds = {rxn.id: rxn.bounds for rxn in long_chain_universal.reactions}
+    args = (chain_draft, [], "bio", 0.01, 0.5, 1, 1)
+    full = {"EX_A", "r2", "r3", "r4", "r5", "bio"}
+
+    engine = PrunedGapfillEngine(long_chain_universal, hops=2, verify=True)
+    assert engine.find_reactions(*args) == full
+    assert "matches the full solve" in capsys.readouterr().out
+    engine.reset()
+
+    engine = PrunedGapfillEngine(long_chain_universal, hops=1)
+    assert engine.find_reactions(*args) == set()
+    engine.reset()
+
+    engine = PrunedGapfillEngine(long_chain_universal, hops=1, verify=True)
+    assert engine.find_reactions(*args) == full
+    assert "changed the objective bounds" in capsys.readouterr().out
+    engine.reset()
+
+    assert len(long_chain_universal.reactions) == len(bounds)
+    assert {rxn.id: rxn.bounds for rxn in long_chain_universal.reactions} == bounds
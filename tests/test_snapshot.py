@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import pytest
+import cobra
+
+from reconstructor import snapshot, errors, resources
+
+
+@pytest.fixture
+def small_model(universal_model: cobra.Model) -> cobra.Model:
+    model = cobra.Model("small_model")
+    model.add_reactions([rxn.copy() for rxn in universal_model.reactions[:50]])
+    return model
+
+
+@pytest.mark.parametrize("include_solver", [True, False])
+def test_snapshot_roundtrip(small_model: cobra.Model, tmp_path: Path, include_solver: bool):
+    """
+    A model loaded from a snapshot should have the same reactions, bounds and
+    annotations as the model the snapshot was written from.
+    """
+    path = tmp_path / "model.snapshot"
+    snapshot.write_snapshot(small_model, path, "abc", include_solver=include_solver)
+    loaded = snapshot.read_snapshot(path, "abc")
+
+    assert [r.id for r in loaded.reactions] == [r.id for r in small_model.reactions]
+    for rxn in small_model.reactions:
+        other = loaded.reactions.get_by_id(rxn.id)
+        assert other.bounds == rxn.bounds
+        assert other.annotation == rxn.annotation
+        assert {m.id: c for m, c in other.metabolites.items()} == {m.id: c for m, c in rxn.metabolites.items()}
+
+
+def test_snapshot_rejects_stale_and_corrupt(small_model: cobra.Model, tmp_path: Path):
+    """
+    Snapshots made from a different source file or with a corrupted payload
+    should not be loaded.
+    """
+    path = tmp_path / "model.snapshot"
+    snapshot.write_snapshot(small_model, path, "abc")
+
+    with pytest.raises(errors.SnapshotError):
+        snapshot.read_snapshot(path, "def")
+
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(errors.SnapshotError):
+        snapshot.read_snapshot(path, "abc")
+
+
+def test_unwritable_cache_dir(monkeypatch):
+    """
+    The universal model should still load if the cache directory can't be
+    created.
+    """
+    model = cobra.Model("universal")
+    monkeypatch.setenv("RECONSTRUCTOR_CACHE_DIR", "/proc/nonexistent/cache")
+    monkeypatch.setattr(resources, "_read_universal_sbml", lambda: model)
+    resources.get_universal_model.cache_clear()
+    try:
+        assert resources.get_universal_model() is model
+    finally:
+        resources.get_universal_model.cache_clear()
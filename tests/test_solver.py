@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+import cobra
+from cobra.util.solver import interface_to_str
+
+from reconstructor.errors import SolverTimeLimitError
+from reconstructor.solver import (
+    Watchdog,
+    configure_solver,
+    copy_solver_configuration,
+    match_solver,
+    solver_time_limit
+)
+
+
+def test_configure_solver(universal_model: cobra.Model):
+    """
+    Solver settings should be passed on to the solver configuration, and 'none'
+    should remove the time limit.
+    """
+    configure_solver(universal_model, time_limit=30)
+    assert universal_model.solver.configuration.timeout == 30
+
+    model = cobra.Model("model")
+    copy_solver_configuration(universal_model, model)
+    assert model.solver.configuration.timeout == 30
+
+    configure_solver(universal_model)
+    assert universal_model.solver.configuration.timeout is None
+
+
+def test_configure_solver_keeps_default():
+    """
+    Switching the solver of a model shouldn't change cobra's default solver,
+    but other models can be given the same solver.
+    """
+    default = cobra.Configuration().solver
+    universal = cobra.Model("universal")
+    configure_solver(universal, solver="glpk_exact", time_limit=30)
+    assert cobra.Configuration().solver is default
+
+    model = cobra.Model("model")
+    match_solver(universal, model)
+    assert interface_to_str(model.problem) == "glpk_exact"
+    assert model.solver.configuration.timeout == 30
+
+
+def test_watchdog():
+    """
+    The watchdog should stop work between steps once it takes longer than the
+    time limit, also outside of the main thread, and do nothing otherwise.
+    """
+    timer = Watchdog(0.2)
+    timer.check()
+    time.sleep(0.3)
+    with pytest.raises(SolverTimeLimitError):
+        timer.check()
+
+    with ThreadPoolExecutor(1) as executor:
+        timer = Watchdog(0.1)
+        time.sleep(0.2)
+        with pytest.raises(SolverTimeLimitError):
+            executor.submit(timer.check).result()
+
+    timer = Watchdog(None)
+    time.sleep(0.1)
+    timer.check()
+
+
+def test_watchdog_limits_solver():
+    """
+    While the watchdog limits a model's solver, each LP should only get the
+    time that is left, and no LP should start once the time is up.
+    """
+    model = cobra.Model("model")
+    a = cobra.Metabolite("A", compartment="c")
+    uptake = cobra.Reaction("EX_A", lower_bound=-10, upper_bound=1000)
+    uptake.add_metabolites({a: -1})
+    use = cobra.Reaction("use")
+    use.add_metabolites({a: -1})
+    model.add_reactions([uptake, use])
+    model.objective = "use"
+    model.solver.configuration.timeout = 30
+
+    timer = Watchdog(2.5)
+    with timer.limit_solver(model):
+        assert solver_time_limit(model) == 3
+        time.sleep(0.6)
+        assert model.slim_optimize() == 10
+        assert model.solver.configuration.timeout == 2
+        time.sleep(2)
+        with pytest.raises(SolverTimeLimitError):
+            model.slim_optimize()
+    assert model.solver.configuration.timeout == 30
+    assert solver_time_limit(model) == 30
+    assert model.slim_optimize() == 10
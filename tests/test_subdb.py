@@ -0,0 +1,15 @@
+import pytest
+
+from reconstructor import errors
+from reconstructor.subdb import parse_prefixes
+
+
+def test_parse_prefixes():
+    """
+    The same organisms should always give the same sub-database, however they
+    are written.
+    """
+    assert parse_prefixes("sen, eco,,eco") == ["eco", "sen"]
+    assert parse_prefixes(["sen", "eco"]) == parse_prefixes("eco,sen")
+    with pytest.raises(errors.ReconstructorError):
+        parse_prefixes(" , ")